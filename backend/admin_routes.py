@@ -0,0 +1,90 @@
+from fastapi import APIRouter, Depends, Query, Request
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from datetime import datetime
+from typing import Optional
+from pymongo import InsertOne, UpdateOne
+
+from models import Course, TeamContactMessage
+from auth import require_admin
+from cache import course_cache
+from ndjson import NDJSONImport, export_response
+from dependencies import get_db
+
+# Bulk import/export for operators, behind ADMIN_API_KEY
+router = APIRouter(prefix="/api/admin", tags=["admin"], dependencies=[Depends(require_admin)])
+
+# Export Courses
+@router.get("/courses/export")
+async def export_courses(
+    category: Optional[str] = Query(None),
+    instructor_team_id: Optional[str] = Query(None),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    query = {}
+    if category:
+        query["category"] = category
+    if instructor_team_id:
+        query["instructor_team_id"] = instructor_team_id
+    return export_response(db.courses, query, "courses")
+
+# Import Courses (rows with a known id update that course)
+@router.post("/courses/import")
+async def import_courses(request: Request, db: AsyncIOMotorDatabase = Depends(get_db)):
+    courses_collection = db.courses
+    bulk = NDJSONImport(Course)
+    
+    async def prepare(doc: dict) -> dict:
+        # Picked up by the search index refresh
+        doc["updated_at"] = datetime.utcnow()
+        return doc
+    
+    def upsert(doc: dict) -> UpdateOne:
+        # An existing course keeps the created_at it was stored with
+        created_at = doc.pop("created_at")
+        return UpdateOne(
+            {"id": doc["id"]},
+            {"$set": doc, "$setOnInsert": {"created_at": created_at}},
+            upsert=True
+        )
+    
+    async for batch in bulk.batches(request, prepare):
+        await bulk.write(courses_collection, [(line, upsert(doc)) for line, doc in batch])
+    
+    if bulk.inserted or bulk.updated:
+        await course_cache.clear()
+    
+    return bulk.report()
+
+# Export Materials (metadata only; payloads stay in the blob store)
+@router.get("/materials/export")
+async def export_materials(
+    team_id: Optional[str] = Query(None),
+    is_public: Optional[bool] = Query(None),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    query = {}
+    if team_id:
+        query["team_id"] = team_id
+    if is_public is not None:
+        query["is_public"] = is_public
+    return export_response(db.team_materials, query, "materials", projection={"file_data": 0})
+
+# Export Messages
+@router.get("/messages/export")
+async def export_messages(
+    to_team_id: Optional[str] = Query(None),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    query = {"to_team_id": to_team_id} if to_team_id else {}
+    return export_response(db.team_messages, query, "messages")
+
+# Import Messages
+@router.post("/messages/import")
+async def import_messages(request: Request, db: AsyncIOMotorDatabase = Depends(get_db)):
+    messages_collection = db.team_messages
+    bulk = NDJSONImport(TeamContactMessage)
+    
+    async for batch in bulk.batches(request):
+        await bulk.write(messages_collection, [(line, InsertOne(doc)) for line, doc in batch])
+    
+    return bulk.report()
@@ -1,21 +1,46 @@
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
+import asyncio
+import hashlib
+import hmac
+import time
+import uuid
 import jwt
 from passlib.context import CryptContext
-from fastapi import HTTPException, status, Depends
+from fastapi import HTTPException, status, Depends, Header
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import os
 
+from cache import get_invalidation_bus
+
 # JWT Configuration
 SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'your-super-secret-key-change-this-in-production')
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_HOURS = 24
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Verified tokens are cached until they expire, but re-checked against the
+# revocation list at least this often
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', '10000'))
+TOKEN_CACHE_RECHECK_SECONDS = float(os.environ.get('TOKEN_CACHE_RECHECK_SECONDS', '60'))
+
+# Password hashing. Hashes made with a different cost are upgraded on login.
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+# Password hashing pool. bcrypt releases the GIL, so threads are enough;
+# "process" isolates the CPU work from the event loop's process entirely.
+PASSWORD_HASH_EXECUTOR = os.environ.get('PASSWORD_HASH_EXECUTOR', 'thread')
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_QUEUE = int(os.environ.get('PASSWORD_HASH_MAX_QUEUE', '64'))
+
+# Key for the /api/admin endpoints, sent as X-Admin-Key; unset disables them
+ADMIN_API_KEY = os.environ.get('ADMIN_API_KEY')
 
 # JWT Bearer token
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash."""
@@ -25,6 +50,101 @@ def get_password_hash(password: str) -> str:
     """Hash a password."""
     return pwd_context.hash(password)
 
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify a password and return a new hash if the stored one is outdated."""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+class PasswordHashPool:
+    """Runs bcrypt off the event loop on a bounded executor.
+
+    At most `workers` hashes run at once; up to `max_queue` more wait their
+    turn and anything beyond that is rejected with 503 instead of piling up.
+    """
+
+    def __init__(self, workers: int, max_queue: int, kind: str = "thread"):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.kind = kind
+        self._executor: Optional[Executor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.queued = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+        self.run_seconds = 0.0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="password-hash"
+                )
+        return self._executor
+
+    async def run(self, fn, *args):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many authentication requests, try again shortly",
+                headers={"Retry-After": "1"}
+            )
+
+        enqueued_at = time.perf_counter()
+        self.queued += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+        started_at = time.perf_counter()
+        self.wait_seconds += started_at - enqueued_at
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self.run_seconds += time.perf_counter() - started_at
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queued": self.queued,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "wait_seconds_total": self.wait_seconds,
+            "run_seconds_total": self.run_seconds,
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+password_pool = PasswordHashPool(
+    PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_QUEUE, PASSWORD_HASH_EXECUTOR
+)
+
+async def hash_password_async(password: str) -> str:
+    """Hash a password on the password pool."""
+    return await password_pool.run(get_password_hash, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify a password on the password pool.
+
+    Returns (valid, new_hash); new_hash is set when the stored hash should be
+    replaced because the configured cost changed.
+    """
+    return await password_pool.run(verify_and_update_password, plain_password, hashed_password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create a JWT access token."""
     to_encode = data.copy()
@@ -33,7 +153,11 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     else:
         expire = datetime.utcnow() + timedelta(hours=ACCESS_TOKEN_EXPIRE_HOURS)
     
-    to_encode.update({"exp": expire})
+    to_encode.update({
+        "exp": expire,
+        "iat": int(time.time()),
+        "jti": uuid.uuid4().hex
+    })
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -47,27 +171,178 @@ def verify_token(token: str) -> dict:
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token has expired"
         )
-    except jwt.JWTError:
+    except jwt.InvalidTokenError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid token"
         )
 
+class TokenCache:
+    """Bounded map from token digest to verified claims.
+
+    Entries expire at the token's exp, or after TOKEN_CACHE_RECHECK_SECONDS
+    so revocations made by other workers are picked up. It subscribes to the
+    cache invalidation bus, so revocations in this process (or any process,
+    with a shared bus) drop matching entries immediately.
+    """
+
+    name = "tokens"
+
+    def __init__(self, maxsize: int, recheck_seconds: float):
+        self.maxsize = maxsize
+        self.recheck_seconds = recheck_seconds
+        self._entries: "OrderedDict[bytes, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.verifications = 0
+        self.verify_seconds = 0.0
+
+    @staticmethod
+    def _digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[dict]:
+        digest = self._digest(token)
+        entry = self._entries.get(digest)
+        if entry is not None:
+            if entry[0] > time.time():
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return entry[1]
+            del self._entries[digest]
+        self.misses += 1
+        return None
+
+    def put(self, token: str, claims: dict) -> None:
+        valid_until = min(claims["exp"], time.time() + self.recheck_seconds)
+        digest = self._digest(token)
+        self._entries[digest] = (valid_until, claims)
+        self._entries.move_to_end(digest)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def _drop(self, key) -> None:
+        """Invalidation bus hook. key is ("jti", jti), ("team", team_id) or None."""
+        if key is None:
+            self._entries.clear()
+            return
+        kind, value = key
+        field = "jti" if kind == "jti" else "team_id"
+        for digest in [d for d, (_, claims) in self._entries.items() if claims.get(field) == value]:
+            del self._entries[digest]
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "verifications": self.verifications,
+            "verify_seconds_total": self.verify_seconds,
+        }
+
+token_cache = TokenCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_RECHECK_SECONDS)
+get_invalidation_bus().subscribe(token_cache)
+
+class TokenRevocationList:
+    """Denylist of revoked tokens, stored in Mongo.
+
+    Entries either name a single token by jti (logout) or revoke every token
+    a team was issued before a point in time (password change). Both expire
+    with the longest-lived token they can affect. Checks only happen when a
+    token is not in the token cache.
+    """
+
+    def __init__(self):
+        self.collection = None
+
+    def bind(self, db) -> None:
+        self.collection = db.revoked_tokens
+
+    async def is_revoked(self, payload: dict) -> bool:
+        if self.collection is None:
+            return False
+        conditions = [{"team_id": payload["team_id"], "not_before": {"$gt": payload.get("iat", 0)}}]
+        if payload.get("jti"):
+            conditions.append({"jti": payload["jti"]})
+        return await self.collection.find_one({"$or": conditions}, {"_id": 1}) is not None
+
+    async def revoke_token(self, claims: dict) -> None:
+        """Revoke one token, e.g. on logout."""
+        if claims.get("jti"):
+            await self.collection.insert_one({
+                "jti": claims["jti"],
+                "team_id": claims["team_id"],
+                "expires_at": datetime.utcfromtimestamp(claims["exp"])
+            })
+            await get_invalidation_bus().publish(token_cache.name, ("jti", claims["jti"]))
+
+    async def revoke_team(self, team_id: str) -> None:
+        """Revoke every token issued to a team before now, e.g. on password change."""
+        await self.collection.insert_one({
+            "team_id": team_id,
+            "not_before": int(time.time()),
+            "expires_at": datetime.utcnow() + timedelta(hours=ACCESS_TOKEN_EXPIRE_HOURS)
+        })
+        await get_invalidation_bus().publish(token_cache.name, ("team", team_id))
+
+token_revocations = TokenRevocationList()
+
 async def get_current_team(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
-    """Get current authenticated team from JWT token."""
+    """Get current authenticated team from JWT token.
+
+    Returns the verified claims: team_id, team_name, jti, iat and exp.
+    team_name is as of token issue and may lag a rename.
+    """
     try:
-        payload = verify_token(credentials.credentials)
-        team_id = payload.get("team_id")
-        if team_id is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid token payload"
-            )
-        return {"team_id": team_id}
+        token = credentials.credentials
+        claims = token_cache.get(token)
+        if claims is None:
+            started = time.perf_counter()
+            payload = verify_token(token)
+            token_cache.verifications += 1
+            token_cache.verify_seconds += time.perf_counter() - started
+            team_id = payload.get("team_id")
+            if team_id is None:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Invalid token payload"
+                )
+            if await token_revocations.is_revoked(payload):
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Token has been revoked"
+                )
+            claims = {
+                "team_id": team_id,
+                "team_name": payload.get("team_name"),
+                "jti": payload.get("jti"),
+                "iat": payload.get("iat", 0),
+                "exp": payload["exp"]
+            }
+            token_cache.put(token, claims)
+        return dict(claims)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Authentication failed"
-        )
\ No newline at end of file
+        )
+
+async def get_optional_team(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)
+) -> Optional[dict]:
+    """Get the authenticated team if a bearer token was sent, otherwise None."""
+    if credentials is None:
+        return None
+    return await get_current_team(credentials)
+
+async def require_admin(x_admin_key: Optional[str] = Header(None)) -> None:
+    """Allow the request only with the configured admin key."""
+    if not ADMIN_API_KEY or not x_admin_key or not hmac.compare_digest(
+        x_admin_key.encode(), ADMIN_API_KEY.encode()
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin key required"
+        )
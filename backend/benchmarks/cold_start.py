@@ -0,0 +1,87 @@
+"""Cold start: how long a fresh worker takes until it serves its first request.
+
+Starts each run in a new Python process and measures importing server.py,
+each lifespan startup step (connect, pool warm-up, index build, background
+workers) and the first request after startup, then prints the medians.
+
+    cd backend && python -m benchmarks.cold_start --runs 5
+    cd backend && python -m benchmarks.cold_start --mongo mongodb://localhost:27017 --no-indexes
+
+--no-indexes starts workers the way a multi-worker deploy does, after
+`python -m indexes` has run once (BUILD_INDEXES=false).
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+async def child(args) -> dict:
+    from benchmarks.run import configure_environment
+    blob_dir = configure_environment(args)
+    if args.no_indexes:
+        os.environ["BUILD_INDEXES"] = "false"
+
+    import_started = time.perf_counter()
+    import server
+    import_seconds = time.perf_counter() - import_started
+
+    import httpx
+    app = server.app
+    lifespan_started = time.perf_counter()
+    async with app.router.lifespan_context(app):
+        startup = time.perf_counter() - lifespan_started
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            request_started = time.perf_counter()
+            response = await client.get("/api/courses?limit=20")
+            first_request = time.perf_counter() - request_started
+            response.raise_for_status()
+        steps = dict(server.startup_seconds)
+    if blob_dir is not None:
+        blob_dir.cleanup()
+    return {
+        "import": import_seconds,
+        "startup": startup,
+        **{f"startup.{step}": seconds for step, seconds in steps.items() if step != "total"},
+        "first_request": first_request,
+        "ready": import_seconds + startup,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mongo", default="mock", help='"mock" or a mongodb:// URL')
+    parser.add_argument("--db-name", default="frc_benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--no-indexes", action="store_true", help="start with BUILD_INDEXES=false")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(asyncio.run(child(args))))
+        return
+
+    command = [sys.executable, "-m", "benchmarks.cold_start", "--child",
+               "--mongo", args.mongo, "--db-name", args.db_name]
+    if args.no_indexes:
+        command.append("--no-indexes")
+    runs = []
+    for _ in range(args.runs):
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    results = {
+        "runs": args.runs,
+        "mongo": "mock" if args.mongo == "mock" else "mongod",
+        "build_indexes": not args.no_indexes,
+        "median_ms": {
+            key: round(statistics.median(run[key] for run in runs) * 1000, 1)
+            for key in runs[0]
+        },
+    }
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
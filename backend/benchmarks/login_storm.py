@@ -0,0 +1,77 @@
+"""Latency of unrelated requests while a burst of logins is being verified.
+
+Compares verifying bcrypt hashes inline on the event loop (the old
+behaviour) with the bounded password pool. A probe coroutine stands in for
+an unrelated request: it asks to be woken every few milliseconds and
+records how late it actually runs.
+
+    cd backend && python -m benchmarks.login_storm --logins 50
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import auth
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+async def probe(stop: asyncio.Event, interval: float, samples: list):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append((time.perf_counter() - started - interval) * 1000)
+
+async def storm(mode: str, logins: int, password: str, hashed: str, interval: float) -> dict:
+    samples = []
+    stop = asyncio.Event()
+    probe_task = asyncio.create_task(probe(stop, interval, samples))
+    await asyncio.sleep(interval * 5)
+
+    async def login():
+        if mode == "inline":
+            auth.verify_password(password, hashed)
+            await asyncio.sleep(0)
+        else:
+            await auth.verify_password_async(password, hashed)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await probe_task
+    return {
+        "mode": mode,
+        "logins": logins,
+        "logins_per_second": round(logins / elapsed, 1),
+        "probe_lag_ms": {
+            "p50": round(statistics.median(samples), 2),
+            "p99": round(percentile(samples, 99), 2),
+            "max": round(max(samples), 2),
+        },
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=50)
+    parser.add_argument("--interval-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    password = "correct horse battery staple"
+    hashed = auth.get_password_hash(password)
+    results = []
+    for mode in ("inline", "pool"):
+        results.append(await storm(mode, args.logins, password, hashed, args.interval_ms / 1000))
+    results.append({"pool": auth.password_pool.stats()})
+    print(json.dumps(results, indent=2))
+    auth.password_pool.shutdown()
+
+if __name__ == "__main__":
+    asyncio.run(main())
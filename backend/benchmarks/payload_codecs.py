@@ -0,0 +1,89 @@
+"""Storage saved and CPU spent by payload compression, per kind of material.
+
+Each payload is written through PayloadWriter into a local blob store and
+read back through open_payload, as uploads and downloads do. Reported per
+kind: the codec picked, the bytes stored against the raw size and against
+the old inline base64, and CPU milliseconds per raw MB to write and to read.
+
+    cd backend && python -m benchmarks.payload_codecs --size-mb 8
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.seed import _text
+from payload_codecs import PAYLOAD_ZSTD_LEVEL, PayloadWriter, open_payload, zstandard
+from serialization import dumps
+from storage import CHUNK_SIZE, LocalBlobStore
+
+def make_payloads(size: int, seed_value: int = 7) -> dict:
+    rng = random.Random(seed_value)
+    source = b"".join(path.read_bytes() for path in sorted(Path(__file__).parent.parent.glob("*.py")))
+    rows = [
+        {"id": i, "title": _text(rng, 4), "score": rng.random(), "tags": rng.sample(range(100), 5)}
+        for i in range(size // 60)
+    ]
+
+    return {
+        # (mime_type, payload); the code is this repo's, so at most its size
+        "code": ("text/x-python", source[:size]),
+        "document": ("text/plain", _text(rng, size // 6).encode()[:size]),
+        "json": ("application/json", dumps(rows)[:size]),
+        "binary": ("application/octet-stream", os.urandom(size)),
+        "image": ("image/png", os.urandom(size)),
+    }
+
+async def measure(blob_store: LocalBlobStore, mime_type: str, data: bytes) -> dict:
+    writer = PayloadWriter(blob_store.open_upload("payload", mime_type), mime_type)
+    cpu = time.process_time()
+    for offset in range(0, len(data), CHUNK_SIZE):
+        await writer.write(data[offset:offset + CHUNK_SIZE])
+    blob_id = await writer.close()
+    write_cpu = time.process_time() - cpu
+
+    cpu = time.process_time()
+    size = 0
+    async for chunk in open_payload(blob_store, blob_id, writer.codec):
+        size += len(chunk)
+    read_cpu = time.process_time() - cpu
+    assert size == len(data)
+
+    megabytes = len(data) / (1024 * 1024)
+    inline_size = len(base64.b64encode(data))
+    return {
+        "codec": writer.codec,
+        "raw_bytes": len(data),
+        "stored_bytes": writer.stored_size,
+        "saved_vs_raw_pct": round(100 * (1 - writer.stored_size / len(data)), 1),
+        "saved_vs_inline_pct": round(100 * (1 - writer.stored_size / inline_size), 1),
+        "write_cpu_ms_per_mb": round(write_cpu * 1000 / megabytes, 2),
+        "read_cpu_ms_per_mb": round(read_cpu * 1000 / megabytes, 2),
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=float, default=4)
+    args = parser.parse_args()
+
+    payloads = make_payloads(int(args.size_mb * 1024 * 1024))
+    results = {"zstandard": zstandard is not None, "level": PAYLOAD_ZSTD_LEVEL, "kinds": {}}
+    raw_total = stored_total = 0
+    with tempfile.TemporaryDirectory(prefix="frc-payloads-") as root:
+        blob_store = LocalBlobStore(root)
+        for kind, (mime_type, data) in payloads.items():
+            result = await measure(blob_store, mime_type, data)
+            results["kinds"][kind] = result
+            raw_total += result["raw_bytes"]
+            stored_total += result["stored_bytes"]
+    results["saved_bytes"] = raw_total - stored_total
+    results["saved_pct"] = round(100 * (1 - stored_total / raw_total), 1)
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,305 @@
+"""Endpoint benchmark: seeds a data set, then measures each endpoint.
+
+Drives the app in-process over ASGI, or through a real uvicorn server, and
+uses either mongomock-motor or a real mongod. For every endpoint it reports
+throughput, p50/p95/p99 latency, response size and Mongo commands per
+request (read from the Server-Timing header), and can compare the run with
+a stored baseline so CI fails on regressions.
+
+    cd backend && python -m benchmarks.run --output bench.json
+    cd backend && python -m benchmarks.run --mongo mongodb://localhost:27017 \\
+        --transport uvicorn --baseline bench.json
+
+Needs httpx, plus mongomock-motor for --mongo mock. A real mongod gets a
+dedicated database (--db-name) which is dropped and re-seeded on every run.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import random
+import re
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import httpx
+
+from benchmarks.login_storm import percentile
+
+SERVER_TIMING_COMMANDS = re.compile(r'desc="(\d+) commands')
+
+# (name, method, path builder, needs auth). Path builders get the seeded ids.
+ENDPOINTS = [
+    ("courses_list", "GET", lambda ids, rng: "/api/courses?limit=50", False),
+    ("courses_by_category", "GET", lambda ids, rng: "/api/courses?category=Kodlama&limit=50", False),
+    ("course_detail", "GET", lambda ids, rng: f"/api/courses/{rng.choice(ids['course_ids'])}", False),
+    ("public_materials", "GET", lambda ids, rng: "/api/materials/public?limit=50", False),
+    ("team_public_profile", "GET", lambda ids, rng: f"/api/teams/{rng.choice(ids['team_ids'])}/public", False),
+    ("team_profile", "GET", lambda ids, rng: "/api/teams/profile", True),
+    ("team_materials", "GET", lambda ids, rng: "/api/teams/materials?limit=50", True),
+    ("team_messages", "GET", lambda ids, rng: "/api/teams/messages?limit=50", True),
+    ("message_counts", "GET", lambda ids, rng: "/api/teams/messages/counts", True),
+    ("search", "GET", lambda ids, rng: "/api/search?q=otonom+robot&prefix=false", False),
+    ("search_typeahead", "GET", lambda ids, rng: f"/api/search?q={rng.choice(['se', 'sen', 'pnö', 'kont'])}", False),
+    ("material_download", "GET",
+     lambda ids, rng: f"/api/teams/materials/{rng.choice(ids['material_ids'])}/download", False),
+]
+
+# Every login is a full bcrypt verification, so it gets fewer requests
+LOGIN_REQUESTS = 20
+
+def configure_environment(args) -> Optional[tempfile.TemporaryDirectory]:
+    """Set up env and the Mongo client before server.py is imported."""
+    os.environ["DB_NAME"] = args.db_name
+    # Every request comes from one client and logs in as one team; the
+    # limits would turn most of the login measurement into 429s
+    os.environ["RATE_LIMIT_ENABLED"] = "false"
+    blob_dir = None
+    if args.mongo == "mock":
+        from mongomock_motor import AsyncMongoMockClient
+        import motor.motor_asyncio
+        motor.motor_asyncio.AsyncIOMotorClient = lambda *a, **kw: AsyncMongoMockClient()
+        _count_mock_commands()
+        os.environ["MONGO_URL"] = "mongodb://mock"
+        # GridFS needs a real server
+        os.environ["BLOB_STORE"] = "local"
+    else:
+        os.environ["MONGO_URL"] = args.mongo
+    if os.environ.get("BLOB_STORE") == "local":
+        blob_dir = tempfile.TemporaryDirectory(prefix="frc-bench-blobs-")
+        os.environ["BLOB_STORE_PATH"] = blob_dir.name
+    return blob_dir
+
+def _count_mock_commands() -> None:
+    """mongomock sends no command events, so count collection calls instead."""
+    import mongomock.collection
+    from metrics import current_request
+
+    def counted(method):
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                stats = current_request.get()
+                if stats is not None:
+                    stats.add_command(time.perf_counter() - started, 0)
+        return wrapper
+
+    for name in (
+        "find", "find_one", "insert_one", "insert_many", "update_one", "update_many",
+        "replace_one", "delete_one", "delete_many", "find_one_and_update",
+        "find_one_and_delete", "find_one_and_replace", "aggregate", "count_documents",
+        "bulk_write", "distinct",
+    ):
+        setattr(mongomock.collection.Collection, name, counted(getattr(mongomock.collection.Collection, name)))
+
+@contextlib.asynccontextmanager
+async def open_client(app, transport: str):
+    """An httpx client talking to the app, with startup/shutdown run."""
+    if transport == "asgi":
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=app), base_url="http://bench"
+            ) as client:
+                yield client
+        return
+
+    import uvicorn
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning"))
+    serve_task = asyncio.create_task(server.serve())
+    while not server.started:
+        if serve_task.done():
+            serve_task.result()
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}") as client:
+            yield client
+    finally:
+        server.should_exit = True
+        await serve_task
+
+async def measure(
+    client: httpx.AsyncClient,
+    method: str,
+    path_for: Callable[[], str],
+    requests: int,
+    concurrency: int,
+    headers: Dict[str, str],
+    json_body: Optional[dict] = None
+) -> dict:
+    latencies: List[float] = []
+    commands: List[int] = []
+    sizes: List[int] = []
+    errors = 0
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            response = await client.request(method, path_for(), headers=headers, json=json_body)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 400:
+                errors += 1
+            sizes.append(len(response.content))
+            match = SERVER_TIMING_COMMANDS.search(response.headers.get("server-timing", ""))
+            if match:
+                commands.append(int(match.group(1)))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, requests)))))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": round(requests / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "mean_response_bytes": round(sum(sizes) / len(sizes)) if sizes else 0,
+        "mongo_commands_per_request": round(sum(commands) / len(commands), 2) if commands else None,
+    }
+
+async def run(args) -> dict:
+    import server
+    from benchmarks.seed import BENCH_PASSWORD, seed
+    from search import catalog_search
+
+    rng = random.Random(args.seed)
+    results = {}
+    state = server.app.state
+    async with open_client(server.app, args.transport) as client:
+        await state.client.drop_database(args.db_name)
+        seed_started = time.perf_counter()
+        ids = await seed(
+            state.db, state.blob_store,
+            teams=args.teams, courses=args.courses, materials=args.materials,
+            messages=args.messages, logo_kb=args.logo_kb, file_kb=args.file_kb,
+            seed_value=args.seed
+        )
+        seed_seconds = time.perf_counter() - seed_started
+        # The startup build ran against the empty database
+        await catalog_search.rebuild()
+
+        # The first team receives the most messages, so it is the busiest inbox
+        login = {"email": ids["team_emails"][0], "password": BENCH_PASSWORD}
+        token_response = await client.post("/api/teams/login", json=login)
+        token_response.raise_for_status()
+        token = token_response.json()["access_token"]
+
+        base_headers = {"Accept-Encoding": "gzip, br"}
+        auth_headers = {**base_headers, "Authorization": f"Bearer {token}"}
+        for name, method, path_builder, needs_auth in ENDPOINTS:
+            if args.only and name not in args.only:
+                continue
+            headers = auth_headers if needs_auth else base_headers
+            path_for = lambda path_builder=path_builder: path_builder(ids, rng)
+            await measure(client, method, path_for, args.warmup, 1, headers)
+            results[name] = await measure(client, method, path_for, args.requests, args.concurrency, headers)
+            print(f"{name:22} {results[name]['throughput_rps']:>9} req/s  "
+                  f"p50 {results[name]['p50_ms']:>8} ms  p95 {results[name]['p95_ms']:>8} ms  "
+                  f"db {results[name]['mongo_commands_per_request']}", file=sys.stderr)
+
+        if not args.only or "login" in args.only:
+            results["login"] = await measure(
+                client, "POST", lambda: "/api/teams/login", min(args.requests, LOGIN_REQUESTS),
+                args.concurrency, base_headers, json_body=login
+            )
+
+        await state.client.drop_database(args.db_name)
+
+    return {
+        "meta": {
+            "created_at": datetime.utcnow().isoformat() + "Z",
+            "python": platform.python_version(),
+            "mongo": "mock" if args.mongo == "mock" else "mongod",
+            "transport": args.transport,
+            "blob_store": os.environ.get("BLOB_STORE", "gridfs"),
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "dataset": {
+                "teams": args.teams, "courses": args.courses, "materials": args.materials,
+                "messages": args.messages, "logo_kb": args.logo_kb, "file_kb": args.file_kb,
+            },
+            "seed_seconds": round(seed_seconds, 2),
+        },
+        "endpoints": results,
+    }
+
+def compare(results: dict, baseline: dict, max_regression: float) -> List[str]:
+    """Regressions of this run against a baseline produced with the same options."""
+    regressions = []
+    for name, current in results["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(name)
+        if previous is None:
+            continue
+        if current["errors"] > previous["errors"]:
+            regressions.append(f"{name}: errors {previous['errors']} -> {current['errors']}")
+        if current["p95_ms"] > previous["p95_ms"] * (1 + max_regression):
+            regressions.append(f"{name}: p95 {previous['p95_ms']} ms -> {current['p95_ms']} ms")
+        if current["throughput_rps"] < previous["throughput_rps"] * (1 - max_regression):
+            regressions.append(
+                f"{name}: throughput {previous['throughput_rps']} -> {current['throughput_rps']} req/s"
+            )
+        # Query counts are deterministic, so any increase is a regression
+        before = previous.get("mongo_commands_per_request")
+        after = current.get("mongo_commands_per_request")
+        if before is not None and after is not None and after > before + 0.5:
+            regressions.append(f"{name}: mongo commands per request {before} -> {after}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mongo", default="mock", help='"mock" or a mongodb:// URL')
+    parser.add_argument("--db-name", default="frc_benchmark", help="dropped and re-seeded on every run")
+    parser.add_argument("--transport", choices=["asgi", "uvicorn"], default="asgi")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--teams", type=int, default=50)
+    parser.add_argument("--courses", type=int, default=500)
+    parser.add_argument("--materials", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--logo-kb", type=int, default=64)
+    parser.add_argument("--file-kb", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--only", nargs="*", help="endpoint names to run")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="results JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.25,
+                        help="allowed relative p95/throughput regression")
+    args = parser.parse_args()
+
+    blob_dir = configure_environment(args)
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        if blob_dir is not None:
+            blob_dir.cleanup()
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
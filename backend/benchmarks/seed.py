@@ -0,0 +1,146 @@
+"""Synthetic data for benchmarks: teams, courses, materials and messages.
+
+Sizes follow what production looks like: teams carry base64 logos in
+logo_url, materials have real payloads in the blob store, and messages
+are spread unevenly across teams.
+"""
+import base64
+import os
+import random
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from auth import get_password_hash
+from models import (
+    Course, MaterialType, TeamContactMessage, TeamMaterial, TeamProfile
+)
+from storage import BlobStore
+
+BENCH_PASSWORD = "benchmark-password"
+
+CATEGORIES = ["FRC Temelleri", "Kodlama", "Elektronik", "Mekanik", "Strateji"]
+LEVELS = ["Başlangıç", "Orta", "İleri"]
+TAGS = ["cad", "java", "python", "pnömatik", "sensör", "otonom", "kural", "sürüş"]
+MIME_TYPES = {
+    MaterialType.DOCUMENT: "application/pdf",
+    MaterialType.VIDEO: "video/mp4",
+    MaterialType.IMAGE: "image/png",
+    MaterialType.PRESENTATION: "application/vnd.ms-powerpoint",
+    MaterialType.CODE: "text/x-java",
+    MaterialType.OTHER: "application/octet-stream",
+}
+WORDS = (
+    "robot takım sezon otonom kod sensör motor şasi sürüş strateji yarışma "
+    "mentor öğrenci atölye tasarım elektronik pnömatik kontrol görüntü işleme"
+).split()
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+def _payload(rng: random.Random, size: int, compressible: bool) -> bytes:
+    if compressible:
+        return (_text(rng, size // 6 + 1) + "\n").encode()[:size]
+    return os.urandom(size)
+
+async def seed(
+    db: AsyncIOMotorDatabase,
+    blob_store: BlobStore,
+    teams: int = 50,
+    courses: int = 500,
+    materials: int = 1000,
+    messages: int = 2000,
+    logo_kb: int = 64,
+    file_kb: int = 256,
+    public_ratio: float = 0.6,
+    seed_value: int = 7
+) -> Dict[str, List[str]]:
+    """Insert a data set and return the ids the benchmark needs."""
+    rng = random.Random(seed_value)
+    now = datetime.utcnow()
+    password_hash = get_password_hash(BENCH_PASSWORD)
+
+    team_docs = []
+    for i in range(teams):
+        profile = TeamProfile(
+            team_name=f"Bench Team {i}",
+            team_number=str(7000 + i),
+            contact_email=f"team{i}@bench.example.com",
+            description=_text(rng, 40)[:500],
+            logo_url="data:image/png;base64," + base64.b64encode(os.urandom(logo_kb * 1024)).decode(),
+            location="İstanbul",
+            founded_year=2010 + i % 14,
+            created_at=now - timedelta(days=rng.randint(0, 900)),
+        )
+        team_doc = profile.dict()
+        team_doc["password_hash"] = password_hash
+        team_docs.append(team_doc)
+    if team_docs:
+        await db.teams.insert_many(team_docs)
+    team_ids = [doc["id"] for doc in team_docs]
+
+    course_docs = [
+        Course(
+            title=_text(rng, 4)[:200],
+            description=_text(rng, 60)[:2000],
+            category=rng.choice(CATEGORIES),
+            duration=f"{rng.randint(1, 8)} saat",
+            level=rng.choice(LEVELS),
+            image_url=f"https://images.example.com/{i}.jpg",
+            instructor_team_id=rng.choice(team_ids) if team_ids else None,
+            content=_text(rng, 200),
+            created_at=now - timedelta(minutes=rng.randint(0, 500_000)),
+        ).dict()
+        for i in range(courses)
+    ]
+    if course_docs:
+        await db.courses.insert_many(course_docs)
+
+    material_docs = []
+    for i in range(materials):
+        material_type = rng.choice(list(MaterialType))
+        compressible = material_type in (MaterialType.CODE, MaterialType.DOCUMENT)
+        data = _payload(rng, rng.randint(file_kb * 512, file_kb * 1536), compressible)
+        file_name = f"material-{i}.bin"
+        blob_id = await blob_store.put(data, file_name, MIME_TYPES[material_type])
+        material_docs.append(TeamMaterial(
+            team_id=rng.choice(team_ids),
+            title=_text(rng, 5)[:200],
+            description=_text(rng, 30)[:1000],
+            material_type=material_type,
+            blob_id=blob_id,
+            file_name=file_name,
+            file_size=len(data),
+            mime_type=MIME_TYPES[material_type],
+            is_public=rng.random() < public_ratio,
+            tags=rng.sample(TAGS, rng.randint(0, 3)),
+            created_at=now - timedelta(minutes=rng.randint(0, 500_000)),
+        ).dict())
+    if material_docs:
+        await db.team_materials.insert_many(material_docs)
+
+    # A few teams get most of the messages, like in production
+    weights = [1 / (rank + 1) for rank in range(len(team_ids))]
+    message_docs = [
+        TeamContactMessage(
+            from_name=_text(rng, 2)[:100],
+            from_email=f"visitor{i}@example.com",
+            to_team_id=rng.choices(team_ids, weights)[0],
+            subject=_text(rng, 5)[:200],
+            message=_text(rng, 50)[:2000],
+            course_id=rng.choice(course_docs)["id"] if course_docs and rng.random() < 0.3 else None,
+            is_read=rng.random() < 0.5,
+            created_at=now - timedelta(minutes=rng.randint(0, 500_000)),
+        ).dict()
+        for i in range(messages)
+    ]
+    if message_docs:
+        await db.team_messages.insert_many(message_docs)
+
+    return {
+        "team_ids": team_ids,
+        "course_ids": [doc["id"] for doc in course_docs],
+        "material_ids": [doc["id"] for doc in material_docs if doc["is_public"]],
+        "team_emails": [doc["contact_email"] for doc in team_docs],
+    }
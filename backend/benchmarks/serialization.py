@@ -0,0 +1,144 @@
+"""Serialization cost of the /api/courses and /api/teams/materials bodies.
+
+Times only the CPU work after the Mongo query, on synthetic documents, for
+the old and the current path:
+
+- courses: Course(**doc).dict() per row and per embedded instructor team,
+  then jsonable_encoder and json.dumps, against trusted_dump and orjson.
+- materials: TeamMaterial(**doc) per row, then FastAPI's response_model
+  handling (serialize_response) and JSONResponse, against trusted_response.
+
+    cd backend && python -m benchmarks.serialization --rows 1000
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from benchmarks.seed import CATEGORIES, LEVELS, MIME_TYPES, TAGS, _text
+from models import Course, MaterialType, TeamMaterial, TeamProfile
+from serialization import dumps, orjson, trusted_dump, trusted_dump_many
+
+def make_docs(rows: int, seed_value: int = 7):
+    rng = random.Random(seed_value)
+    now = datetime.utcnow()
+    teams = [
+        TeamProfile(
+            team_name=f"Bench Team {i}",
+            team_number=str(7000 + i),
+            contact_email=f"team{i}@bench.example.com",
+            description=_text(rng, 40)[:500],
+            location="İstanbul",
+            founded_year=2010 + i % 14,
+        ).dict()
+        for i in range(50)
+    ]
+    courses = [
+        Course(
+            title=_text(rng, 4)[:200],
+            description=_text(rng, 60)[:2000],
+            category=rng.choice(CATEGORIES),
+            duration=f"{rng.randint(1, 8)} saat",
+            level=rng.choice(LEVELS),
+            image_url=f"https://images.example.com/{i}.jpg",
+            instructor_team_id=rng.choice(teams)["id"],
+            content=_text(rng, 200),
+            created_at=now - timedelta(minutes=rng.randint(0, 500_000)),
+        ).dict()
+        for i in range(rows)
+    ]
+    materials = []
+    for i in range(rows):
+        material_type = rng.choice(list(MaterialType))
+        doc = TeamMaterial(
+            team_id=teams[0]["id"],
+            title=_text(rng, 5)[:200],
+            description=_text(rng, 30)[:1000],
+            material_type=material_type,
+            blob_id=f"blob-{i}",
+            file_name=f"material-{i}.bin",
+            file_size=rng.randint(1000, 10_000_000),
+            mime_type=MIME_TYPES[material_type],
+            tags=rng.sample(TAGS, rng.randint(0, 3)),
+            created_at=now - timedelta(minutes=rng.randint(0, 500_000)),
+        ).dict()
+        # As stored: the enum is a plain string and file_data is projected out
+        doc["material_type"] = material_type.value
+        del doc["file_data"]
+        materials.append(doc)
+    return {team["id"]: team for team in teams}, courses, materials
+
+def courses_before(teams: dict, courses: List[dict]) -> bytes:
+    rows = [Course(**course).dict() for course in courses]
+    rows = [
+        {**row, "instructor_team": TeamProfile(**teams[row["instructor_team_id"]]).dict()}
+        for row in rows
+    ]
+    return JSONResponse(jsonable_encoder(rows)).body
+
+def courses_after(teams: dict, courses: List[dict]) -> bytes:
+    rows = trusted_dump_many(Course, courses)
+    rows = [
+        {**row, "instructor_team": trusted_dump(TeamProfile, teams[row["instructor_team_id"]])}
+        for row in rows
+    ]
+    return dumps(rows)
+
+materials_field = create_response_field(name="materials", type_=List[TeamMaterial], mode="serialization")
+
+async def materials_before(materials: List[dict]) -> bytes:
+    content = await serialize_response(
+        field=materials_field, response_content=[TeamMaterial(**material) for material in materials]
+    )
+    return JSONResponse(content).body
+
+async def materials_after(materials: List[dict]) -> bytes:
+    return dumps(trusted_dump_many(TeamMaterial, materials))
+
+async def timed(fn, repeat: int) -> dict:
+    samples = []
+    body = b""
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = fn()
+        if asyncio.iscoroutine(body):
+            body = await body
+        samples.append((time.perf_counter() - started) * 1000)
+    return {"median_ms": round(statistics.median(samples), 2), "bytes": len(body), "body": body}
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    teams, courses, materials = make_docs(args.rows)
+    cases = {
+        "courses": (lambda: courses_before(teams, courses), lambda: courses_after(teams, courses)),
+        "team_materials": (lambda: materials_before(materials), lambda: materials_after(materials)),
+    }
+    results = {"rows": args.rows, "orjson": orjson is not None}
+    for name, (before_fn, after_fn) in cases.items():
+        before = await timed(before_fn, args.repeat)
+        after = await timed(after_fn, args.repeat)
+        results[name] = {
+            "before_ms": before["median_ms"],
+            "after_ms": after["median_ms"],
+            "speedup": round(before["median_ms"] / after["median_ms"], 1),
+            "bytes": after["bytes"],
+            # Same JSON, not just the same size
+            "same_body": json.loads(before["body"]) == json.loads(after["body"]),
+        }
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,169 @@
+import hashlib
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from jobs import job_queue
+from payload_codecs import choose_codec, encode
+from storage import BlobNotFound, BlobStore
+
+# Released entries left behind when a process died mid-release are removed
+# after this long
+BLOB_REFS_GRACE_SECONDS = int(os.environ.get("BLOB_REFS_GRACE_SECONDS", "3600"))
+
+class BlobRefConflict(Exception):
+    """The entry for some content kept changing while a reference was taken."""
+
+class BlobRefs:
+    """Reference counts for content-addressed material payloads.
+
+    `blob_refs` maps the SHA-256 of a payload to the one blob holding it and
+    the number of materials using it. Uploads of content that is already
+    stored take a reference and drop their own copy; deleting a material
+    releases its reference and the blob goes with the last one. Blobs
+    stored before deduplication have no entry and are deleted directly.
+    Each entry also records the codec its blob is stored with.
+    """
+
+    def __init__(self):
+        self.collection = None
+        self.blob_store: Optional[BlobStore] = None
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.released = 0
+
+    def bind(self, db: AsyncIOMotorDatabase, blob_store: BlobStore) -> None:
+        self.collection = db.blob_refs
+        self.blob_store = blob_store
+
+    async def add_reference(self, digest: str) -> Optional[dict]:
+        """Take a reference to stored content. Returns the ref, or None if unknown."""
+        ref = await self.collection.find_one_and_update(
+            {"_id": digest, "refcount": {"$gt": 0}},
+            {"$inc": {"refcount": 1}, "$set": {"updated_at": datetime.utcnow()}},
+            return_document=ReturnDocument.AFTER
+        )
+        if ref is not None:
+            self.hits += 1
+            self.bytes_saved += ref.get("size", 0)
+        return ref
+
+    async def acquire(
+        self,
+        digest: str,
+        blob_id: str,
+        size: int,
+        content_type: Optional[str],
+        codec: Optional[str] = None
+    ) -> dict:
+        """Count a reference to content just written as `blob_id`.
+
+        Returns the ref to use. When the content was already stored that
+        points at the existing blob (and its codec), and the new copy is
+        deleted. Raises BlobRefConflict, after deleting the new copy, if the
+        entry keeps changing under us.
+        """
+        for _ in range(5):
+            ref = await self.add_reference(digest)
+            if ref is not None:
+                if ref["blob_id"] != blob_id:
+                    await self._delete_blob(blob_id)
+                return ref
+
+            now = datetime.utcnow()
+            doc = {
+                "_id": digest, "blob_id": blob_id, "size": size, "content_type": content_type,
+                "codec": codec, "refcount": 1, "created_at": now, "updated_at": now
+            }
+            try:
+                await self.collection.insert_one(doc)
+                self.misses += 1
+                return doc
+            except DuplicateKeyError:
+                # Either a concurrent upload of the same content won, or the
+                # last reference was just released and its entry is about
+                # to be removed. Take the entry over in the second case.
+                result = await self.collection.replace_one({"_id": digest, "refcount": {"$lte": 0}}, doc)
+                if result.modified_count:
+                    self.misses += 1
+                    return doc
+        await self._delete_blob(blob_id)
+        raise BlobRefConflict(f"Could not reference content {digest}")
+
+    async def store(
+        self,
+        data: bytes,
+        filename: str,
+        content_type: Optional[str] = None
+    ) -> dict:
+        """Store a complete payload unless identical content already exists,
+        compressed when choose_codec says so.
+
+        Returns the ref; its _id is the SHA-256 hex digest of the raw bytes.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        ref = await self.add_reference(digest)
+        if ref is not None:
+            return ref
+        codec = choose_codec(content_type, data)
+        blob_id = await self.blob_store.put(await encode(data, codec), filename, content_type)
+        return await self.acquire(digest, blob_id, len(data), content_type, codec)
+
+    async def release(self, digest: Optional[str], blob_id: str) -> None:
+        """Drop a material's reference, deleting the blob with the last one."""
+        ref = None
+        if digest:
+            ref = await self.collection.find_one_and_update(
+                {"_id": digest, "blob_id": blob_id, "refcount": {"$gt": 0}},
+                {"$inc": {"refcount": -1}, "$set": {"updated_at": datetime.utcnow()}},
+                return_document=ReturnDocument.AFTER
+            )
+        if ref is None:
+            # Stored before deduplication, so nobody else uses it
+            await self._delete_blob(blob_id)
+            return
+
+        if ref["refcount"] <= 0:
+            result = await self.collection.delete_one({"_id": digest, "refcount": {"$lte": 0}})
+            if result.deleted_count:
+                await self._delete_blob(blob_id)
+                self.released += 1
+            else:
+                # A new upload took the entry over; keep the blob unless it
+                # replaced it with its own
+                current = await self.collection.find_one({"_id": digest}, {"blob_id": 1})
+                if current is None or current["blob_id"] != blob_id:
+                    await self._delete_blob(blob_id)
+
+    async def cleanup(self, payload: dict) -> None:
+        """Job handler: delete blobs whose last reference is gone but whose
+        entry survived, e.g. because the process stopped mid-release."""
+        cutoff = datetime.utcnow() - timedelta(seconds=BLOB_REFS_GRACE_SECONDS)
+        query = {"refcount": {"$lte": 0}, "updated_at": {"$lt": cutoff}}
+        async for ref in self.collection.find(query, {"blob_id": 1}):
+            result = await self.collection.delete_one({"_id": ref["_id"], **query})
+            if result.deleted_count:
+                await self._delete_blob(ref["blob_id"])
+                self.released += 1
+
+    async def _delete_blob(self, blob_id: str) -> None:
+        try:
+            await self.blob_store.delete(blob_id)
+        except BlobNotFound:
+            pass
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "bytes_saved_total": self.bytes_saved,
+            "released": self.released,
+        }
+
+blob_refs = BlobRefs()
+job_queue.register("blob_refs_cleanup", blob_refs.cleanup, every_seconds=BLOB_REFS_GRACE_SECONDS)
@@ -0,0 +1,146 @@
+import asyncio
+import base64
+import os
+import zipfile
+from datetime import datetime
+from typing import AsyncIterator, List, Set
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+
+from metrics import Counter, registry
+from payload_codecs import is_compressed_type, open_payload
+from storage import BlobNotFound, BlobStore, CHUNK_SIZE
+
+# Requests matching more materials, or more bytes, than this are refused
+BUNDLE_MAX_FILES = int(os.environ.get("BUNDLE_MAX_FILES", "500"))
+BUNDLE_MAX_BYTES = int(os.environ.get("BUNDLE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+
+bundle_entries = registry.register(Counter(
+    "material_bundle_entries_total", "Files written to material ZIP bundles by method", ["method"]
+))
+
+def compression_for(mime_type: str) -> int:
+    # Formats that are compressed already go into the archive as they are;
+    # deflating them costs CPU and saves next to nothing
+    if is_compressed_type(mime_type):
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+class _Sink:
+    """Write target for ZipFile that only collects output until it is taken.
+
+    It cannot seek, so ZipFile follows each entry with a data descriptor
+    instead of going back to patch sizes and CRC into its header.
+    """
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def _entry_name(file_name: str, used: Set[str]) -> str:
+    # No directories from user input, and no two entries with one name
+    name = (file_name or "").replace("\\", "/").rsplit("/", 1)[-1].strip() or "file"
+    stem, extension = os.path.splitext(name)
+    candidate, number = name, 1
+    while candidate.lower() in used:
+        number += 1
+        candidate = f"{stem} ({number}){extension}"
+    used.add(candidate.lower())
+    return candidate
+
+def _entry_info(material: dict, used: Set[str]) -> zipfile.ZipInfo:
+    modified = material.get("updated_at") or material.get("created_at") or datetime.utcnow()
+    # ZIP timestamps start in 1980
+    date_time = max(modified.timetuple()[:6], (1980, 1, 1, 0, 0, 0))
+    info = zipfile.ZipInfo(_entry_name(material.get("file_name"), used), date_time)
+    info.compress_type = compression_for(material.get("mime_type"))
+    # Lets ZipFile pick ZIP64 headers up front for very large entries
+    info.file_size = material.get("file_size") or 0
+    info.external_attr = 0o644 << 16
+    return info
+
+async def _material_chunks(
+    material: dict,
+    collection: AsyncIOMotorCollection,
+    blob_store: BlobStore
+) -> AsyncIterator[bytes]:
+    if material.get("blob_id"):
+        async for chunk in open_payload(blob_store, material["blob_id"], material.get("codec")):
+            yield chunk
+        return
+
+    # Legacy documents still carry the payload inline; load one at a time
+    doc = await collection.find_one({"id": material["id"]}, {"_id": 0, "file_data": 1})
+    if doc is None:
+        raise BlobNotFound(material["id"])
+    data = base64.b64decode(doc.get("file_data") or "")
+    for offset in range(0, len(data), CHUNK_SIZE):
+        yield data[offset:offset + CHUNK_SIZE]
+
+async def stream_bundle(
+    materials: List[dict],
+    collection: AsyncIOMotorCollection,
+    blob_store: BlobStore
+) -> AsyncIterator[bytes]:
+    """Write the materials' files into a ZIP archive as it is sent.
+
+    Files are read chunk by chunk and each chunk's output is passed on
+    before the next is read, so memory stays at about one chunk however
+    large the bundle is. Deflate runs in a worker thread. Files that
+    disappeared since the materials were listed are named in MISSING.txt.
+    """
+    sink = _Sink()
+    archive = zipfile.ZipFile(sink, "w", allowZip64=True)
+    used: Set[str] = set()
+    missing: List[str] = []
+    for material in materials:
+        chunks = _material_chunks(material, collection, blob_store)
+        try:
+            try:
+                chunk = await chunks.__anext__()
+            except StopAsyncIteration:
+                chunk = b""
+            except BlobNotFound:
+                missing.append(material.get("file_name") or material["id"])
+                continue
+
+            info = _entry_info(material, used)
+            deflate = info.compress_type == zipfile.ZIP_DEFLATED
+            with archive.open(info, "w") as entry:
+                while True:
+                    if deflate:
+                        await asyncio.to_thread(entry.write, chunk)
+                    else:
+                        entry.write(chunk)
+                    data = sink.take()
+                    if data:
+                        yield data
+                    try:
+                        chunk = await chunks.__anext__()
+                    except StopAsyncIteration:
+                        break
+            bundle_entries.inc("deflated" if deflate else "stored")
+            # The rest of the compressed data and the data descriptor
+            yield sink.take()
+        finally:
+            await chunks.aclose()
+
+    if missing:
+        archive.writestr(
+            _entry_info({"file_name": "MISSING.txt", "mime_type": "text/plain"}, used),
+            "These files could not be read and are not in the archive:\n"
+            + "".join(f"{name}\n" for name in missing)
+        )
+    archive.close()
+    yield sink.take()
@@ -0,0 +1,156 @@
+import asyncio
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+DEFAULT_TTL = float(os.environ.get("CACHE_TTL_SECONDS", "30"))
+DEFAULT_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", "512"))
+
+class InvalidationBus(ABC):
+    """Delivers cache invalidations to every cache with the same name.
+
+    The default LocalInvalidationBus only reaches caches in this process. A
+    shared implementation (Redis pub/sub, a capped Mongo collection, ...)
+    can be swapped in with set_invalidation_bus so several workers drop
+    stale entries together.
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[str, List["AsyncTTLCache"]] = {}
+
+    def subscribe(self, cache: "AsyncTTLCache") -> None:
+        self._subscribers.setdefault(cache.name, []).append(cache)
+
+    def deliver(self, cache_name: str, key: Optional[Hashable]) -> None:
+        """Apply an invalidation to the local caches. Shared buses call this
+        for messages received from other processes."""
+        for cache in self._subscribers.get(cache_name, []):
+            cache._drop(key)
+
+    @abstractmethod
+    async def publish(self, cache_name: str, key: Optional[Hashable]) -> None:
+        """Invalidate `key` (or everything when key is None) everywhere."""
+        raise NotImplementedError
+
+class LocalInvalidationBus(InvalidationBus):
+    async def publish(self, cache_name, key):
+        self.deliver(cache_name, key)
+
+_bus: InvalidationBus = LocalInvalidationBus()
+
+def get_invalidation_bus() -> InvalidationBus:
+    return _bus
+
+def set_invalidation_bus(bus: InvalidationBus) -> None:
+    """Replace the bus, moving existing subscriptions over."""
+    global _bus
+    for caches in _bus._subscribers.values():
+        for cache in caches:
+            bus.subscribe(cache)
+    _bus = bus
+
+class AsyncTTLCache:
+    """Bounded in-process cache with TTL expiry, LRU eviction and per-key
+    single-flight loading.
+
+    Concurrent misses on the same key share one loader call. Values are
+    returned as stored, so callers must treat them as read-only.
+    """
+
+    def __init__(self, name: str, maxsize: int = DEFAULT_MAX_ENTRIES, ttl: float = DEFAULT_TTL):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        # Bumped on every invalidation so loads that started earlier are not stored
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.evictions = 0
+        _caches.append(self)
+        get_invalidation_bus().subscribe(self)
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        task = self._inflight.get(key)
+        if task is None:
+            # Run the load as its own task so a cancelled caller does not
+            # cancel it for the other requests waiting on the same key
+            task = asyncio.ensure_future(self._load(key, loader, self._generation))
+            task.add_done_callback(_retrieve_exception)
+            self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]], generation: int) -> Any:
+        self.loads += 1
+        try:
+            value = await loader()
+            if generation == self._generation:
+                self._store(key, value)
+            return value
+        finally:
+            if self._inflight.get(key) is asyncio.current_task():
+                del self._inflight[key]
+
+    def _store(self, key: Hashable, value: Any) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _drop(self, key: Optional[Hashable]) -> None:
+        self._generation += 1
+        if key is None:
+            self._entries.clear()
+            self._inflight.clear()
+        else:
+            self._entries.pop(key, None)
+            self._inflight.pop(key, None)
+
+    async def invalidate(self, key: Hashable) -> None:
+        await get_invalidation_bus().publish(self.name, key)
+
+    async def clear(self) -> None:
+        await get_invalidation_bus().publish(self.name, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "loads": self.loads,
+            "evictions": self.evictions,
+        }
+
+_caches: List[AsyncTTLCache] = []
+
+def _retrieve_exception(task: asyncio.Future) -> None:
+    # Waiters see the exception; this only silences "never retrieved" warnings
+    if not task.cancelled():
+        task.exception()
+
+def cache_stats() -> Dict[str, Dict[str, int]]:
+    """Counters for every cache created in this process."""
+    return {cache.name: cache.stats() for cache in _caches}
+
+# Read-heavy catalog data
+team_profile_cache = AsyncTTLCache("team_profiles")
+course_cache = AsyncTTLCache("courses")
+public_material_cache = AsyncTTLCache("public_materials")
+
+async def invalidate_team(team_id: str) -> None:
+    """A team's profile changed; it is embedded in courses and materials too."""
+    await team_profile_cache.invalidate(team_id)
+    await course_cache.clear()
+    await public_material_cache.clear()
@@ -0,0 +1,18 @@
+from fastapi import Request
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from storage import BlobStore
+
+# Resources opened by the app's lifespan (see server.create_app) and kept
+# on app.state. The background components (job_queue, media_pipeline, ...)
+# are module singletons bound by whichever app is running
+
+def get_db(request: Request) -> AsyncIOMotorDatabase:
+    return request.app.state.db
+
+def get_catalog_db(request: Request) -> AsyncIOMotorDatabase:
+    """Read-mostly catalog data, possibly served by secondaries."""
+    return request.app.state.catalog_db
+
+def get_blob_store(request: Request) -> BlobStore:
+    return request.app.state.blob_store
@@ -0,0 +1,83 @@
+from typing import Dict, Iterable, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from images import LOGO_VARIANT, media_url
+from models import TeamProfile
+from serialization import trusted_dump
+
+# Team fields that are safe to embed in public responses. password_hash is
+# never selected.
+PUBLIC_TEAM_FIELDS = [
+    "id", "team_name", "team_number", "contact_email", "description",
+    "logo_hash", "social_media", "location", "founded_year",
+    "website", "is_active", "created_at", "updated_at"
+]
+
+# logo_url is only returned when it is a URL. Teams whose base64 logo has not
+# been moved to the media store yet (images.migrate_inline_logos) get null,
+# decided on the server so the inline image is never sent to us.
+PUBLIC_TEAM_PROJECTION = {
+    "_id": 0,
+    **{field: 1 for field in PUBLIC_TEAM_FIELDS},
+    "logo_url": {"$cond": [
+        {"$regexMatch": {"input": {"$ifNull": ["$logo_url", ""]}, "regex": "^(https?://|/)"}},
+        "$logo_url",
+        None
+    ]}
+}
+
+async def fetch_public_teams(
+    db: AsyncIOMotorDatabase,
+    team_ids: Iterable[Optional[str]]
+) -> Dict[str, dict]:
+    """Resolve team ids to public team documents with a single $in query."""
+    ids = {team_id for team_id in team_ids if team_id}
+    if not ids:
+        return {}
+
+    cursor = db.teams.aggregate([
+        {"$match": {"id": {"$in": list(ids)}}},
+        {"$project": PUBLIC_TEAM_PROJECTION}
+    ])
+    teams = {}
+    async for team_doc in cursor:
+        if team_doc.get("logo_url") is None and team_doc.get("logo_hash"):
+            team_doc["logo_url"] = media_url(team_doc["logo_hash"], LOGO_VARIANT)
+        teams[team_doc["id"]] = team_doc
+    return teams
+
+def _instructor_team(team_doc: Optional[dict]) -> Optional[dict]:
+    if not team_doc:
+        return None
+    return trusted_dump(TeamProfile, team_doc)
+
+def _team_info(team_doc: Optional[dict]) -> Optional[dict]:
+    if not team_doc:
+        return None
+    return {
+        "team_name": team_doc.get("team_name"),
+        "logo_url": team_doc.get("logo_url"),
+        "social_media": team_doc.get("social_media", {})
+    }
+
+async def enrich_courses(db: AsyncIOMotorDatabase, courses: List[dict]) -> List[dict]:
+    """Attach the instructor team profile to each course document."""
+    teams = await fetch_public_teams(
+        db, (course.get("instructor_team_id") for course in courses)
+    )
+    return [
+        {
+            **course,
+            "instructor_team": _instructor_team(teams.get(course.get("instructor_team_id")))
+        }
+        for course in courses
+    ]
+
+async def enrich_materials(db: AsyncIOMotorDatabase, materials: List[dict]) -> List[dict]:
+    """Attach the owning team's public info to each material document."""
+    teams = await fetch_public_teams(db, (material.get("team_id") for material in materials))
+    return [
+        {**material, "team_info": _team_info(teams.get(material.get("team_id")))}
+        for material in materials
+    ]
@@ -0,0 +1,199 @@
+import asyncio
+import json
+import logging
+import os
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Dict, Optional, Set
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+EVENTS_HEARTBEAT_SECONDS = float(os.environ.get("EVENTS_HEARTBEAT_SECONDS", "25"))
+# Events buffered per connection; a client that falls this far behind is
+# disconnected and catches up from Last-Event-ID when it reconnects
+EVENTS_QUEUE_SIZE = int(os.environ.get("EVENTS_QUEUE_SIZE", "64"))
+EVENTS_REPLAY_LIMIT = int(os.environ.get("EVENTS_REPLAY_LIMIT", "500"))
+# Events are kept this long for resuming (TTL index on created_at)
+EVENTS_RETENTION_SECONDS = int(os.environ.get("EVENTS_RETENTION_SECONDS", str(24 * 3600)))
+EVENTS_RETRY_MS = 5000
+
+# Tells the client its missed events are gone and it should reload its lists
+RESET_EVENT = "reset"
+
+class Subscription:
+    """One connected client: a bounded queue of events for its team."""
+
+    def __init__(self, team_id: str, maxsize: int):
+        self.team_id = team_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.overflowed = False
+        # Events can arrive twice while the broker switches delivery paths
+        self._seen = deque(maxlen=maxsize)
+
+    def put(self, event: dict) -> None:
+        if self.overflowed or event["_id"] in self._seen:
+            return
+        self._seen.append(event["_id"])
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+class EventBroker:
+    """Per-team event fan-out for the SSE endpoint.
+
+    Events are written to the `team_events` collection, which gives each a
+    sortable id for Last-Event-ID resume. When the server supports change
+    streams every process watches that collection, so a client gets
+    events published by any process; otherwise (standalone mongod) events
+    are delivered to subscribers in the publishing process only.
+    """
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self.collection = None
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._watching = False
+        self._task: Optional[asyncio.Task] = None
+        self.published = 0
+        self.delivered = 0
+        self.overflows = 0
+
+    def bind(self, db: AsyncIOMotorDatabase) -> None:
+        self.collection = db.team_events
+
+    async def publish(self, team_id: str, event: str, data: dict) -> None:
+        doc = {"team_id": team_id, "event": event, "data": data, "created_at": datetime.utcnow()}
+        await self.collection.insert_one(doc)
+        self.published += 1
+        if not self._watching:
+            self._deliver(doc)
+
+    def _deliver(self, doc: dict) -> None:
+        for subscription in self._subscribers.get(doc["team_id"], ()):
+            subscription.put(doc)
+            self.delivered += 1
+
+    def subscribe(self, team_id: str) -> Subscription:
+        subscription = Subscription(team_id, self.queue_size)
+        self._subscribers.setdefault(team_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        if subscription.overflowed:
+            self.overflows += 1
+        subscribers = self._subscribers.get(subscription.team_id)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.team_id]
+
+    async def replay(self, team_id: str, last_event_id: str) -> Optional[list]:
+        """Events after last_event_id, or None when they can no longer be
+        recovered and the client has to reload."""
+        try:
+            after = ObjectId(last_event_id)
+        except (InvalidId, TypeError):
+            return None
+        if after.generation_time < datetime.now(timezone.utc) - timedelta(seconds=EVENTS_RETENTION_SECONDS):
+            # Some of the events after it may have expired already
+            return None
+        events = await self.collection.find(
+            {"team_id": team_id, "_id": {"$gt": after}}
+        ).sort("_id", 1).limit(EVENTS_REPLAY_LIMIT + 1).to_list(None)
+        if len(events) > EVENTS_REPLAY_LIMIT:
+            return None
+        return events
+
+    async def _watch(self) -> None:
+        pipeline = [{"$match": {"operationType": "insert"}}]
+        while True:
+            try:
+                async with self.collection.watch(pipeline) as stream:
+                    self._watching = True
+                    logger.info("Streaming team events from a change stream")
+                    async for change in stream:
+                        self._deliver(change["fullDocument"])
+            except asyncio.CancelledError:
+                raise
+            except (OperationFailure, NotImplementedError) as e:
+                # Standalone server: stay on in-process delivery
+                self._watching = False
+                logger.info("Change streams unavailable, delivering team events in-process: %s", e)
+                return
+            except PyMongoError:
+                self._watching = False
+                logger.exception("Team event change stream failed, reconnecting")
+                await asyncio.sleep(5)
+            except Exception:
+                self._watching = False
+                logger.exception("Could not watch team events, delivering them in-process")
+                return
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._watching = False
+
+    def stats(self) -> dict:
+        return {
+            "connections": sum(len(subscribers) for subscribers in self._subscribers.values()),
+            "teams_connected": len(self._subscribers),
+            "change_stream": int(self._watching),
+            "published": self.published,
+            "delivered": self.delivered,
+            "overflows": self.overflows,
+        }
+
+event_broker = EventBroker(EVENTS_QUEUE_SIZE)
+
+def format_event(doc: dict) -> str:
+    data = json.dumps(doc["data"], default=str, separators=(",", ":"))
+    return f"id: {doc['_id']}\nevent: {doc['event']}\ndata: {data}\n\n"
+
+async def stream_events(team_id: str, last_event_id: Optional[str]) -> AsyncIterator[str]:
+    """SSE body for one client: missed events first, then live ones, with a
+    comment line as heartbeat so proxies keep the connection open."""
+    subscription = event_broker.subscribe(team_id)
+    getter: Optional[asyncio.Future] = None
+    # Live events published while the replay query ran show up twice
+    replayed: Set[ObjectId] = set()
+    try:
+        yield f"retry: {EVENTS_RETRY_MS}\n\n"
+        if last_event_id:
+            missed = await event_broker.replay(team_id, last_event_id)
+            if missed is None:
+                yield f"event: {RESET_EVENT}\ndata: {{}}\n\n"
+            else:
+                for doc in missed:
+                    replayed.add(doc["_id"])
+                    yield format_event(doc)
+
+        while not subscription.overflowed:
+            if getter is None:
+                getter = asyncio.ensure_future(subscription.queue.get())
+            done, _ = await asyncio.wait([getter], timeout=EVENTS_HEARTBEAT_SECONDS)
+            if not done:
+                yield ": heartbeat\n\n"
+                continue
+            doc, getter = getter.result(), None
+            if doc["_id"] not in replayed:
+                yield format_event(doc)
+    finally:
+        if getter is not None:
+            getter.cancel()
+        event_broker.unsubscribe(subscription)
@@ -0,0 +1,35 @@
+"""Gunicorn settings for running N uvicorn workers per host.
+
+    cd backend && python -m indexes          # once per deploy
+    cd backend && BUILD_INDEXES=false gunicorn server:app -c gunicorn.conf.py
+
+Workers report not ready on /readyz until the unique team indexes exist.
+
+Each worker runs the app's lifespan after the fork, so it opens its own
+Mongo client and pool and starts its own job workers and flushers.
+Preloading is safe for that reason and shares the imported code between
+workers. Size the per-worker settings for the whole host:
+MONGO_MAX_POOL_SIZE x workers connections, JOB_WORKERS x workers job tasks.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:8001")
+# One worker per core: each is a single event loop
+workers = int(os.environ.get("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = os.environ.get("PRELOAD_APP", "true").lower() in ("1", "true", "yes")
+
+# Seconds a worker may go without reporting to the master. SSE streams and
+# large uploads are handled by the event loop, so they do not count.
+timeout = int(os.environ.get("WORKER_TIMEOUT", "60"))
+# Time for in-flight requests and the lifespan shutdown (job workers,
+# buffered status checks) after SIGTERM
+graceful_timeout = int(os.environ.get("GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.environ.get("KEEPALIVE", "5"))
+
+# Recycle workers now and then; the jitter keeps them from restarting together
+max_requests = int(os.environ.get("MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+
+accesslog = "-"
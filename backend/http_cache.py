@@ -0,0 +1,169 @@
+import hashlib
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, Iterable, Optional
+
+from fastapi import Request
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from compression import MIN_COMPRESS_BYTES, choose_encoding, compress_async
+from serialization import dumps
+
+# Cache-Control for catalog data that anyone may see
+CATALOG_CACHE_CONTROL = "public, max-age={}, must-revalidate".format(
+    int(os.environ.get("CATALOG_MAX_AGE_SECONDS", "60"))
+)
+
+def make_etag(body: bytes) -> str:
+    # Weak, because the compression middleware may re-encode the body
+    return 'W/"{}"'.format(hashlib.blake2b(body, digest_size=16).hexdigest())
+
+class RenderedJSON:
+    """A JSON payload rendered once, with its validators.
+
+    Handlers cache these so a cache hit skips serialization and hashing,
+    and compression too: each encoding of the body is made once and kept
+    with it.
+    """
+
+    __slots__ = ("body", "etag", "last_modified", "_encoded")
+
+    def __init__(self, content, last_modified: Optional[datetime] = None):
+        self.body = dumps(content)
+        self.etag = make_etag(self.body)
+        self.last_modified = last_modified
+        self._encoded: Dict[str, bytes] = {}
+
+    async def encoded(self, encoding: str) -> bytes:
+        body = self._encoded.get(encoding)
+        if body is None:
+            body = self._encoded[encoding] = await compress_async(self.body, encoding)
+        return body
+
+def latest_update(docs: Iterable[dict], field: str = "updated_at") -> Optional[datetime]:
+    """Newest `field` across documents and the documents embedded in them."""
+    latest = None
+    for doc in docs:
+        candidates = [doc.get(field)]
+        candidates += [value.get(field) for value in doc.values() if isinstance(value, dict)]
+        for value in candidates:
+            if isinstance(value, datetime) and (latest is None or value > latest):
+                latest = value
+    return latest
+
+def _http_date(value: datetime) -> str:
+    if value.tzinfo is None:
+        # Stored timestamps are naive UTC
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as required for If-None-Match
+    wanted = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == wanted:
+            return True
+    return False
+
+def not_modified_since(if_modified_since: Optional[str], last_modified: Optional[datetime]) -> bool:
+    if not if_modified_since or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if last_modified.tzinfo is None:
+        last_modified = last_modified.replace(tzinfo=timezone.utc)
+    # HTTP dates have one second resolution
+    return last_modified.replace(microsecond=0) <= since
+
+async def conditional_response(
+    request: Request,
+    rendered: RenderedJSON,
+    cache_control: str = CATALOG_CACHE_CONTROL,
+    headers: Optional[dict] = None
+) -> Response:
+    """Serve `rendered`, compressed for the client, or a 304 if the
+    client's copy is still current."""
+    response_headers = {
+        "ETag": rendered.etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"
+    }
+    if rendered.last_modified is not None:
+        response_headers["Last-Modified"] = _http_date(rendered.last_modified)
+    if headers:
+        response_headers.update(headers)
+
+    if_none_match = request.headers.get("if-none-match")
+    if etag_matches(if_none_match, rendered.etag) or (
+        if_none_match is None
+        and not_modified_since(request.headers.get("if-modified-since"), rendered.last_modified)
+    ):
+        return Response(status_code=304, headers=response_headers)
+
+    body = rendered.body
+    encoding = choose_encoding(request.headers.get("accept-encoding"))
+    if encoding is not None and len(body) >= MIN_COMPRESS_BYTES:
+        body = await rendered.encoded(encoding)
+        response_headers["Content-Encoding"] = encoding
+    return Response(body, media_type="application/json", headers=response_headers)
+
+class ConditionalGetMiddleware:
+    """Adds an ETag to complete GET responses that lack one and answers
+    matching If-None-Match requests with 304.
+
+    This still runs the handler, but saves the transfer. Routes that cache
+    their rendered payload use conditional_response instead and skip the
+    work as well. Streaming responses are passed through untouched.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+
+        if_none_match = Headers(scope=scope).get("if-none-match")
+        start_message: Optional[Message] = None
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            start, start_message = start_message, None
+            headers = MutableHeaders(scope=start)
+            if start["status"] != 200 or "etag" in headers or message.get("more_body", False):
+                await send(start)
+                await send(message)
+                return
+
+            etag = make_etag(message.get("body", b""))
+            headers["ETag"] = etag
+            if etag_matches(if_none_match, etag):
+                for name in ("content-length", "content-type"):
+                    if name in headers:
+                        del headers[name]
+                start["status"] = 304
+                await send(start)
+                await send({"type": "http.response.body", "body": b""})
+                return
+            await send(start)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,361 @@
+import asyncio
+import base64
+import binascii
+import hashlib
+import io
+import logging
+import os
+import re
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
+
+from cache import invalidate_team
+from jobs import job_queue
+from payload_codecs import read_payload
+from storage import BlobNotFound, BlobStore
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; without it plain PNG/JPEG/GIF/WebP originals are served
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Renders running at once in this process; each takes a thread
+MEDIA_WORKERS = int(os.environ.get("MEDIA_WORKERS", "2"))
+# Media no team or material has used for this long is deleted
+MEDIA_ORPHAN_SECONDS = int(os.environ.get("MEDIA_ORPHAN_SECONDS", str(24 * 3600)))
+MEDIA_CLEANUP_SECONDS = int(os.environ.get("MEDIA_CLEANUP_SECONDS", "3600"))
+MAX_LOGO_SIZE = 5 * 1024 * 1024  # 5MB limit
+# Refuse to decode anything bigger, whatever its file size (decompression bombs)
+MAX_SOURCE_PIXELS = 40_000_000
+
+# Derivatives are addressed by the hash of their source, so they never change
+MEDIA_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Used when falling back to the original because Pillow is not installed
+FALLBACK_CACHE_CONTROL = "public, max-age=3600"
+# Images only the owning team may see stay out of shared caches
+PRIVATE_MEDIA_CACHE_CONTROL = "private, max-age=3600"
+
+# Longest edge in pixels; images are never scaled up
+VARIANTS = {"thumb": 128, "small": 256, "medium": 800, "large": 1600}
+FORMATS = {
+    "webp": ("WEBP", "image/webp", {"quality": 80, "method": 4}),
+    "jpg": ("JPEG", "image/jpeg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+LOGO_VARIANT = "small"
+THUMBNAIL_VARIANT = "thumb"
+DEFAULT_FORMAT = "webp"
+
+_DIGEST = re.compile(r"^[0-9a-f]{64}$")
+
+class InvalidImage(ValueError):
+    """Raised for payloads that are not a decodable image."""
+
+def is_digest(value: str) -> bool:
+    return bool(_DIGEST.match(value))
+
+def media_url(digest: str, variant: str, fmt: str = DEFAULT_FORMAT) -> str:
+    return f"/api/media/{digest}/{variant}.{fmt}"
+
+def source_blob_id(digest: str) -> str:
+    return f"media-{digest}"
+
+def derivative_blob_id(digest: str, variant: str, fmt: str) -> str:
+    return f"media-{digest}-{variant}.{fmt}"
+
+# Served as the original when Pillow is missing; detected from the bytes,
+# never taken from the uploader
+_SAFE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+def sniff_safe_image_type(data: bytes) -> Optional[str]:
+    """The mime type of a PNG, JPEG, GIF or WebP by its signature, else None."""
+    for signature, mime_type in _SAFE_SIGNATURES:
+        if data.startswith(signature):
+            return mime_type
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+def is_inline_image(value: Optional[str]) -> bool:
+    """True for a legacy base64 logo rather than a URL."""
+    return bool(value) and not value.startswith(("http://", "https://", "/"))
+
+def decode_data_url(value: str) -> Tuple[bytes, Optional[str]]:
+    """Decode "data:<type>;base64,<data>" or bare base64."""
+    content_type = None
+    if value.startswith("data:"):
+        header, _, value = value.partition(",")
+        content_type = header[5:].split(";")[0] or None
+    try:
+        return base64.b64decode(value, validate=False), content_type
+    except (binascii.Error, ValueError):
+        raise InvalidImage("Invalid base64 image data")
+
+def _open(data: bytes):
+    try:
+        image = Image.open(io.BytesIO(data))
+    except Exception:
+        raise InvalidImage("Unsupported or corrupt image")
+    if image.width * image.height > MAX_SOURCE_PIXELS:
+        raise InvalidImage("Image dimensions too large")
+    return image
+
+def detect_image_type(data: bytes) -> Optional[str]:
+    """Mime type from the image header, without decoding the pixels.
+
+    Raises InvalidImage for anything Pillow cannot open.
+    """
+    if Image is None:
+        return None
+    with _open(data) as image:
+        return Image.MIME.get(image.format)
+
+def render_derivatives(data: bytes) -> Dict[str, Tuple[bytes, int, int]]:
+    """Every variant in every format: {"thumb.webp": (bytes, width, height)}.
+
+    CPU bound; run it in a thread.
+    """
+    derivatives = {}
+    with _open(data) as image:
+        # Let the JPEG decoder downscale while decoding, much cheaper than a full decode
+        largest = max(VARIANTS.values())
+        image.draft("RGB", (largest, largest))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info or "A" in image.mode else "RGB")
+
+        for variant, edge in sorted(VARIANTS.items(), key=lambda item: -item[1]):
+            # Each variant is reduced from the previous, larger one
+            image = image.copy()
+            image.thumbnail((edge, edge), Image.LANCZOS)
+            for ext, (fmt, _, options) in FORMATS.items():
+                frame = image
+                if fmt == "JPEG" and frame.mode == "RGBA":
+                    background = Image.new("RGB", frame.size, (255, 255, 255))
+                    background.paste(frame, mask=frame.getchannel("A"))
+                    frame = background
+                buffer = io.BytesIO()
+                frame.save(buffer, fmt, **options)
+                derivatives[f"{variant}.{ext}"] = (buffer.getvalue(), frame.width, frame.height)
+    return derivatives
+
+class MediaPipeline:
+    """Produces resized WebP/JPEG derivatives of logos and image materials.
+
+    Sources are registered in the `media` collection under the SHA-256 of
+    their bytes, so the same image uploaded twice is processed once.
+    Derivatives are rendered into the blob store by "render_media" jobs; a
+    request for a derivative that is not ready yet renders it on the spot.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.db: Optional[AsyncIOMotorDatabase] = None
+        self.blob_store: Optional[BlobStore] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._render_slots: Optional[asyncio.Semaphore] = None
+        self.rendered = 0
+        self.failed = 0
+        self.removed = 0
+        self.render_seconds = 0.0
+
+    def bind(self, db: AsyncIOMotorDatabase, blob_store: BlobStore) -> None:
+        self.db = db
+        self.blob_store = blob_store
+
+    async def register(
+        self,
+        digest: str,
+        blob_id: str,
+        content_type: Optional[str],
+        source: str,
+        codec: Optional[str] = None
+    ) -> None:
+        """Record an image already in the blob store and queue its derivatives.
+        `codec` is how that blob is compressed, as recorded on its material."""
+        try:
+            await self.db.media.update_one(
+                {"hash": digest},
+                {"$set": {"last_used_at": datetime.utcnow()}, "$setOnInsert": {
+                    "hash": digest,
+                    "source_blob_id": blob_id,
+                    "source_codec": codec,
+                    "content_type": content_type,
+                    "source": source,
+                    "status": "pending",
+                    "variants": [],
+                    "created_at": datetime.utcnow(),
+                }},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # Registered concurrently by another request
+            pass
+        await self.submit(digest)
+
+    async def ingest(self, data: bytes, content_type: Optional[str], source: str) -> str:
+        """Store an uploaded image and queue its derivatives. Returns its hash."""
+        detected_type = await asyncio.to_thread(detect_image_type, data)
+        digest = hashlib.sha256(data).hexdigest()
+        blob_id = source_blob_id(digest)
+        existing = await self.db.media.find_one({"hash": digest}, {"_id": 1})
+        if existing is None:
+            try:
+                await self.blob_store.size(blob_id)
+            except BlobNotFound:
+                await self.blob_store.put(data, blob_id, detected_type or content_type, blob_id=blob_id)
+        await self.register(digest, blob_id, detected_type or content_type, source)
+        return digest
+
+    async def visibility(self, digest: str, team_id: Optional[str] = None) -> Optional[str]:
+        """Who may see the media of `digest`: "public" for team logos and
+        images of public materials, "owner" when only `team_id`'s own
+        private materials use it, None otherwise. Knowing a hash must not
+        give access to a private file."""
+        if await self.db.teams.find_one({"logo_hash": digest}, {"_id": 1}):
+            return "public"
+        materials = self.db.team_materials
+        if await materials.find_one({"content_hash": digest, "is_public": True}, {"_id": 1}):
+            return "public"
+        if team_id and await materials.find_one({"content_hash": digest, "team_id": team_id}, {"_id": 1}):
+            return "owner"
+        return None
+
+    async def submit(self, digest: str) -> None:
+        """Queue derivative generation."""
+        await job_queue.enqueue("render_media", {"hash": digest}, dedup_key=f"render_media:{digest}")
+
+    async def ensure(self, digest: str) -> Optional[dict]:
+        """Render derivatives now unless they exist. Returns the media doc,
+        or None for an unknown hash. Concurrent calls share one render."""
+        task = self._inflight.get(digest)
+        if task is None:
+            task = asyncio.ensure_future(self._generate(digest))
+            self._inflight[digest] = task
+            task.add_done_callback(lambda _: self._inflight.pop(digest, None))
+        return await asyncio.shield(task)
+
+    async def _generate(self, digest: str) -> Optional[dict]:
+        media = await self.db.media.find_one({"hash": digest}, {"_id": 0})
+        if media is None or media["status"] != "pending" or Image is None:
+            return media
+
+        if self._render_slots is None:
+            self._render_slots = asyncio.Semaphore(self.workers)
+        try:
+            data = await read_payload(self.blob_store, media["source_blob_id"], media.get("source_codec"))
+            async with self._render_slots:
+                started = asyncio.get_running_loop().time()
+                derivatives = await asyncio.to_thread(render_derivatives, data)
+                self.render_seconds += asyncio.get_running_loop().time() - started
+        except (InvalidImage, BlobNotFound, OSError) as e:
+            self.failed += 1
+            logger.warning("Could not render media %s: %s", digest, e)
+            update = {"status": "failed", "error": str(e)}
+            await self.db.media.update_one({"hash": digest}, {"$set": update})
+            return {**media, **update}
+
+        variants = []
+        for name, (payload, width, height) in derivatives.items():
+            variant, _, fmt = name.partition(".")
+            blob_id = derivative_blob_id(digest, variant, fmt)
+            try:
+                await self.blob_store.delete(blob_id)
+            except BlobNotFound:
+                pass
+            await self.blob_store.put(payload, name, FORMATS[fmt][1], blob_id=blob_id)
+            variants.append({"name": name, "width": width, "height": height, "size": len(payload)})
+
+        self.rendered += 1
+        update = {"status": "ready", "variants": variants, "rendered_at": datetime.utcnow()}
+        await self.db.media.update_one({"hash": digest}, {"$set": update})
+        return {**media, **update}
+
+    async def render(self, payload: dict) -> None:
+        """Job handler for "render_media"."""
+        await self.ensure(payload["hash"])
+
+    async def backfill(self, payload: dict) -> None:
+        """Job handler: queue media left pending before jobs were durable, and
+        convert legacy inline logos."""
+        async for media in self.db.media.find({"status": "pending"}, {"hash": 1}):
+            await self.submit(media["hash"])
+        await migrate_inline_logos(self.db, self)
+
+    async def cleanup(self, payload: dict) -> None:
+        """Job handler: delete media no team logo or material uses any more."""
+        cutoff = datetime.utcnow() - timedelta(seconds=MEDIA_ORPHAN_SECONDS)
+        unused_since = {"$or": [
+            {"last_used_at": {"$lt": cutoff}},
+            {"last_used_at": {"$exists": False}, "created_at": {"$lt": cutoff}},
+        ]}
+        async for media in self.db.media.find(unused_since, {"_id": 0}):
+            digest = media["hash"]
+            if await self.db.teams.find_one({"logo_hash": digest}, {"_id": 1}):
+                continue
+            if await self.db.team_materials.find_one({"content_hash": digest}, {"_id": 1}):
+                continue
+            # Re-registered since it was read: keep it
+            result = await self.db.media.delete_one({"hash": digest, **unused_since})
+            if not result.deleted_count:
+                continue
+            blob_ids = [
+                derivative_blob_id(digest, *variant["name"].split("."))
+                for variant in media.get("variants", [])
+            ]
+            # Material payloads belong to blob_refs; only logos are ours
+            if media["source_blob_id"] == source_blob_id(digest):
+                blob_ids.append(media["source_blob_id"])
+            for blob_id in blob_ids:
+                try:
+                    await self.blob_store.delete(blob_id)
+                except BlobNotFound:
+                    pass
+            self.removed += 1
+
+    async def start(self) -> None:
+        await job_queue.enqueue("media_backfill", dedup_key="media_backfill")
+
+    def stats(self) -> dict:
+        return {
+            "rendering": len(self._inflight),
+            "rendered": self.rendered,
+            "failed": self.failed,
+            "removed": self.removed,
+            "render_seconds_total": self.render_seconds,
+        }
+
+media_pipeline = MediaPipeline(MEDIA_WORKERS)
+job_queue.register("render_media", media_pipeline.render)
+job_queue.register("media_backfill", media_pipeline.backfill)
+job_queue.register("media_cleanup", media_pipeline.cleanup, every_seconds=MEDIA_CLEANUP_SECONDS)
+
+async def migrate_inline_logos(db: AsyncIOMotorDatabase, pipeline: MediaPipeline) -> int:
+    """Move base64 logos still stored in teams.logo_url into the media store."""
+    migrated = 0
+    query = {"logo_url": {"$nin": [None, ""], "$not": re.compile(r"^(https?://|/)")}}
+    async for team in db.teams.find(query, {"_id": 0, "id": 1, "logo_url": 1}):
+        try:
+            data, content_type = decode_data_url(team["logo_url"])
+            digest = await pipeline.ingest(data, content_type, source="logo")
+        except InvalidImage as e:
+            logger.warning("Leaving logo of team %s as is: %s", team["id"], e)
+            continue
+        await db.teams.update_one(
+            {"id": team["id"], "logo_url": team["logo_url"]},
+            {"$set": {"logo_hash": digest, "logo_url": media_url(digest, LOGO_VARIANT)}}
+        )
+        await invalidate_team(team["id"])
+        migrated += 1
+    if migrated:
+        logger.info("Moved %d inline logos to the media store", migrated)
+    return migrated
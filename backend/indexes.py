@@ -0,0 +1,238 @@
+import logging
+import uuid
+from datetime import datetime
+from typing import Dict, List
+
+from bson import ObjectId
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from events import EVENTS_RETENTION_SECONDS
+from jobs import JOB_RETENTION_SECONDS
+from status_writer import status_writer
+
+logger = logging.getLogger(__name__)
+
+# Every index a query in server.py or team_routes.py relies on, by collection.
+# List endpoints page on (created_at, id) newest first, so their indexes end
+# with those keys in that order.
+INDEXES: Dict[str, List[IndexModel]] = {
+    "teams": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("contact_email", ASCENDING)], name="contact_email_unique", unique=True),
+        IndexModel([("team_name", ASCENDING)], name="team_name_unique", unique=True),
+        # Media access checks and cleanup
+        IndexModel([("logo_hash", ASCENDING)], name="logo_hash", sparse=True),
+    ],
+    "courses": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)], name="created_at_id"),
+        IndexModel(
+            [("category", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+            name="category_created_at_id"
+        ),
+        IndexModel(
+            [("level", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+            name="level_created_at_id"
+        ),
+        IndexModel(
+            [("instructor_team_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+            name="instructor_team_id_created_at_id"
+        ),
+        # Incremental search index refresh
+        IndexModel([("updated_at", ASCENDING)], name="updated_at"),
+    ],
+    "team_materials": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel(
+            [("team_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+            name="team_id_created_at_id"
+        ),
+        IndexModel(
+            [("is_public", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+            name="is_public_created_at_id"
+        ),
+        IndexModel([("updated_at", ASCENDING)], name="updated_at"),
+        IndexModel([("content_hash", ASCENDING)], name="content_hash", sparse=True),
+    ],
+    "team_messages": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel(
+            [("to_team_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+            name="to_team_id_created_at_id"
+        ),
+        IndexModel(
+            [("to_team_id", ASCENDING), ("is_read", ASCENDING),
+             ("created_at", DESCENDING), ("id", DESCENDING)],
+            name="to_team_id_is_read_created_at_id"
+        ),
+    ],
+    "revoked_tokens": [
+        IndexModel([("jti", ASCENDING)], name="jti", sparse=True),
+        IndexModel([("team_id", ASCENDING), ("not_before", DESCENDING)], name="team_id_not_before"),
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "media": [
+        IndexModel([("hash", ASCENDING)], name="hash_unique", unique=True),
+        IndexModel([("status", ASCENDING)], name="status"),
+    ],
+    "jobs": [
+        # Workers claim the earliest due job
+        IndexModel([("status", ASCENDING), ("run_at", ASCENDING)], name="status_run_at"),
+        # At most one active job per dedup key; unset when the job finishes
+        IndexModel([("active_key", ASCENDING)], name="active_key_unique", unique=True, sparse=True),
+        IndexModel(
+            [("finished_at", ASCENDING)], name="finished_at_ttl",
+            expireAfterSeconds=JOB_RETENTION_SECONDS
+        ),
+    ],
+    "jobs_dead": [
+        IndexModel([("kind", ASCENDING), ("failed_at", DESCENDING)], name="kind_failed_at"),
+    ],
+    "team_events": [
+        # Last-Event-ID resume reads a team's events after an id
+        IndexModel([("team_id", ASCENDING), ("_id", ASCENDING)], name="team_id_id"),
+        IndexModel(
+            [("created_at", ASCENDING)], name="created_at_ttl",
+            expireAfterSeconds=EVENTS_RETENTION_SECONDS
+        ),
+    ],
+    "rate_limits": [
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "status_checks": [
+        IndexModel([("timestamp", DESCENDING), ("id", DESCENDING)], name="timestamp_id"),
+        IndexModel(
+            [("client_name", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)],
+            name="client_name_timestamp_id"
+        ),
+    ],
+}
+
+# Indexes correctness depends on, not only speed: registration relies on
+# these to reject duplicate teams
+REQUIRED_INDEXES: Dict[str, List[str]] = {
+    "teams": ["contact_email_unique", "team_name_unique"],
+}
+
+async def missing_required_indexes(db: AsyncIOMotorDatabase) -> List[str]:
+    """Required indexes the server does not have, as collection.name."""
+    missing = []
+    for collection_name, names in REQUIRED_INDEXES.items():
+        existing = await db[collection_name].index_information()
+        missing += [f"{collection_name}.{name}" for name in names if name not in existing]
+    return missing
+
+async def ensure_indexes(db: AsyncIOMotorDatabase) -> None:
+    """Create all declared indexes. Safe to run on every startup: creating an
+    index that already exists with the same spec is a no-op."""
+    for collection_name, indexes in INDEXES.items():
+        try:
+            await db[collection_name].create_indexes(indexes)
+        except OperationFailure as e:
+            # Typically existing duplicates blocking a unique index, or an
+            # index with the same name but different keys. Keep serving.
+            logger.error("Could not build indexes on %s: %s", collection_name, e)
+
+async def report_indexes(db: AsyncIOMotorDatabase) -> Dict[str, Dict[str, List[str]]]:
+    """Compare the declared indexes with what the server has.
+
+    Returns, per collection, the declared indexes that are missing and the
+    existing indexes that have not been used since the server last started.
+    """
+    report = {}
+    for collection_name, indexes in INDEXES.items():
+        collection = db[collection_name]
+        existing = await collection.index_information()
+        declared = {index.document["name"] for index in indexes}
+
+        unused = []
+        try:
+            async for stats in collection.aggregate([{"$indexStats": {}}]):
+                if stats["name"] != "_id_" and stats["accesses"]["ops"] == 0:
+                    unused.append(stats["name"])
+        except (OperationFailure, NotImplementedError):
+            # $indexStats needs the indexStats privilege, and stand-ins
+            # such as mongomock do not implement it at all
+            pass
+
+        report[collection_name] = {
+            "missing": sorted(declared - set(existing)),
+            "unused": sorted(unused),
+        }
+    return report
+
+async def log_index_report(db: AsyncIOMotorDatabase) -> None:
+    report = await report_indexes(db)
+    for collection_name, entry in report.items():
+        if entry["missing"]:
+            logger.warning("Missing indexes on %s: %s", collection_name, ", ".join(entry["missing"]))
+        if entry["unused"]:
+            logger.info("Unused indexes on %s: %s", collection_name, ", ".join(entry["unused"]))
+
+# Collections listed through fetch_page, which pages on (created_at, id)
+PAGED_COLLECTIONS = ["courses", "team_materials", "team_messages"]
+
+async def backfill_sort_keys(db: AsyncIOMotorDatabase) -> Dict[str, int]:
+    """Store an id and created_at on documents written without them.
+
+    created_at comes from the ObjectId's creation time, so the documents
+    keep one stable position in every page and ETag. Returns the number of
+    documents fixed per collection.
+    """
+    fixed = {}
+    for collection_name in PAGED_COLLECTIONS:
+        collection = db[collection_name]
+        count = 0
+        cursor = collection.find(
+            {"$or": [{"id": None}, {"created_at": None}]}, {"_id": 1, "id": 1, "created_at": 1}
+        )
+        async for doc in cursor:
+            update = {}
+            if doc.get("id") is None:
+                update["id"] = str(uuid.uuid4())
+            if doc.get("created_at") is None:
+                if isinstance(doc["_id"], ObjectId):
+                    update["created_at"] = doc["_id"].generation_time.replace(tzinfo=None)
+                else:
+                    update["created_at"] = datetime.utcnow()
+            await collection.update_one({"_id": doc["_id"]}, {"$set": update})
+            count += 1
+        if count:
+            logger.warning("Backfilled id/created_at on %d documents in %s", count, collection_name)
+        fixed[collection_name] = count
+    return fixed
+
+async def prepare_database(db: AsyncIOMotorDatabase) -> None:
+    """Collections with special options, missing sort keys, then every
+    declared index."""
+    # Before ensure_indexes, which would create status_checks as a plain collection
+    status_writer.bind(db)
+    await status_writer.ensure_collection()
+    # Before the unique id indexes, which documents without an id would block
+    await backfill_sort_keys(db)
+    await ensure_indexes(db)
+    await log_index_report(db)
+
+async def main() -> None:
+    from pathlib import Path
+    from dotenv import load_dotenv
+    from mongo import create_client
+    from settings import Settings
+
+    load_dotenv(Path(__file__).parent / '.env')
+    settings = Settings.from_env()
+    client = create_client(settings.mongo_url, event_listeners=[])
+    try:
+        await prepare_database(client[settings.db_name])
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    # Once per deploy when the app runs with BUILD_INDEXES=false:
+    #     cd backend && python -m indexes
+    import asyncio
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,291 @@
+import asyncio
+import logging
+import os
+import random
+import socket
+import time
+import traceback
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from metrics import Counter, Histogram, registry
+
+logger = logging.getLogger(__name__)
+
+# JOB_WORKERS=0 makes this process enqueue only, e.g. when dedicated worker
+# processes run the jobs
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+JOB_POLL_SECONDS = float(os.environ.get("JOB_POLL_SECONDS", "2"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "5"))
+JOB_TIMEOUT_SECONDS = float(os.environ.get("JOB_TIMEOUT_SECONDS", "300"))
+JOB_BACKOFF_SECONDS = float(os.environ.get("JOB_BACKOFF_SECONDS", "5"))
+JOB_BACKOFF_MAX_SECONDS = float(os.environ.get("JOB_BACKOFF_MAX_SECONDS", "900"))
+# Finished jobs are kept this long (TTL index on finished_at)
+JOB_RETENTION_SECONDS = int(os.environ.get("JOB_RETENTION_SECONDS", str(7 * 24 * 3600)))
+
+JobHandler = Callable[[dict], Awaitable[None]]
+
+job_runs = registry.register(Counter(
+    "jobs_total", "Finished job attempts by kind and outcome", ["kind", "outcome"]
+))
+job_duration = registry.register(Histogram(
+    "job_duration_seconds", "Time spent running a job attempt", ["kind"]
+))
+job_latency = registry.register(Histogram(
+    "job_latency_seconds", "Time from when a job was due to when a worker started it", ["kind"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900)
+))
+
+class PermanentJobError(Exception):
+    """Raised by a handler for failures that retrying cannot fix."""
+
+class JobQueue:
+    """Durable job queue on Mongo, worked by asyncio tasks in this process.
+
+    Jobs live in `jobs` until they finish; workers claim them atomically
+    with a lease, so several processes can share the queue and a job whose
+    worker died is picked up again when its lease runs out. Failed attempts
+    are retried with exponential backoff and jitter; jobs that keep failing
+    move to `jobs_dead`. A dedup key keeps at most one queued or running job
+    per key.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.collection = None
+        self.dead_letters = None
+        self._handlers: Dict[str, JobHandler] = {}
+        self._max_attempts: Dict[str, int] = {}
+        self._recurring: Dict[str, float] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.running = 0
+        self.depth: Dict[str, int] = {"queued": 0, "running": 0, "dead": 0}
+
+    def bind(self, db: AsyncIOMotorDatabase) -> None:
+        self.collection = db.jobs
+        self.dead_letters = db.jobs_dead
+
+    def register(
+        self,
+        kind: str,
+        handler: JobHandler,
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+        every_seconds: Optional[float] = None
+    ) -> None:
+        """Register the handler for a job kind. With every_seconds the job
+        also runs on a schedule, once across all processes."""
+        self._handlers[kind] = handler
+        self._max_attempts[kind] = max_attempts
+        if every_seconds:
+            self._recurring[kind] = every_seconds
+
+    async def enqueue(
+        self,
+        kind: str,
+        payload: Optional[dict] = None,
+        dedup_key: Optional[str] = None,
+        delay: float = 0.0
+    ) -> str:
+        """Queue a job and return its id. With a dedup_key that is already
+        queued or running, returns the existing job's id instead."""
+        now = datetime.utcnow()
+        job = {
+            "_id": uuid.uuid4().hex,
+            "kind": kind,
+            "payload": payload or {},
+            "status": "queued",
+            "attempts": 0,
+            "max_attempts": self._max_attempts.get(kind, JOB_MAX_ATTEMPTS),
+            "run_at": now + timedelta(seconds=delay),
+            "created_at": now,
+        }
+        if dedup_key:
+            # Only set while the job is active, under a unique sparse index
+            job["active_key"] = dedup_key
+        try:
+            await self.collection.insert_one(job)
+        except DuplicateKeyError:
+            existing = await self.collection.find_one({"active_key": dedup_key}, {"_id": 1})
+            if existing is not None:
+                return existing["_id"]
+            # Finished in the meantime; queue a new one
+            return await self.enqueue(kind, payload, dedup_key, delay)
+        if self._wakeup is not None and delay <= 0:
+            self._wakeup.set()
+        return job["_id"]
+
+    async def _claim(self) -> Optional[dict]:
+        now = datetime.utcnow()
+        return await self.collection.find_one_and_update(
+            {"$or": [
+                {"status": "queued", "run_at": {"$lte": now}},
+                # The worker holding it died or hung
+                {"status": "running", "lease_until": {"$lt": now}},
+            ]},
+            {
+                "$set": {
+                    "status": "running",
+                    "started_at": now,
+                    "lease_until": now + timedelta(seconds=JOB_TIMEOUT_SECONDS + 30),
+                    "worker": self._worker_id,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("run_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _run(self, job: dict) -> None:
+        kind = job["kind"]
+        job_latency.observe(max(0.0, (job["started_at"] - job["run_at"]).total_seconds()), kind)
+        handler = self._handlers.get(kind)
+        started = time.perf_counter()
+        self.running += 1
+        try:
+            if handler is None:
+                raise PermanentJobError(f"No handler for job kind {kind}")
+            # Not wait_for: it can swallow our own cancellation when the
+            # handler finishes at the same moment, which hangs shutdown
+            task = asyncio.ensure_future(handler(job["payload"]))
+            try:
+                done, _ = await asyncio.wait([task], timeout=JOB_TIMEOUT_SECONDS)
+            finally:
+                task.cancel()
+            if not done:
+                raise asyncio.TimeoutError(f"Job timed out after {JOB_TIMEOUT_SECONDS:.0f}s")
+            task.result()
+        except asyncio.CancelledError:
+            # Shutting down: the lease expires and another worker retries it
+            raise
+        except Exception as e:
+            job_runs.inc(kind, "failure")
+            await self._failed(job, e)
+        else:
+            job_runs.inc(kind, "success")
+            await self.collection.update_one(
+                {"_id": job["_id"], "worker": self._worker_id},
+                {"$set": {"status": "done", "finished_at": datetime.utcnow()},
+                 "$unset": {"active_key": "", "lease_until": ""}}
+            )
+            if kind in self._recurring:
+                await self._schedule(kind)
+        finally:
+            self.running -= 1
+            job_duration.observe(time.perf_counter() - started, kind)
+
+    async def _failed(self, job: dict, error: Exception) -> None:
+        message = "".join(traceback.format_exception_only(type(error), error)).strip()
+        if isinstance(error, PermanentJobError) or job["attempts"] >= job["max_attempts"]:
+            logger.error("Job %s (%s) failed permanently: %s", job["_id"], job["kind"], message)
+            # An upsert, so a retry after a partial failure does not collide
+            # with the copy already written
+            await self.dead_letters.replace_one(
+                {"_id": job["_id"]},
+                {**job, "status": "dead", "last_error": message, "failed_at": datetime.utcnow()},
+                upsert=True
+            )
+            await self.collection.delete_one({"_id": job["_id"], "worker": self._worker_id})
+            if job["kind"] in self._recurring:
+                await self._schedule(job["kind"])
+            return
+
+        backoff = min(JOB_BACKOFF_MAX_SECONDS, JOB_BACKOFF_SECONDS * 2 ** (job["attempts"] - 1))
+        # Jitter spreads out retries of jobs that failed together
+        backoff *= random.uniform(0.5, 1.0)
+        logger.warning(
+            "Job %s (%s) attempt %d failed, retrying in %.0fs: %s",
+            job["_id"], job["kind"], job["attempts"], backoff, message
+        )
+        await self.collection.update_one(
+            {"_id": job["_id"], "worker": self._worker_id},
+            {"$set": {
+                "status": "queued",
+                "run_at": datetime.utcnow() + timedelta(seconds=backoff),
+                "last_error": message,
+            }, "$unset": {"lease_until": ""}}
+        )
+
+    async def _schedule(self, kind: str, delay: Optional[float] = None) -> None:
+        await self.enqueue(
+            kind, dedup_key=f"recurring:{kind}",
+            delay=self._recurring[kind] if delay is None else delay
+        )
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                job = await self._claim()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Could not claim a job")
+                job = None
+            if job is not None:
+                try:
+                    await self._run(job)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    # Recording the outcome failed; the job is retried when
+                    # its lease runs out. Back off rather than spin on an
+                    # unavailable database.
+                    logger.exception("Could not finish job %s (%s)", job["_id"], job["kind"])
+                    await asyncio.sleep(JOB_POLL_SECONDS)
+                continue
+            self._wakeup.clear()
+            waiter = asyncio.ensure_future(self._wakeup.wait())
+            try:
+                await asyncio.wait([waiter], timeout=JOB_POLL_SECONDS)
+            finally:
+                waiter.cancel()
+
+    async def _monitor(self) -> None:
+        """Refresh the queue depth reported in stats(), and requeue recurring
+        jobs whose next run was lost to a failed write."""
+        while True:
+            try:
+                for kind in self._recurring:
+                    # A no-op while the next run is queued, thanks to its dedup key
+                    await self._schedule(kind)
+                self.depth = {
+                    "queued": await self.collection.count_documents({"status": "queued"}),
+                    "running": await self.collection.count_documents({"status": "running"}),
+                    "dead": await self.dead_letters.estimated_document_count(),
+                }
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Could not check the job queue")
+            await asyncio.sleep(max(JOB_POLL_SECONDS, 10))
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        for kind in self._recurring:
+            # First runs are spread out so they do not all land at startup
+            await self._schedule(kind, delay=random.uniform(0, self._recurring[kind]))
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._monitor()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "running_here": self.running,
+            **{f"{status}_jobs": count for status, count in self.depth.items()},
+        }
+
+job_queue = JobQueue(JOB_WORKERS)
@@ -0,0 +1,275 @@
+import bisect
+import contextvars
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import bson
+from pymongo import monitoring
+from starlette.datastructures import MutableHeaders
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Counting command and reply sizes re-encodes every command and reply
+# (GridFS chunks and large getMore batches included) on the driver thread;
+# only worth it while investigating traffic
+MONGO_METRICS_BYTES = os.environ.get("MONGO_METRICS_BYTES", "0") == "1"
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100, 250, 1000)
+
+LabelValues = Tuple[str, ...]
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = [
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in zip(names, values)
+    ]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        return lines + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name, documentation, labels=()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def value(self, *label_values: str) -> float:
+        return self._values.get(label_values, 0.0)
+
+    def _samples(self):
+        return [
+            f"{self.name}{_format_labels(self.label_names, labels)} {value}"
+            for labels, value in sorted(self._values.items())
+        ]
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def dec(self, *label_values: str, amount: float = 1.0) -> None:
+        self.inc(*label_values, amount=-amount)
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        with self._lock:
+            state = self._values.get(label_values)
+            if state is None:
+                state = self._values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[bisect.bisect_left(self.buckets, value)] += 1
+            state[-1] += value
+
+    def count(self, *label_values: str) -> int:
+        state = self._values.get(label_values)
+        return int(sum(state[:-1])) if state else 0
+
+    def _samples(self):
+        lines = []
+        for labels, state in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip([*self.buckets, "+Inf"], state[:-1]):
+                cumulative += bucket_count
+                bucket_labels = _format_labels([*self.label_names, "le"], [*labels, bound])
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            label_text = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_text} {state[-1]}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+class Registry:
+    """Metrics plus collectors that report other modules' counters at scrape time."""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, Dict[str, str], float]]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[Tuple[str, str, Dict[str, str], float]]]) -> None:
+        """A collector yields (name, type, labels, value) samples."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        # Samples of one metric must be contiguous, so group them by name
+        families: Dict[str, List[str]] = {}
+        for collector in self._collectors:
+            for name, type_name, labels, value in collector():
+                if name not in families:
+                    families[name] = [f"# TYPE {name} {type_name}"]
+                families[name].append(f"{name}{_format_labels(labels.keys(), labels.values())} {value}")
+        for family in families.values():
+            lines += family
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+def add_stats_collector(prefix: str, get_stats: Callable[[], dict], label: Optional[str] = None) -> None:
+    """Expose a component's stats() dict as gauges named <prefix>_<key>.
+
+    With `label`, get_stats returns {label value: {key: value}} instead.
+    """
+    def collect():
+        stats = get_stats()
+        groups = stats.items() if label else [(None, stats)]
+        for group, values in groups:
+            labels = {label: group} if label else {}
+            for key, value in values.items():
+                yield f"{prefix}_{key}", "gauge", labels, value
+    registry.add_collector(collect)
+
+http_requests = registry.register(Counter(
+    "http_requests_total", "HTTP requests by route and status", ["method", "route", "status"]
+))
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "route"]
+))
+http_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served"
+))
+http_request_db_commands = registry.register(Histogram(
+    "http_request_mongo_commands", "Mongo commands issued per HTTP request",
+    ["method", "route"], buckets=COUNT_BUCKETS
+))
+mongo_commands = registry.register(Counter(
+    "mongo_commands_total", "Mongo commands by name and outcome", ["command", "outcome"]
+))
+mongo_command_duration = registry.register(Histogram(
+    "mongo_command_duration_seconds", "Mongo command round trip time", ["command"]
+))
+mongo_bytes = registry.register(Counter(
+    "mongo_bytes_total", "BSON bytes sent to and received from Mongo", ["direction"]
+))
+
+class RequestStats:
+    """Per-request accumulator, shared with Motor's executor threads."""
+
+    __slots__ = ("started", "db_commands", "db_seconds", "db_bytes", "_lock")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_commands = 0
+        self.db_seconds = 0.0
+        self.db_bytes = 0
+        self._lock = threading.Lock()
+
+    def add_command(self, seconds: float, size: int) -> None:
+        with self._lock:
+            self.db_commands += 1
+            self.db_seconds += seconds
+            self.db_bytes += size
+
+    def server_timing(self) -> str:
+        app_ms = (time.perf_counter() - self.started) * 1000
+        return 'app;dur={:.1f}, db;dur={:.1f};desc="{} commands, {} bytes"'.format(
+            app_ms, self.db_seconds * 1000, self.db_commands, self.db_bytes
+        )
+
+# Motor copies the context into its executor, so command events see this
+current_request: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar(
+    "current_request", default=None
+)
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Times every Mongo command and attributes it to the current request."""
+
+    def __init__(self):
+        self._sizes: Dict[int, int] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        if MONGO_METRICS_BYTES:
+            size = len(bson.encode(event.command))
+            mongo_bytes.inc("sent", amount=size)
+            self._sizes[event.request_id] = size
+
+    def _finish(self, event, outcome: str, reply_size: int = 0) -> None:
+        seconds = event.duration_micros / 1e6
+        mongo_commands.inc(event.command_name, outcome)
+        mongo_command_duration.observe(seconds, event.command_name)
+        size = self._sizes.pop(event.request_id, 0) + reply_size
+        stats = current_request.get()
+        if stats is not None:
+            stats.add_command(seconds, size)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        reply_size = 0
+        if MONGO_METRICS_BYTES:
+            reply_size = len(bson.encode(event.reply))
+            mongo_bytes.inc("received", amount=reply_size)
+        self._finish(event, "success", reply_size)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._finish(event, "failure")
+
+mongo_listener = MongoCommandListener()
+
+class MetricsMiddleware:
+    """Records per-route latency, in-flight requests and Mongo usage, and
+    reports the request's own numbers in a Server-Timing header."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                MutableHeaders(scope=message).append("Server-Timing", stats.server_timing())
+            await send(message)
+
+        http_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_in_flight.dec()
+            current_request.reset(token)
+            route = scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            http_requests.inc(method, route_path, str(status_code))
+            http_request_duration.observe(time.perf_counter() - stats.started, method, route_path)
+            http_request_db_commands.observe(stats.db_commands, method, route_path)
+
+async def metrics_endpoint() -> Response:
+    return Response(registry.render(), media_type="text/plain; version=0.0.4")
@@ -16,7 +16,8 @@ class TeamProfile(BaseModel):
     team_number: Optional[str] = None  # FRC team number like "7845"
     contact_email: EmailStr
     description: Optional[str] = Field(None, max_length=500)
-    logo_url: Optional[str] = None  # Base64 encoded logo
+    logo_url: Optional[str] = None  # Logo URL; legacy documents hold base64
+    logo_hash: Optional[str] = None  # SHA-256 of the logo in the media store
     social_media: SocialMediaLinks = Field(default_factory=SocialMediaLinks)
     location: Optional[str] = None
     founded_year: Optional[int] = None
@@ -35,6 +36,10 @@ class TeamLogin(BaseModel):
     email: EmailStr
     password: str
 
+class PasswordChangeRequest(BaseModel):
+    current_password: str
+    new_password: str = Field(..., min_length=6)
+
 class TeamToken(BaseModel):
     access_token: str
     token_type: str
@@ -54,9 +59,13 @@ class TeamMaterial(BaseModel):
     title: str = Field(..., min_length=1, max_length=200)
     description: Optional[str] = Field(None, max_length=1000)
     material_type: MaterialType
-    file_data: str  # Base64 encoded file data
+    file_data: Optional[str] = None  # Legacy inline base64 payload
+    blob_id: Optional[str] = None  # Reference into the blob store
     file_name: str
     file_size: int  # Size in bytes
+    content_hash: Optional[str] = None  # SHA-256 of the file bytes
+    codec: Optional[str] = None  # How the blob is compressed ("zstd"), None for raw bytes
+    thumbnail_url: Optional[str] = None  # Set for image materials
     mime_type: str
     is_public: bool = False  # Whether other teams can see this material
     tags: List[str] = Field(default_factory=list)
@@ -103,7 +112,7 @@ class TeamUpdateRequest(BaseModel):
     team_name: Optional[str] = Field(None, min_length=2, max_length=100)
     team_number: Optional[str] = None
     description: Optional[str] = Field(None, max_length=500)
-    logo_data: Optional[str] = None  # Base64 encoded logo
+    logo_data: Optional[str] = None  # Base64 or data: URL; "" removes the logo
     social_media: Optional[SocialMediaLinks] = None
     location: Optional[str] = None
     founded_year: Optional[int] = None
@@ -119,9 +128,24 @@ class MaterialUploadRequest(BaseModel):
     is_public: bool = False
     tags: List[str] = Field(default_factory=list)
 
+class MaterialFromHashRequest(BaseModel):
+    title: str = Field(..., min_length=1, max_length=200)
+    description: Optional[str] = Field(None, max_length=1000)
+    material_type: MaterialType
+    content_hash: str = Field(..., pattern=r"^[0-9a-fA-F]{64}$")  # SHA-256 of the file
+    file_name: str
+    mime_type: str
+    is_public: bool = False
+    tags: List[str] = Field(default_factory=list)
+
 class ContactTeamRequest(BaseModel):
     from_name: str = Field(..., min_length=1, max_length=100)
     from_email: EmailStr
     subject: str = Field(..., min_length=1, max_length=200)
     message: str = Field(..., min_length=10, max_length=2000)
-    course_id: Optional[str] = None
\ No newline at end of file
+    course_id: Optional[str] = None
+
+class MarkMessagesReadRequest(BaseModel):
+    ids: Optional[List[str]] = Field(None, max_length=1000)  # Specific messages
+    up_to: Optional[datetime] = None  # Or every message received up to this time
+    course_id: Optional[str] = None  # Either way, only messages about this course
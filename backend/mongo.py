@@ -0,0 +1,187 @@
+import asyncio
+import importlib.util
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List
+from urllib.parse import parse_qs, urlsplit
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import monitoring
+from pymongo.read_preferences import (
+    Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+)
+
+logger = logging.getLogger(__name__)
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name, str(default)))
+
+MONGO_MAX_POOL_SIZE = _env_int("MONGO_MAX_POOL_SIZE", 100)
+MONGO_MIN_POOL_SIZE = _env_int("MONGO_MIN_POOL_SIZE", 10)
+MONGO_MAX_CONNECTING = _env_int("MONGO_MAX_CONNECTING", 4)
+MONGO_MAX_IDLE_TIME_MS = _env_int("MONGO_MAX_IDLE_TIME_MS", 300_000)
+# How long a request waits for a free connection before failing
+MONGO_WAIT_QUEUE_TIMEOUT_MS = _env_int("MONGO_WAIT_QUEUE_TIMEOUT_MS", 5_000)
+MONGO_SERVER_SELECTION_TIMEOUT_MS = _env_int("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5_000)
+MONGO_CONNECT_TIMEOUT_MS = _env_int("MONGO_CONNECT_TIMEOUT_MS", 5_000)
+MONGO_SOCKET_TIMEOUT_MS = _env_int("MONGO_SOCKET_TIMEOUT_MS", 30_000)
+# Wire compression in order of preference; ones whose Python package is
+# missing (zstandard, python-snappy) are skipped
+MONGO_COMPRESSORS = os.environ.get("MONGO_COMPRESSORS", "zstd,snappy")
+# Where the read-mostly catalog (courses, public materials, search) reads from
+MONGO_CATALOG_READ_PREFERENCE = os.environ.get("MONGO_CATALOG_READ_PREFERENCE", "primary")
+MONGO_CATALOG_MAX_STALENESS_SECONDS = _env_int("MONGO_CATALOG_MAX_STALENESS_SECONDS", -1)
+MONGO_READY_TIMEOUT_SECONDS = float(os.environ.get("MONGO_READY_TIMEOUT_SECONDS", "2"))
+
+_COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+_READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+class MongoPoolListener(monitoring.ConnectionPoolListener):
+    """Connection pool counters for /healthz, /readyz and /metrics.
+
+    Called from the driver's threads, hence the lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.max_size = MONGO_MAX_POOL_SIZE
+        self.open = 0
+        self.in_use = 0
+        self.waiting = 0
+        self.checkouts = 0
+        self.checkout_failures: Dict[str, int] = {}
+        self.pools_cleared = 0
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pools_cleared += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open -= 1
+
+    def connection_check_out_started(self, event):
+        with self._lock:
+            self.waiting += 1
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.waiting -= 1
+            reason = str(event.reason)
+            self.checkout_failures[reason] = self.checkout_failures.get(reason, 0) + 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.waiting -= 1
+            self.in_use += 1
+            self.checkouts += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_size": self.max_size,
+                "open": self.open,
+                "in_use": self.in_use,
+                "wait_queue": self.waiting,
+                "checkouts": self.checkouts,
+                "checkout_failures": sum(self.checkout_failures.values()),
+                "pools_cleared": self.pools_cleared,
+            }
+
+pool_listener = MongoPoolListener()
+
+def available_compressors(names: str) -> List[str]:
+    compressors = []
+    for name in filter(None, (part.strip() for part in names.split(","))):
+        module = _COMPRESSOR_MODULES.get(name)
+        if module is None:
+            logger.warning("Unknown Mongo compressor %s", name)
+        elif importlib.util.find_spec(module) is None:
+            logger.info("Mongo compressor %s needs the %s package, skipping it", name, module)
+        else:
+            compressors.append(name)
+    return compressors
+
+def client_options() -> Dict[str, Any]:
+    options: Dict[str, Any] = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxConnecting": MONGO_MAX_CONNECTING,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "socketTimeoutMS": MONGO_SOCKET_TIMEOUT_MS,
+    }
+    compressors = available_compressors(MONGO_COMPRESSORS)
+    if compressors:
+        options["compressors"] = ",".join(compressors)
+    return options
+
+def create_client(mongo_url: str, event_listeners: list) -> AsyncIOMotorClient:
+    """The app's client. Options given in the URL win over the env settings."""
+    in_url = {key.lower(): values[-1] for key, values in parse_qs(urlsplit(mongo_url).query).items()}
+    options = {key: value for key, value in client_options().items() if key.lower() not in in_url}
+    pool_listener.max_size = int(in_url.get("maxpoolsize", MONGO_MAX_POOL_SIZE))
+    if "minPoolSize" in options:
+        options["minPoolSize"] = min(options["minPoolSize"], pool_listener.max_size)
+    return AsyncIOMotorClient(mongo_url, event_listeners=[*event_listeners, pool_listener], **options)
+
+def catalog_database(db: AsyncIOMotorDatabase) -> AsyncIOMotorDatabase:
+    """The database handle for catalog reads, which tolerate replication lag
+    and so may go to secondaries. db itself when they stay on the primary."""
+    try:
+        preference = _READ_PREFERENCES[MONGO_CATALOG_READ_PREFERENCE]
+    except KeyError:
+        raise ValueError(f"Unknown MONGO_CATALOG_READ_PREFERENCE {MONGO_CATALOG_READ_PREFERENCE}")
+    if preference is Primary:
+        return db
+    return db.client.get_database(db.name, read_preference=preference(
+        max_staleness=MONGO_CATALOG_MAX_STALENESS_SECONDS
+    ))
+
+async def ping(db: AsyncIOMotorDatabase) -> float:
+    """Round trip to the server db reads from, in milliseconds."""
+    started = time.perf_counter()
+    await db.command("ping", read_preference=db.read_preference)
+    return (time.perf_counter() - started) * 1000
+
+async def warm_up(*databases: AsyncIOMotorDatabase) -> None:
+    """Open MONGO_MIN_POOL_SIZE connections before the first request needs
+    them, instead of paying connection setup and auth on live traffic."""
+    started = time.perf_counter()
+    for db in databases:
+        # Concurrent commands each take their own connection
+        await asyncio.gather(*(ping(db) for _ in range(max(1, MONGO_MIN_POOL_SIZE))))
+    logger.info(
+        "Mongo pool warmed: %d connections in %.0f ms",
+        pool_listener.open, (time.perf_counter() - started) * 1000
+    )
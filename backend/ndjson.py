@@ -0,0 +1,173 @@
+import os
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple, Type
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from motor.motor_asyncio import AsyncIOMotorCollection, AsyncIOMotorCursor
+from pydantic import BaseModel, ValidationError
+from pymongo.errors import BulkWriteError
+
+from serialization import dumps, loads
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+IMPORT_BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", "500"))
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", "500"))
+MAX_LINE_BYTES = 1024 * 1024
+# The report lists this many errors; the rest are only counted
+MAX_REPORTED_ERRORS = 1000
+# Export output is sent in chunks of about this size
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+def dumps_line(doc: dict) -> bytes:
+    return dumps(doc) + b"\n"
+
+async def _export_body(cursor: AsyncIOMotorCursor) -> AsyncIterator[bytes]:
+    chunk = bytearray()
+    async for doc in cursor:
+        chunk += dumps_line(doc)
+        if len(chunk) >= EXPORT_CHUNK_BYTES:
+            yield bytes(chunk)
+            chunk.clear()
+    if chunk:
+        yield bytes(chunk)
+
+def export_response(
+    collection: AsyncIOMotorCollection,
+    query: dict,
+    name: str,
+    projection: Optional[dict] = None
+) -> StreamingResponse:
+    """Stream every matching document as NDJSON straight off the cursor,
+    one server batch in memory at a time."""
+    cursor = collection.find(query, {"_id": 0, **(projection or {})}).batch_size(EXPORT_BATCH_SIZE)
+    filename = f"{name}-{datetime.utcnow():%Y%m%d-%H%M%S}.ndjson"
+    return StreamingResponse(
+        _export_body(cursor),
+        media_type=NDJSON_MEDIA_TYPE,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in detail['loc']) or 'row'}: {detail['msg']}"
+        for detail in error.errors()
+    )
+
+class NDJSONImport:
+    """Reads an NDJSON request body, validates rows against a model and
+    writes them in unordered bulk batches, collecting errors per line."""
+
+    def __init__(self, model: Type[BaseModel], batch_size: int = IMPORT_BATCH_SIZE):
+        self.model = model
+        self.batch_size = batch_size
+        self.received = 0
+        self.inserted = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors: List[Dict[str, Any]] = []
+
+    def error(self, line: int, message: str) -> None:
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def _too_long(self, line: int) -> None:
+        self.received += 1
+        self.error(line, f"Line longer than {MAX_LINE_BYTES} bytes")
+
+    async def _lines(self, request: Request) -> AsyncIterator[Tuple[int, bytes]]:
+        buffer = bytearray()
+        line_number = 0
+        skipping = False
+        async for chunk in request.stream():
+            buffer += chunk
+            while True:
+                end = buffer.find(b"\n")
+                if end < 0:
+                    break
+                line_number += 1
+                if skipping:
+                    skipping = False
+                elif end > MAX_LINE_BYTES:
+                    # Arrived whole within one chunk
+                    self._too_long(line_number)
+                else:
+                    yield line_number, bytes(buffer[:end])
+                del buffer[:end + 1]
+            if len(buffer) > MAX_LINE_BYTES and not skipping:
+                # Drop the rest of this line as it arrives
+                self._too_long(line_number + 1)
+                skipping = True
+            if skipping:
+                buffer.clear()
+        if buffer and not skipping:
+            yield line_number + 1, bytes(buffer)
+
+    async def batches(
+        self,
+        request: Request,
+        prepare: Optional[Callable[[dict], Awaitable[dict]]] = None,
+        overrides: Optional[dict] = None
+    ) -> AsyncIterator[List[Tuple[int, dict]]]:
+        """Validated documents in batches of (line number, document).
+
+        overrides replace row fields before validation; prepare can adjust
+        a validated document or reject it with ValueError.
+        """
+        batch: List[Tuple[int, dict]] = []
+        async for line_number, line in self._lines(request):
+            if not line.strip():
+                continue
+            self.received += 1
+            try:
+                row = loads(line)
+                if not isinstance(row, dict):
+                    raise ValueError("Expected a JSON object")
+                doc = self.model(**{**row, **(overrides or {})}).dict()
+                if prepare is not None:
+                    doc = await prepare(doc)
+            except ValidationError as e:
+                self.error(line_number, _validation_message(e))
+                continue
+            except ValueError as e:
+                # Also JSON decode errors
+                self.error(line_number, str(e))
+                continue
+            batch.append((line_number, doc))
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    async def write(self, collection: AsyncIOMotorCollection, operations: List[Tuple[int, Any]]) -> Set[int]:
+        """Run one unordered bulk_write. Returns the line numbers that failed."""
+        if not operations:
+            return set()
+        failed: Set[int] = set()
+        try:
+            result = await collection.bulk_write([op for _, op in operations], ordered=False)
+            counts = result.bulk_api_result
+        except BulkWriteError as e:
+            counts = e.details
+            for write_error in counts.get("writeErrors", []):
+                line_number = operations[write_error["index"]][0]
+                failed.add(line_number)
+                message = write_error.get("errmsg", "Write failed")
+                if write_error.get("code") == 11000:
+                    message = "Duplicate id"
+                self.error(line_number, message)
+        self.inserted += counts.get("nInserted", 0) + counts.get("nUpserted", 0)
+        self.updated += counts.get("nModified", 0)
+        return failed
+
+    def report(self) -> dict:
+        return {
+            "received": self.received,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import os
+import smtplib
+import uuid
+from abc import ABC, abstractmethod
+from email.message import EmailMessage
+from email.utils import formataddr, parseaddr
+from pathlib import Path
+from typing import Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from jobs import PermanentJobError, job_queue
+
+logger = logging.getLogger(__name__)
+
+# "smtp" sends through SMTP_HOST; "none" only logs. "file" writes .eml files
+# to NOTIFY_FILE_PATH for local development and has to be asked for
+NOTIFY_TRANSPORT = os.environ.get("NOTIFY_TRANSPORT", "smtp" if os.environ.get("SMTP_HOST") else "none")
+NOTIFY_FROM = os.environ.get("NOTIFY_FROM", "FRC Platform <no-reply@localhost>")
+NOTIFY_FILE_PATH = os.environ.get("NOTIFY_FILE_PATH", "/tmp/frc-mail")
+SMTP_HOST = os.environ.get("SMTP_HOST", "localhost")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", "587"))
+SMTP_USERNAME = os.environ.get("SMTP_USERNAME")
+SMTP_PASSWORD = os.environ.get("SMTP_PASSWORD")
+SMTP_STARTTLS = os.environ.get("SMTP_STARTTLS", "true").lower() in ("1", "true", "yes")
+SMTP_TIMEOUT = float(os.environ.get("SMTP_TIMEOUT", "30"))
+
+class Transport(ABC):
+    """Delivers a composed email."""
+
+    @abstractmethod
+    async def send(self, message: EmailMessage) -> None:
+        raise NotImplementedError
+
+class SMTPTransport(Transport):
+    """smtplib in a thread. Also works against a local debugging SMTP server
+    (python -m aiosmtpd -n -l localhost:1025) with SMTP_STARTTLS=false."""
+
+    def __init__(self, host: str, port: int, username: Optional[str], password: Optional[str],
+                 starttls: bool, timeout: float):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+
+    def _send(self, message: EmailMessage) -> None:
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password or "")
+            smtp.send_message(message)
+
+    async def send(self, message: EmailMessage) -> None:
+        await asyncio.to_thread(self._send, message)
+
+class FileTransport(Transport):
+    """Writes each email as an .eml file instead of sending it."""
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+
+    def _write(self, message: EmailMessage) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{uuid.uuid4().hex}.eml"
+        path.write_bytes(bytes(message))
+
+    async def send(self, message: EmailMessage) -> None:
+        await asyncio.to_thread(self._write, message)
+
+class LogTransport(Transport):
+    async def send(self, message: EmailMessage) -> None:
+        logger.info("Email to %s: %s", message["To"], message["Subject"])
+
+def create_transport() -> Transport:
+    if NOTIFY_TRANSPORT == "smtp":
+        return SMTPTransport(SMTP_HOST, SMTP_PORT, SMTP_USERNAME, SMTP_PASSWORD, SMTP_STARTTLS, SMTP_TIMEOUT)
+    if NOTIFY_TRANSPORT == "file":
+        return FileTransport(NOTIFY_FILE_PATH)
+    return LogTransport()
+
+def _header_value(value: str) -> str:
+    # Senders choose names and subjects; a CR or LF in them would start a
+    # new header, which EmailMessage refuses
+    return " ".join(str(value).split())
+
+class Notifier:
+    """Email notifications, sent from background jobs so requests never wait
+    on the mail server."""
+
+    def __init__(self, transport: Transport):
+        self.transport = transport
+        self.db: Optional[AsyncIOMotorDatabase] = None
+        self.sent = 0
+
+    def bind(self, db: AsyncIOMotorDatabase) -> None:
+        self.db = db
+
+    async def send_contact_message(self, payload: dict) -> None:
+        """Job handler: tell a team about a message sent to it."""
+        message = await self.db.team_messages.find_one({"id": payload["message_id"]}, {"_id": 0})
+        if message is None:
+            raise PermanentJobError(f"Message {payload['message_id']} not found")
+        team = await self.db.teams.find_one(
+            {"id": message["to_team_id"]}, {"_id": 0, "team_name": 1, "contact_email": 1}
+        )
+        if team is None:
+            raise PermanentJobError(f"Team {message['to_team_id']} not found")
+
+        email = EmailMessage()
+        try:
+            email["From"] = NOTIFY_FROM
+            email["To"] = formataddr((_header_value(team["team_name"]), _header_value(team["contact_email"])))
+            email["Reply-To"] = formataddr(
+                (_header_value(message["from_name"]), _header_value(message["from_email"]))
+            )
+            email["Subject"] = _header_value(f"New message: {message['subject']}")
+        except ValueError as e:
+            # The same on every attempt
+            raise PermanentJobError(f"Cannot address message {message['id']}: {e}")
+        # Stable across retries, so a mail server can drop duplicates
+        domain = parseaddr(NOTIFY_FROM)[1].partition("@")[2] or "localhost"
+        email["Message-ID"] = f"<contact-{message['id']}@{domain}>"
+        email.set_content(
+            f"{message['from_name']} <{message['from_email']}> sent {team['team_name']} a message:\n\n"
+            f"{message['message']}\n\n"
+            "Reply to this email to answer, or read it in your team inbox.\n"
+        )
+        await self.transport.send(email)
+        self.sent += 1
+
+    def stats(self) -> dict:
+        return {"sent": self.sent}
+
+notifier = Notifier(create_transport())
+job_queue.register("contact_notification", notifier.send_contact_message)
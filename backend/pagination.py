@@ -0,0 +1,133 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple, Type
+
+from fastapi import HTTPException, Query, Request, Response, status
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pydantic import BaseModel
+
+from serialization import FastJSONResponse, trusted_dump_many
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+class PageParams:
+    """Common list parameters: keyset cursor, page size and field selection."""
+
+    def __init__(
+        self,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = Query(None, description="Opaque cursor from X-Next-Cursor"),
+        fields: Optional[str] = Query(None, description="Comma separated fields to return")
+    ):
+        self.limit = limit
+        self.cursor = cursor
+        self.fields = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+
+    def cache_key(self) -> tuple:
+        return (self.limit, self.cursor, tuple(self.fields) if self.fields else None)
+
+    def wants(self, field: str) -> bool:
+        return self.fields is None or field in self.fields
+
+    def projection(
+        self,
+        allowed: Iterable[str],
+        always: Iterable[str] = (),
+        exclude: Iterable[str] = ()
+    ) -> dict:
+        """Mongo projection for the requested fields.
+
+        Without fields= everything except `exclude` is returned. `always`
+        lists fields the handler itself needs (ids, sort keys).
+        """
+        if self.fields is None:
+            return {"_id": 0, **{field: 0 for field in exclude}}
+        allowed = set(allowed) - set(exclude)
+        unknown = [field for field in self.fields if field not in allowed]
+        if unknown:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown fields: {', '.join(unknown)}"
+            )
+        return {"_id": 0, **{field: 1 for field in [*self.fields, *always]}}
+
+def encode_cursor(sort_value: datetime, doc_id: str) -> str:
+    raw = json.dumps([sort_value.isoformat(), doc_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sort_value, doc_id = json.loads(raw)
+        return datetime.fromisoformat(sort_value), str(doc_id)
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+async def fetch_page(
+    collection: AsyncIOMotorCollection,
+    query: dict,
+    page: PageParams,
+    projection: Optional[dict] = None,
+    sort_field: str = "created_at"
+) -> Tuple[List[dict], Optional[str]]:
+    """Return one page of documents, newest first, and the cursor for the next.
+
+    Pages are keyed on (sort_field, id) so they stay stable while new
+    documents are inserted, and each page costs one indexed range scan.
+    Documents without either key have no place in that order and are left
+    out; indexes.backfill_sort_keys gives old documents both.
+    """
+    query = {"$and": [query, {sort_field: {"$ne": None}, "id": {"$ne": None}}]}
+    if page.cursor:
+        sort_value, doc_id = decode_cursor(page.cursor)
+        query["$and"].append({"$or": [
+            {sort_field: {"$lt": sort_value}},
+            {sort_field: sort_value, "id": {"$lt": doc_id}}
+        ]})
+
+    docs = await collection.find(query, projection).sort(
+        [(sort_field, -1), ("id", -1)]
+    ).limit(page.limit + 1).to_list(page.limit + 1)
+
+    next_cursor = None
+    if len(docs) > page.limit:
+        docs = docs[:page.limit]
+        next_cursor = encode_cursor(docs[-1][sort_field], docs[-1]["id"])
+    return docs, next_cursor
+
+def set_next_cursor(response: Response, request: Request, next_cursor: Optional[str]) -> None:
+    """Advertise the next page through X-Next-Cursor and a Link header."""
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+        next_url = request.url.include_query_params(cursor=next_cursor)
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
+
+def projected_response(docs: List[dict], request: Request, next_cursor: Optional[str]) -> FastJSONResponse:
+    """Response for a fields= request, which bypasses the full response_model."""
+    response = FastJSONResponse(docs)
+    set_next_cursor(response, request, next_cursor)
+    return response
+
+def trusted_response(
+    model: Type[BaseModel],
+    docs: List[dict],
+    request: Request,
+    next_cursor: Optional[str]
+) -> FastJSONResponse:
+    """Full response for documents the app wrote through `model`.
+
+    Same body as returning model instances under response_model=List[model],
+    which the route keeps for its schema, but without validating every row
+    twice and walking the result again with jsonable_encoder.
+    """
+    response = FastJSONResponse(trusted_dump_many(model, docs))
+    set_next_cursor(response, request, next_cursor)
+    return response
@@ -0,0 +1,194 @@
+import asyncio
+import os
+from typing import AsyncIterator, Optional
+
+from metrics import Counter, registry
+from storage import BlobStore, BlobWriter, CHUNK_SIZE
+
+try:
+    import zstandard
+except ImportError:  # zstandard is optional, payloads are then stored raw
+    zstandard = None
+
+# Codec names recorded on materials and blob refs; None means raw bytes
+ZSTD = "zstd"
+
+PAYLOAD_ZSTD_LEVEL = int(os.environ.get("PAYLOAD_ZSTD_LEVEL", "3"))
+PAYLOAD_COMPRESSION = os.environ.get("PAYLOAD_COMPRESSION", "true").lower() in ("1", "true", "yes")
+# The first bytes of a payload are compressed as a sample; the payload is
+# only compressed when the sample shrinks to at most this share of its size
+PAYLOAD_MAX_RATIO = float(os.environ.get("PAYLOAD_MAX_RATIO", "0.9"))
+SAMPLE_BYTES = 64 * 1024
+# Not worth a frame header and a decompressor
+MIN_COMPRESS_BYTES = 1024
+# Smallest slice of an encoded payload decompressed in one step. A zstd
+# block of repeated bytes decodes to 128 KiB from a few bytes, so this
+# bounds one step's output at a few MB even for a payload of zeros.
+DECODE_MIN_INPUT_BYTES = 64
+
+# Formats that are compressed already; they are stored (and zipped) as
+# they are without sampling
+COMPRESSED_TYPES = (
+    "image/jpeg",
+    "image/png",
+    "image/gif",
+    "image/webp",
+    "image/avif",
+    "image/heic",
+    "video/",
+    "audio/",
+    "application/pdf",
+    "application/zip",
+    "application/gzip",
+    "application/x-gzip",
+    "application/x-bzip2",
+    "application/x-xz",
+    "application/x-7z-compressed",
+    "application/x-rar-compressed",
+    "application/vnd.rar",
+    "application/zstd",
+    "application/vnd.openxmlformats-officedocument.",
+    "application/vnd.oasis.opendocument.",
+)
+
+payload_bytes = registry.register(Counter(
+    "material_payload_bytes_total", "Material payload bytes written, raw and as stored, by codec",
+    ["codec", "stage"]
+))
+
+def is_compressed_type(mime_type: Optional[str]) -> bool:
+    return (mime_type or "").lower().startswith(COMPRESSED_TYPES)
+
+def choose_codec(mime_type: Optional[str], sample: bytes) -> Optional[str]:
+    """zstd when the type is not compressed already and the sample shrinks
+    enough, otherwise None."""
+    if zstandard is None or not PAYLOAD_COMPRESSION or is_compressed_type(mime_type):
+        return None
+    sample = sample[:SAMPLE_BYTES]
+    if len(sample) < MIN_COMPRESS_BYTES:
+        return None
+    compressed = zstandard.ZstdCompressor(level=PAYLOAD_ZSTD_LEVEL).compress(sample)
+    if len(compressed) > len(sample) * PAYLOAD_MAX_RATIO:
+        return None
+    return ZSTD
+
+def _require(codec: str) -> None:
+    if codec != ZSTD:
+        raise ValueError(f"Unknown payload codec {codec!r}")
+    if zstandard is None:
+        raise RuntimeError("zstandard is not installed, cannot read zstd payloads")
+
+async def encode(data: bytes, codec: Optional[str]) -> bytes:
+    """Encode a complete payload, in a worker thread."""
+    if codec is None:
+        payload_bytes.inc("raw", "raw", amount=len(data))
+        payload_bytes.inc("raw", "stored", amount=len(data))
+        return data
+    _require(codec)
+    encoded = await asyncio.to_thread(zstandard.ZstdCompressor(level=PAYLOAD_ZSTD_LEVEL).compress, data)
+    payload_bytes.inc(codec, "raw", amount=len(data))
+    payload_bytes.inc(codec, "stored", amount=len(encoded))
+    return encoded
+
+class PayloadWriter(BlobWriter):
+    """Encodes a streamed payload on its way into the blob store.
+
+    The codec is picked from the content type and the first chunk, then
+    every chunk is compressed (in a worker thread) into one zstd frame.
+    """
+
+    def __init__(self, writer: BlobWriter, content_type: Optional[str]):
+        self._writer = writer
+        self.blob_id = writer.blob_id
+        self.content_type = content_type
+        self.codec: Optional[str] = None
+        self.size = 0
+        self.stored_size = 0
+        self._compressor = None
+        self._started = False
+
+    async def write(self, data: bytes) -> None:
+        if not self._started:
+            self._started = True
+            self.codec = await asyncio.to_thread(choose_codec, self.content_type, data)
+            if self.codec is not None:
+                self._compressor = zstandard.ZstdCompressor(level=PAYLOAD_ZSTD_LEVEL).compressobj()
+        self.size += len(data)
+        if self._compressor is not None:
+            data = await asyncio.to_thread(self._compressor.compress, data)
+        await self._write_through(data)
+
+    async def _write_through(self, data: bytes) -> None:
+        if data:
+            self.stored_size += len(data)
+            await self._writer.write(data)
+
+    async def close(self) -> str:
+        if self._compressor is not None:
+            await self._write_through(self._compressor.flush())
+        codec = self.codec or "raw"
+        payload_bytes.inc(codec, "raw", amount=self.size)
+        payload_bytes.inc(codec, "stored", amount=self.stored_size)
+        return await self._writer.close()
+
+    async def abort(self) -> None:
+        await self._writer.abort()
+
+async def open_payload(
+    blob_store: BlobStore,
+    blob_id: str,
+    codec: Optional[str],
+    start: int = 0,
+    end: Optional[int] = None
+) -> AsyncIterator[bytes]:
+    """Yield the decoded bytes in [start, end] (inclusive) of a payload.
+
+    Raw payloads are ranged in the blob store. Encoded ones are read on the
+    event loop and decompressed a slice at a time in a worker thread,
+    skipping output before start and stopping after end. Slices shrink
+    while the payload compresses well, so a step decodes about CHUNK_SIZE
+    bytes; output is passed on in pieces of at most CHUNK_SIZE.
+    """
+    if codec is None:
+        async for chunk in blob_store.open_download(blob_id, start, end):
+            yield chunk
+        return
+
+    _require(codec)
+    decompressor = zstandard.ZstdDecompressor().decompressobj()
+    download = blob_store.open_download(blob_id)
+    pending = memoryview(b"")
+    step = DECODE_MIN_INPUT_BYTES
+    position = 0
+    try:
+        while not decompressor.eof:
+            if not pending:
+                try:
+                    pending = memoryview(await download.__anext__())
+                except StopAsyncIteration:
+                    raise zstandard.ZstdError(f"Payload {blob_id} is truncated")
+                continue
+            data, pending = pending[:step], pending[step:]
+            # Only the decoding runs in a worker thread; it never waits on
+            # the loop, which would tie up the executor the reads need
+            decoded = await asyncio.to_thread(decompressor.decompress, data)
+            # Aim the next slice at CHUNK_SIZE of output, growing gradually
+            # as one slice is a poor guide for the next
+            ratio = max(len(decoded), 1) / len(data)
+            step = min(CHUNK_SIZE, step * 4, max(DECODE_MIN_INPUT_BYTES, int(CHUNK_SIZE / ratio)))
+            for offset in range(0, len(decoded), CHUNK_SIZE):
+                piece = decoded[offset:offset + CHUNK_SIZE]
+                piece_start, position = position, position + len(piece)
+                if position <= start:
+                    continue
+                lower = max(start - piece_start, 0)
+                upper = len(piece) if end is None else min(end + 1 - piece_start, len(piece))
+                yield piece[lower:upper]
+                if end is not None and position > end:
+                    return
+    finally:
+        await download.aclose()
+
+async def read_payload(blob_store: BlobStore, blob_id: str, codec: Optional[str]) -> bytes:
+    """Read and decode a complete payload. Only meant for small blobs."""
+    return b"".join([chunk async for chunk in open_payload(blob_store, blob_id, codec)])
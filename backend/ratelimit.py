@@ -0,0 +1,303 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException, Request, status
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from metrics import Counter, registry
+
+logger = logging.getLogger(__name__)
+
+# "memory" keeps buckets per process; "mongo" shares them between workers
+RATE_LIMIT_BACKEND = os.environ.get("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+RATE_LIMIT_MAX_KEYS = int(os.environ.get("RATE_LIMIT_MAX_KEYS", "100000"))
+# Number of reverse proxies in front of the app that append to
+# X-Forwarded-For; 0 uses the socket peer address
+TRUSTED_PROXY_HOPS = int(os.environ.get("TRUSTED_PROXY_HOPS", "0"))
+
+# In-flight requests at which everything is shed; 0 disables the check
+ADMISSION_MAX_IN_FLIGHT = int(os.environ.get("ADMISSION_MAX_IN_FLIGHT", "512"))
+# Writes and auth requests are shed earlier, at this share of the limit
+ADMISSION_LOW_PRIORITY_SHARE = float(os.environ.get("ADMISSION_LOW_PRIORITY_SHARE", "0.5"))
+# Event loop lag at which low priority requests are shed (4x sheds all); 0 disables
+ADMISSION_MAX_LOOP_LAG_MS = float(os.environ.get("ADMISSION_MAX_LOOP_LAG_MS", "200"))
+ADMISSION_LAG_INTERVAL_SECONDS = 0.1
+
+# Paths never shed or counted: probes, metrics and long-lived event streams
+ADMISSION_EXEMPT_PATHS = ("/healthz", "/readyz", "/metrics", "/api/teams/events")
+_READ_METHODS = ("GET", "HEAD", "OPTIONS")
+
+rate_limited = registry.register(Counter(
+    "rate_limited_total", "Requests rejected by a rate limit", ["limit"]
+))
+requests_shed = registry.register(Counter(
+    "http_requests_shed_total", "Requests rejected by admission control", ["reason"]
+))
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+def parse_rate(spec: str) -> Tuple[float, int]:
+    """"10/minute" -> (tokens per second, burst). The burst is the count."""
+    count, _, period = spec.partition("/")
+    try:
+        return int(count) / _PERIODS[period.strip() or "second"], int(count)
+    except (KeyError, ValueError):
+        raise ValueError(f"Invalid rate limit {spec!r}, expected e.g. 10/minute")
+
+class RateLimitBackend(ABC):
+    """Token bucket storage. take() removes `cost` tokens from the bucket at
+    `key` and returns 0, or returns how many seconds until that many tokens
+    are available without removing any."""
+
+    @abstractmethod
+    async def take(self, key: str, rate: float, burst: int, cost: float = 1.0) -> float:
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {}
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """Buckets in this process, bounded to `max_keys` (least recently used
+    go first; a dropped bucket comes back full)."""
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self.evictions = 0
+
+    async def take(self, key, rate, burst, cost=1.0):
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (float(burst), now))
+        tokens = min(float(burst), tokens + (now - updated) * rate)
+        wait = 0.0
+        if tokens >= cost:
+            tokens -= cost
+        else:
+            wait = (cost - tokens) / rate
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+            self.evictions += 1
+        return wait
+
+    def stats(self):
+        return {"keys": len(self._buckets), "evictions": self.evictions}
+
+class MongoRateLimitBackend(RateLimitBackend):
+    """Buckets in the `rate_limits` collection, shared by every worker.
+
+    Each take() is one atomic pipeline update, so concurrent requests from
+    different processes cannot both spend the last token. Idle buckets
+    expire through a TTL index once they would be full again.
+    """
+
+    def __init__(self):
+        self.collection = None
+
+    def bind(self, db: AsyncIOMotorDatabase) -> None:
+        self.collection = db.rate_limits
+
+    async def take(self, key, rate, burst, cost=1.0):
+        now = datetime.utcnow()
+        elapsed = {"$divide": [{"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}, 1000]}
+        bucket = await self.collection.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {"tokens": {"$min": [
+                    burst, {"$add": [{"$ifNull": ["$tokens", burst]}, {"$multiply": [elapsed, rate]}]}
+                ]}}},
+                {"$set": {"allowed": {"$gte": ["$tokens", cost]}}},
+                {"$set": {
+                    "tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", cost]}, "$tokens"]},
+                    "updated_at": now,
+                    "expires_at": now + timedelta(seconds=burst / rate),
+                }},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        if bucket["allowed"]:
+            return 0.0
+        return (cost - bucket["tokens"]) / rate
+
+_backend: RateLimitBackend = (
+    MongoRateLimitBackend() if RATE_LIMIT_BACKEND == "mongo" else MemoryRateLimitBackend(RATE_LIMIT_MAX_KEYS)
+)
+
+def get_rate_limit_backend() -> RateLimitBackend:
+    return _backend
+
+def set_rate_limit_backend(backend: RateLimitBackend) -> None:
+    global _backend
+    _backend = backend
+
+def client_ip(request: Request) -> str:
+    if TRUSTED_PROXY_HOPS > 0:
+        forwarded = [part.strip() for part in request.headers.get("x-forwarded-for", "").split(",") if part.strip()]
+        if forwarded:
+            # Each trusted proxy appended the address it saw; anything
+            # further left was sent by the client and can be forged
+            return forwarded[-min(TRUSTED_PROXY_HOPS, len(forwarded))]
+    return request.client.host if request.client else "unknown"
+
+class RateLimit:
+    """A named token bucket limit, checked per key (an IP, email, team id)."""
+
+    def __init__(self, name: str, spec: str):
+        self.name = name
+        self.rate, self.burst = parse_rate(spec)
+        self.allowed = 0
+        self.rejected = 0
+
+    async def hit(self, key: str) -> None:
+        """Spend a token for key, or raise 429 with Retry-After."""
+        if not RATE_LIMIT_ENABLED:
+            return
+        try:
+            wait = await get_rate_limit_backend().take(f"{self.name}:{key}", self.rate, self.burst)
+        except Exception:
+            # A broken shared backend must not lock everyone out
+            logger.exception("Rate limit backend failed, allowing the request")
+            return
+        if wait <= 0:
+            self.allowed += 1
+            return
+        self.rejected += 1
+        rate_limited.inc(self.name)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests, try again later",
+            headers={"Retry-After": str(max(1, math.ceil(wait)))}
+        )
+
+login_ip_limit = RateLimit("login_ip", os.environ.get("RATE_LIMIT_LOGIN_IP", "20/minute"))
+login_email_limit = RateLimit("login_email", os.environ.get("RATE_LIMIT_LOGIN_EMAIL", "5/minute"))
+register_ip_limit = RateLimit("register_ip", os.environ.get("RATE_LIMIT_REGISTER_IP", "10/hour"))
+contact_ip_limit = RateLimit("contact_ip", os.environ.get("RATE_LIMIT_CONTACT_IP", "5/minute"))
+contact_team_limit = RateLimit("contact_team", os.environ.get("RATE_LIMIT_CONTACT_TEAM", "30/hour"))
+_limits = (login_ip_limit, login_email_limit, register_ip_limit, contact_ip_limit, contact_team_limit)
+
+def rate_limit_stats() -> dict:
+    stats = dict(get_rate_limit_backend().stats())
+    for limit in _limits:
+        stats[f"{limit.name}_allowed"] = limit.allowed
+        stats[f"{limit.name}_rejected"] = limit.rejected
+    return stats
+
+class AdmissionController:
+    """Sheds requests with 503 before the process is too busy to serve any.
+
+    Tracks requests in flight and event loop lag (how late a periodic timer
+    fires). A streaming response stops counting as in flight once its body
+    starts, so long downloads do not hold slots. Writes and auth requests are shed first, so catalog reads keep
+    being served through a burst of logins or contact messages.
+    """
+
+    def __init__(self, max_in_flight: int, max_loop_lag_ms: float, low_priority_share: float):
+        self.max_in_flight = max_in_flight
+        self.max_loop_lag = max_loop_lag_ms / 1000
+        self.low_priority_share = low_priority_share
+        self.in_flight = 0
+        self.loop_lag = 0.0
+        self.shed: Dict[str, int] = {"in_flight": 0, "loop_lag": 0}
+        self._task: Optional[asyncio.Task] = None
+
+    def reject_reason(self, low_priority: bool) -> Optional[str]:
+        if self.max_in_flight > 0:
+            limit = self.max_in_flight * (self.low_priority_share if low_priority else 1.0)
+            if self.in_flight >= limit:
+                return "in_flight"
+        if self.max_loop_lag > 0:
+            limit = self.max_loop_lag * (1 if low_priority else 4)
+            if self.loop_lag >= limit:
+                return "loop_lag"
+        return None
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.loop_lag * 2))
+
+    async def _measure_lag(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + ADMISSION_LAG_INTERVAL_SECONDS
+            await asyncio.sleep(ADMISSION_LAG_INTERVAL_SECONDS)
+            lag = max(0.0, loop.time() - expected)
+            # Rises at once, decays over a few intervals
+            self.loop_lag = lag if lag > self.loop_lag else self.loop_lag * 0.7 + lag * 0.3
+
+    def start(self) -> None:
+        if self._task is None and self.max_loop_lag > 0:
+            self._task = asyncio.create_task(self._measure_lag())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "loop_lag_seconds": self.loop_lag,
+            **{f"shed_{reason}": count for reason, count in self.shed.items()},
+        }
+
+admission_controller = AdmissionController(
+    ADMISSION_MAX_IN_FLIGHT, ADMISSION_MAX_LOOP_LAG_MS, ADMISSION_LOW_PRIORITY_SHARE
+)
+
+class AdmissionControlMiddleware:
+    def __init__(self, app: ASGIApp, controller: AdmissionController = admission_controller):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"].startswith(ADMISSION_EXEMPT_PATHS):
+            await self.app(scope, receive, send)
+            return
+
+        controller = self.controller
+        reason = controller.reject_reason(low_priority=scope["method"] not in _READ_METHODS)
+        if reason is not None:
+            controller.shed[reason] += 1
+            requests_shed.inc(reason)
+            response = JSONResponse(
+                {"detail": "Server is busy, try again shortly"},
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={"Retry-After": str(controller.retry_after())}
+            )
+            await response(scope, receive, send)
+            return
+
+        controller.in_flight += 1
+        counted = True
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal counted
+            if counted and message["type"] == "http.response.body" and message.get("more_body", False):
+                # Streaming the rest (downloads, bundles, exports) takes
+                # little CPU but may last minutes; stop counting it
+                counted = False
+                controller.in_flight -= 1
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if counted:
+                controller.in_flight -= 1
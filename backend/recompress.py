@@ -0,0 +1,204 @@
+"""Compress material payloads stored before payload_codecs existed.
+
+    cd backend && python -m recompress --dry-run
+    cd backend && python -m recompress --batch-size 100
+
+Materials without a codec are visited in batches:
+
+- Legacy materials with the payload inline as base64 move into the blob
+  store, compressed when that pays off.
+- Raw blobs of compressible content are rewritten as zstd. A blob shared
+  by several materials is rewritten once and all of them are pointed at
+  the new copy, along with its blob ref and any media using it.
+
+Safe to stop and run again. Run it when traffic is low: a download that
+is streaming an old blob fails when that blob is deleted.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import logging
+from typing import Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from blob_refs import blob_refs
+from payload_codecs import PayloadWriter, choose_codec, is_compressed_type
+from storage import BlobNotFound, BlobStore
+
+logger = logging.getLogger(__name__)
+
+async def _copy_encoded(
+    blob_store: BlobStore,
+    blob_id: str,
+    file_name: str,
+    mime_type: Optional[str]
+) -> Optional[PayloadWriter]:
+    """Write a compressed copy of a raw blob. Returns None, writing
+    nothing, when its first chunk does not compress well enough."""
+    writer = PayloadWriter(blob_store.open_upload(file_name, mime_type), mime_type)
+    try:
+        async for chunk in blob_store.open_download(blob_id):
+            await writer.write(chunk)
+            if writer.codec is None:
+                break
+        if writer.codec is None:
+            await writer.abort()
+            return None
+        await writer.close()
+    except BaseException:
+        await writer.abort()
+        raise
+    return writer
+
+async def _move_inline(db: AsyncIOMotorDatabase, material: dict, report: dict) -> None:
+    data = base64.b64decode(material.get("file_data") or "")
+    ref = await blob_refs.store(data, material.get("file_name") or "file", material.get("mime_type"))
+    result = await db.team_materials.update_one(
+        {"_id": material["_id"], "blob_id": None},
+        {"$set": {
+            "blob_id": ref["blob_id"], "content_hash": ref["_id"], "codec": ref.get("codec"),
+            "file_size": len(data)
+        }, "$unset": {"file_data": ""}}
+    )
+    if not result.modified_count:
+        # Changed since it was read
+        await blob_refs.release(ref["_id"], ref["blob_id"])
+        return
+    report["inline_moved"] += 1
+    report["bytes_before"] += len(material.get("file_data") or "")
+    report["bytes_after"] += await blob_refs.blob_store.size(ref["blob_id"])
+
+async def _recompress_blob(
+    db: AsyncIOMotorDatabase,
+    blob_store: BlobStore,
+    material: dict,
+    report: dict
+) -> None:
+    blob_id = material["blob_id"]
+    current = await db.team_materials.find_one({"_id": material["_id"]}, {"blob_id": 1, "codec": 1})
+    if current is None or current.get("codec") or current.get("blob_id") != blob_id:
+        # Deleted, or moved along with another material sharing its blob
+        return
+    digest = material.get("content_hash")
+    ref = await db.blob_refs.find_one({"_id": digest}) if digest else None
+    if ref is not None and ref["blob_id"] != blob_id:
+        ref = None
+    if ref is not None and ref.get("codec"):
+        # Rewritten already; only this material missed the update
+        await db.team_materials.update_one(
+            {"_id": material["_id"], "blob_id": blob_id},
+            {"$set": {"codec": ref["codec"]}}
+        )
+        return
+
+    try:
+        writer = await _copy_encoded(
+            blob_store, blob_id, material.get("file_name") or "file", material.get("mime_type")
+        )
+    except BlobNotFound:
+        report["missing"] += 1
+        return
+    if writer is None:
+        report["incompressible"] += 1
+        return
+
+    if ref is not None:
+        result = await db.blob_refs.update_one(
+            {"_id": digest, "blob_id": blob_id},
+            {"$set": {"blob_id": writer.blob_id, "codec": writer.codec}}
+        )
+        if not result.matched_count:
+            # Released or replaced meanwhile
+            await blob_store.delete(writer.blob_id)
+            return
+    update = {"$set": {"blob_id": writer.blob_id, "codec": writer.codec}}
+    result = await db.team_materials.update_many({"blob_id": blob_id}, update)
+    await db.media.update_many(
+        {"source_blob_id": blob_id},
+        {"$set": {"source_blob_id": writer.blob_id, "source_codec": writer.codec}}
+    )
+    try:
+        await blob_store.delete(blob_id)
+    except BlobNotFound:
+        pass
+    report["blobs_recompressed"] += 1
+    report["materials_updated"] += result.modified_count
+    report["bytes_before"] += writer.size
+    report["bytes_after"] += writer.stored_size
+
+async def _sample(blob_store: BlobStore, material: dict) -> Optional[str]:
+    if not material.get("blob_id"):
+        data = base64.b64decode(material.get("file_data") or "")
+        return choose_codec(material.get("mime_type"), data)
+    try:
+        async for chunk in blob_store.open_download(material["blob_id"]):
+            return choose_codec(material.get("mime_type"), chunk)
+    except BlobNotFound:
+        pass
+    return None
+
+async def recompress_materials(
+    db: AsyncIOMotorDatabase,
+    blob_store: BlobStore,
+    batch_size: int = 100,
+    dry_run: bool = False
+) -> dict:
+    """Visit every material stored without a codec. With dry_run only
+    count those whose sample would be compressed."""
+    report = {
+        "scanned": 0, "compressed_type": 0, "inline_moved": 0, "blobs_recompressed": 0,
+        "materials_updated": 0, "incompressible": 0, "missing": 0, "would_compress": 0,
+        "bytes_before": 0, "bytes_after": 0,
+    }
+    last_id = None
+    while True:
+        query = {"codec": None}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = await db.team_materials.find(query).sort("_id", 1).to_list(batch_size)
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+        for material in batch:
+            report["scanned"] += 1
+            if material.get("blob_id") and is_compressed_type(material.get("mime_type")):
+                report["compressed_type"] += 1
+            elif dry_run:
+                if await _sample(blob_store, material):
+                    report["would_compress"] += 1
+            elif material.get("blob_id"):
+                await _recompress_blob(db, blob_store, material, report)
+            else:
+                await _move_inline(db, material, report)
+        logger.info("Recompress: %d materials scanned", report["scanned"])
+    return report
+
+async def main() -> None:
+    from pathlib import Path
+    from dotenv import load_dotenv
+    from mongo import create_client
+    from settings import Settings
+    from storage import create_blob_store
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be compressed")
+    args = parser.parse_args()
+
+    load_dotenv(Path(__file__).parent / '.env')
+    settings = Settings.from_env()
+    client = create_client(settings.mongo_url, event_listeners=[])
+    try:
+        db = client[settings.db_name]
+        blob_store = create_blob_store(db)
+        blob_refs.bind(db, blob_store)
+        report = await recompress_materials(db, blob_store, args.batch_size, args.dry_run)
+    finally:
+        client.close()
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
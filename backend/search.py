@@ -0,0 +1,506 @@
+import asyncio
+import base64
+import binascii
+import bisect
+import json
+import logging
+import math
+import os
+import re
+import time
+import unicodedata
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from fastapi import HTTPException, status
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from cache import get_invalidation_bus
+from jobs import job_queue
+
+logger = logging.getLogger(__name__)
+
+# Incremental refresh picks up documents written by other workers or
+# scripts; a periodic full rebuild also drops ones removed out of band
+SEARCH_REFRESH_SECONDS = float(os.environ.get("SEARCH_REFRESH_SECONDS", "60"))
+SEARCH_REBUILD_SECONDS = float(os.environ.get("SEARCH_REBUILD_SECONDS", "3600"))
+
+# Field weights applied to term frequencies
+COURSE_FIELDS = {"title": 3.0, "category": 2.0, "level": 1.0, "description": 1.0}
+MATERIAL_FIELDS = {"title": 3.0, "tags": 2.0, "description": 1.0}
+FACET_FIELDS = ("kind", "category", "level", "material_type")
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# A typeahead prefix expands to at most this many indexed terms
+MAX_PREFIX_EXPANSIONS = 64
+PREFIX_WEIGHT = 0.7
+SNIPPET_LENGTH = 200
+
+# Already folded, as produced by normalize()
+STOP_WORDS = {
+    "ve", "ile", "bir", "bu", "su", "icin", "da", "de", "mi", "mu",
+    "the", "and", "of", "to", "a", "in",
+}
+
+# Turkish casing (I -> ı, İ -> i) and then folding of Turkish letters, so
+# "muzik", "Müzik" and "MÜZİK" all match. Other accents go through NFKD.
+_TURKISH_LOWER = str.maketrans({"I": "ı", "İ": "i"})
+_FOLD = str.maketrans("çğıöşüâîû", "cgiosuaiu")
+_TOKEN = re.compile(r"\w+")
+
+def normalize(text: str) -> str:
+    text = text.translate(_TURKISH_LOWER).lower().translate(_FOLD)
+    if text.isascii():
+        return text
+    text = unicodedata.normalize("NFKD", text)
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+def tokenize(text: Optional[str]) -> List[str]:
+    if not text:
+        return []
+    return [token for token in _TOKEN.findall(normalize(text)) if token not in STOP_WORDS]
+
+def encode_search_cursor(score: float, key: str) -> str:
+    raw = json.dumps([score, key]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_search_cursor(cursor: str) -> Tuple[float, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        score, key = json.loads(raw)
+        return float(score), str(key)
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+def _iso(value) -> Optional[str]:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def _course_summary(doc: dict) -> dict:
+    return {
+        "kind": "course",
+        "id": doc["id"],
+        "title": doc.get("title"),
+        "description": (doc.get("description") or "")[:SNIPPET_LENGTH],
+        "category": doc.get("category"),
+        "level": doc.get("level"),
+        "duration": doc.get("duration"),
+        "image_url": doc.get("image_url"),
+        "instructor_team_id": doc.get("instructor_team_id"),
+        "created_at": _iso(doc.get("created_at")),
+    }
+
+def _material_summary(doc: dict) -> dict:
+    return {
+        "kind": "material",
+        "id": doc["id"],
+        "title": doc.get("title"),
+        "description": (doc.get("description") or "")[:SNIPPET_LENGTH],
+        "material_type": getattr(doc.get("material_type"), "value", doc.get("material_type")),
+        "tags": doc.get("tags") or [],
+        "team_id": doc.get("team_id"),
+        "file_name": doc.get("file_name"),
+        "file_size": doc.get("file_size"),
+        "mime_type": doc.get("mime_type"),
+        "created_at": _iso(doc.get("created_at")),
+    }
+
+class SearchIndex:
+    """In-memory inverted index over courses and public materials.
+
+    Documents are numbered internally. Postings map term -> {doc number:
+    BM25 term impact}, computed when the document is added, so a query only
+    multiplies in idf and the prefix weight. A sorted term list serves
+    prefix queries, and per-facet-value doc sets serve filters and facet
+    counts through C-level set operations.
+    """
+
+    def __init__(self):
+        self._keys: Dict[str, int] = {}  # "course:<id>" -> doc number
+        self._doc_keys: Dict[int, str] = {}
+        self._docs: Dict[int, dict] = {}  # doc number -> summary
+        self._doc_terms: Dict[int, List[str]] = {}
+        self._doc_lengths: Dict[int, float] = {}
+        self._doc_times: Dict[int, float] = {}
+        self._newest: List[Tuple[float, str]] = []  # sorted (created_at, key)
+        self._total_length = 0.0
+        self._postings: Dict[str, Dict[int, float]] = {}
+        self._terms: List[str] = []  # sorted, for prefix lookups
+        self._facets: Dict[Tuple[str, str], Set[int]] = {}
+        self._tags: Dict[str, Set[int]] = {}
+        self._next_doc = 0
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def add(self, kind: str, doc: dict) -> None:
+        """Index a course or material, replacing an earlier version."""
+        key = f"{kind}:{doc['id']}"
+        self.remove(key)
+
+        if kind == "course":
+            summary, fields = _course_summary(doc), COURSE_FIELDS
+        else:
+            summary, fields = _material_summary(doc), MATERIAL_FIELDS
+        frequencies: Dict[str, float] = {}
+        for field, weight in fields.items():
+            value = doc.get(field)
+            text = " ".join(value) if isinstance(value, list) else value
+            for token in tokenize(text):
+                frequencies[token] = frequencies.get(token, 0.0) + weight
+
+        number = self._next_doc
+        self._next_doc += 1
+        self._keys[key] = number
+        self._doc_keys[number] = key
+        self._docs[number] = summary
+        self._doc_terms[number] = list(frequencies)
+        created_at = doc.get("created_at")
+        self._doc_times[number] = created_at.timestamp() if isinstance(created_at, datetime) else 0.0
+        bisect.insort(self._newest, (self._doc_times[number], key))
+        length = sum(frequencies.values())
+        self._doc_lengths[number] = length
+        self._total_length += length
+
+        # Uses the average length as of now; rebuilds even out the drift
+        average_length = self._total_length / len(self._docs) or 1.0
+        norm = K1 * (1 - B + B * length / average_length)
+        for term, frequency in frequencies.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                bisect.insort(self._terms, term)
+            postings[number] = frequency * (K1 + 1) / (frequency + norm)
+        for field in FACET_FIELDS:
+            if summary.get(field) is not None:
+                self._facets.setdefault((field, str(summary[field])), set()).add(number)
+        for tag in summary.get("tags", ()):
+            self._tags.setdefault(normalize(tag), set()).add(number)
+
+    def remove(self, key: str) -> bool:
+        number = self._keys.pop(key, None)
+        if number is None:
+            return False
+        del self._doc_keys[number]
+        summary = self._docs.pop(number)
+        self._total_length -= self._doc_lengths.pop(number)
+        newest = (self._doc_times.pop(number), key)
+        del self._newest[bisect.bisect_left(self._newest, newest)]
+        for term in self._doc_terms.pop(number):
+            postings = self._postings[term]
+            del postings[number]
+            if not postings:
+                del self._postings[term]
+                del self._terms[bisect.bisect_left(self._terms, term)]
+        for field in FACET_FIELDS:
+            if summary.get(field) is not None:
+                self._discard(self._facets, (field, str(summary[field])), number)
+        for tag in summary.get("tags", ()):
+            self._discard(self._tags, normalize(tag), number)
+        return True
+
+    @staticmethod
+    def _discard(sets: dict, key, number: int) -> None:
+        members = sets.get(key)
+        if members is not None:
+            members.discard(number)
+            if not members:
+                del sets[key]
+
+    def _match(self, token: str, prefix: bool) -> Tuple[Dict[int, float], Optional[Set[int]]]:
+        """Impacts for the documents a query token matches.
+
+        Returns (impacts, exact). When exact is not None, documents outside
+        it only matched a longer term and are weighted down.
+        """
+        if not prefix:
+            return self._postings.get(token, {}), None
+        start = bisect.bisect_left(self._terms, token)
+        terms = []
+        for term in self._terms[start:start + MAX_PREFIX_EXPANSIONS]:
+            if not term.startswith(token):
+                break
+            terms.append(term)
+        if not terms:
+            return {}, None
+        if terms == [token]:
+            return self._postings[token], None
+
+        merged: Dict[int, float] = {}
+        for term in terms[::-1]:
+            # The exact term sorts first and so is merged last, winning ties
+            merged.update(self._postings[term])
+        exact = set(self._postings[token]) if terms[0] == token else set()
+        return merged, exact
+
+    def _top(
+        self,
+        numbers: Set[int],
+        values: Dict[int, float],
+        scale: float,
+        after: Optional[Tuple[float, str]],
+        count: int
+    ) -> List[Tuple[float, str]]:
+        """The best `count` (scale * value, key) pairs below `after`.
+
+        Sorting doc numbers with a C-level key and walking down from the
+        cursor avoids building a tuple per matched document.
+        """
+        keys = self._doc_keys
+        ordered = sorted(numbers, key=values.__getitem__)
+        end = len(ordered)
+        if after is not None:
+            # Slightly above the cursor's value, to keep ties and rounding
+            threshold = after[0] / scale if scale else float("inf")
+            end = bisect.bisect_right(ordered, threshold * (1 + 1e-9) + 1e-12, key=values.__getitem__)
+        top: List[Tuple[float, str]] = []
+        for number in reversed(ordered[:end]):
+            item = (scale * values[number], keys[number])
+            if after is not None and item >= after:
+                continue
+            # Keep going through ties so the key order is applied correctly
+            if len(top) >= count and item[0] < top[-1][0]:
+                break
+            top.append(item)
+        return top
+
+    def search(
+        self,
+        query: str,
+        filters: Dict[str, str],
+        tags: Iterable[str] = (),
+        limit: int = 20,
+        after: Optional[Tuple[float, str]] = None,
+        prefix: bool = True
+    ) -> Tuple[List[dict], Dict[str, Dict[str, int]], int, Optional[Tuple[float, str]]]:
+        """Ranked search.
+
+        Every query token must match; the last one also matches as a prefix
+        unless `prefix` is false. Returns (results, facets, total, next),
+        where next is the (score, key) to pass as `after` for the next page.
+        Without query tokens, results are the newest matching documents.
+        """
+        tokens = tokenize(query)
+        candidates: Optional[Set[int]] = None
+        for (field, value) in filters.items():
+            members = self._facets.get((field, value), set())
+            candidates = members if candidates is None else candidates & members
+        for tag in tags:
+            members = self._tags.get(normalize(tag), set())
+            candidates = members if candidates is None else candidates & members
+
+        total_docs = len(self._docs)
+        matches = []
+        for position, token in enumerate(tokens):
+            impacts, exact = self._match(token, prefix and position == len(tokens) - 1)
+            if not impacts:
+                return [], {}, 0, None
+            idf = math.log(1 + (total_docs - len(impacts) + 0.5) / (len(impacts) + 0.5))
+            matches.append((idf, impacts, exact))
+
+        # None stands for every document
+        matched: Optional[Set[int]] = candidates
+        if matches:
+            matches.sort(key=lambda match: len(match[1]))
+            matched = set(matches[0][1]) if candidates is None else candidates.intersection(matches[0][1])
+            for _, impacts, _ in matches[1:]:
+                matched.intersection_update(impacts.keys())
+
+        facets: Dict[str, Dict[str, int]] = {}
+        for (field, value), members in self._facets.items():
+            count = len(members) if matched is None else len(matched.intersection(members))
+            if count:
+                facets.setdefault(field, {})[value] = count
+        total = total_docs if matched is None else len(matched)
+
+        # Ordered by (score, key) descending; the cursor is the last pair seen
+        after = tuple(after) if after is not None else None
+        if len(matches) == 1:
+            idf, impacts, exact = matches[0]
+            if exact is None:
+                top = self._top(matched, impacts, idf, after, limit + 1)
+            else:
+                top = self._top(matched & exact, impacts, idf, after, limit + 1)
+                top += self._top(matched - exact, impacts, idf * PREFIX_WEIGHT, after, limit + 1)
+        elif matches:
+            keys = self._doc_keys
+            top = []
+            for number in matched:
+                score = 0.0
+                for idf, impacts, exact in matches:
+                    impact = idf * impacts[number]
+                    score += impact if exact is None or number in exact else impact * PREFIX_WEIGHT
+                if after is None or (score, keys[number]) < after:
+                    top.append((score, keys[number]))
+        elif matched is None:
+            # Browsing everything: the newest list is already in order
+            end = len(self._newest) if after is None else bisect.bisect_left(self._newest, after)
+            top = self._newest[max(0, end - limit - 1):end]
+        else:
+            top = self._top(matched, self._doc_times, 1.0, after, limit + 1)
+        top.sort(reverse=True)
+        top = top[:limit + 1]
+
+        next_after = None
+        if len(top) > limit:
+            top = top[:limit]
+            next_after = top[-1]
+        docs = self._docs
+        results = [
+            {**docs[self._keys[key]], "score": round(score, 4) if matches else None}
+            for score, key in top
+        ]
+        return results, facets, total, next_after
+
+    def stats(self) -> dict:
+        return {"documents": len(self._docs), "terms": len(self._postings)}
+
+class CatalogSearch:
+    """Keeps a SearchIndex in step with the database.
+
+    The index is built in the background at startup and refreshed
+    incrementally from updated_at. Writes through the API update it
+    immediately; removals are also sent over the cache invalidation bus
+    (as cache "search") so other workers drop the document too.
+    """
+
+    name = "search"
+
+    def __init__(self):
+        self.index = SearchIndex()
+        self.db: Optional[AsyncIOMotorDatabase] = None
+        self.ready = False
+        self.last_sync: Optional[datetime] = None
+        self.last_rebuild_seconds = 0.0
+        self.queries = 0
+        self.query_seconds = 0.0
+        self._task: Optional[asyncio.Task] = None
+        # Removals seen while a rebuild is loading, replayed on the new index
+        self._removed_during_rebuild: Optional[Set[str]] = None
+        get_invalidation_bus().subscribe(self)
+
+    def bind(self, db: AsyncIOMotorDatabase) -> None:
+        self.db = db
+
+    async def _load(self, index: SearchIndex, since: Optional[datetime]) -> None:
+        query = {"updated_at": {"$gt": since}} if since else {}
+        loaded = 0
+        async for course in self.db.courses.find(query, {"_id": 0, "content": 0}):
+            index.add("course", course)
+            loaded += 1
+            if loaded % 500 == 0:
+                # Indexing is CPU work; let requests run between chunks
+                await asyncio.sleep(0)
+        material_query = dict(query) if since else {"is_public": True}
+        async for material in self.db.team_materials.find(material_query, {"_id": 0, "file_data": 0}):
+            if material.get("is_public"):
+                index.add("material", material)
+            else:
+                index.remove(f"material:{material['id']}")
+            loaded += 1
+            if loaded % 500 == 0:
+                await asyncio.sleep(0)
+
+    async def rebuild(self) -> None:
+        """Build a fresh index and swap it in; searches use the old one meanwhile."""
+        started = time.perf_counter()
+        sync_started = datetime.utcnow()
+        index = SearchIndex()
+        self._removed_during_rebuild = set()
+        try:
+            await self._load(index, None)
+            for key in self._removed_during_rebuild:
+                index.remove(key)
+        finally:
+            self._removed_during_rebuild = None
+        self.index = index
+        self.last_sync = sync_started
+        self.ready = True
+        self.last_rebuild_seconds = time.perf_counter() - started
+        logger.info(
+            "Search index built: %d documents in %.2fs", len(index), self.last_rebuild_seconds
+        )
+
+    async def refresh(self) -> None:
+        """Index documents changed since the last sync."""
+        sync_started = datetime.utcnow()
+        # Overlap a little to allow for clock skew between writers
+        await self._load(self.index, self.last_sync - timedelta(seconds=5))
+        self.last_sync = sync_started
+
+    async def _run(self) -> None:
+        last_rebuild = 0.0
+        while True:
+            try:
+                if not self.ready or time.monotonic() - last_rebuild >= SEARCH_REBUILD_SECONDS:
+                    await self.rebuild()
+                    last_rebuild = time.monotonic()
+                else:
+                    await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Search index refresh failed")
+            await asyncio.sleep(SEARCH_REFRESH_SECONDS)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def material_saved(self, material: dict) -> None:
+        """Index a material written by this process."""
+        if material.get("is_public"):
+            self.index.add("material", material)
+        else:
+            self.index.remove(f"material:{material['id']}")
+
+    async def material_deleted(self, material_id: str) -> None:
+        await get_invalidation_bus().publish(self.name, f"material:{material_id}")
+
+    async def request_rebuild(self, payload: Optional[dict] = None) -> None:
+        """Job handler for "reindex_search": every process rebuilds its index
+        on its next refresh."""
+        await get_invalidation_bus().publish(self.name, None)
+
+    def _drop(self, key: Optional[str]) -> None:
+        """Invalidation bus hook. None asks for a rebuild on the next refresh."""
+        if key is None:
+            self.ready = False
+        else:
+            self.index.remove(key)
+            if self._removed_during_rebuild is not None:
+                self._removed_during_rebuild.add(key)
+
+    def search(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self.index.search(*args, **kwargs)
+        finally:
+            self.queries += 1
+            self.query_seconds += time.perf_counter() - started
+
+    def stats(self) -> dict:
+        return {
+            **self.index.stats(),
+            "ready": int(self.ready),
+            "queries": self.queries,
+            "query_seconds_total": self.query_seconds,
+            "last_rebuild_seconds": self.last_rebuild_seconds,
+        }
+
+catalog_search = CatalogSearch()
+job_queue.register("reindex_search", catalog_search.request_rebuild)
@@ -0,0 +1,95 @@
+import json
+from datetime import date, datetime
+from enum import Enum
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Type
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, the json module is the slower fallback
+    orjson = None
+
+def _default(value: Any) -> Any:
+    """Types neither encoder handles natively (orjson does datetime and enums)."""
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    # ObjectId and friends
+    return str(value)
+
+def dumps(content: Any) -> bytes:
+    """Compact UTF-8 JSON, the same bytes JSONResponse would send."""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        content, default=_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+def loads(data: bytes) -> Any:
+    # Both raise a ValueError subclass on bad input
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+class FastJSONResponse(JSONResponse):
+    """The app's default response class: orjson when installed."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+# Per model: (field name, default, default factory, nested model)
+_FieldPlan = List[Tuple[str, Any, Any, Optional[Type[BaseModel]]]]
+_plans: Dict[Type[BaseModel], _FieldPlan] = {}
+
+def _is_constant_factory(factory: Any) -> bool:
+    # Empty containers and sub-models built from their own defaults
+    return factory in (list, dict, set) or (isinstance(factory, type) and issubclass(factory, BaseModel))
+
+def _plan(model: Type[BaseModel]) -> _FieldPlan:
+    plan = _plans.get(model)
+    if plan is None:
+        plan = []
+        for name, field in model.model_fields.items():
+            nested = field.annotation
+            if not (isinstance(nested, type) and issubclass(nested, BaseModel)):
+                nested = None
+            default = None if field.is_required() else field.default
+            factory = field.default_factory
+            if not _is_constant_factory(factory):
+                # Fresh ids and timestamps would differ on every response
+                factory = None
+            plan.append((name, default, factory, nested))
+        _plans[model] = plan
+    return plan
+
+def trusted_dump(model: Type[BaseModel], doc: dict) -> dict:
+    """What model(**doc).dict() returns, without validating anything.
+
+    Only for documents this app wrote through the same model, where
+    validation cannot fail: missing fields get their defaults, unknown
+    keys are dropped and nested models are filled in the same way. Unlike
+    the model, it does not make up ids or timestamps for documents
+    missing them; those fields come out as None.
+    """
+    out = {}
+    for name, default, factory, nested in _plan(model):
+        if name in doc:
+            value = doc[name]
+            if nested is not None and isinstance(value, dict):
+                value = trusted_dump(nested, value)
+        elif factory is not None:
+            value = factory()
+            if isinstance(value, BaseModel):
+                value = value.dict()
+        else:
+            value = default
+        out[name] = value
+    return out
+
+def trusted_dump_many(model: Type[BaseModel], docs: Iterable[dict]) -> List[dict]:
+    return [trusted_dump(model, doc) for doc in docs]
@@ -1,30 +1,44 @@
-from fastapi import FastAPI, APIRouter, HTTPException, status
+from fastapi import FastAPI, APIRouter, HTTPException, status, Depends, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from motor.motor_asyncio import AsyncIOMotorDatabase
+import asyncio
+import time
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
-import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List
+from pymongo.errors import PyMongoError
+from typing import List, Literal, Optional
 import uuid
-from datetime import datetime
+from datetime import datetime, timezone
 
 # Import team routes
 from team_routes import router as team_router
+from admin_routes import router as admin_router
+from dependencies import get_blob_store, get_catalog_db, get_db
+from settings import Settings
+from metrics import MetricsMiddleware, add_stats_collector, metrics_endpoint, mongo_listener
+from pagination import PageParams, fetch_page, set_next_cursor, projected_response
+from serialization import FastJSONResponse, trusted_dump, trusted_dump_many
+from status_writer import (
+    MAX_ROLLUP_BUCKETS, ROLLUP_UNITS, StatusBufferFull, rollup, status_writer
+)
+from indexes import missing_required_indexes, prepare_database
+from http_cache import ConditionalGetMiddleware
+from compression import CompressionMiddleware
+from auth import get_optional_team, password_pool, token_cache, token_revocations
+from cache import cache_stats
+from search import catalog_search, decode_search_cursor, encode_search_cursor
+from mongo import (
+    MONGO_READY_TIMEOUT_SECONDS, catalog_database, create_client, ping, pool_listener, warm_up
+)
 
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
-
-# Create the main app without a prefix
-app = FastAPI()
-
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
@@ -47,109 +61,422 @@ async def root():
 async def create_status_check(input: StatusCheckCreate):
     status_dict = input.dict()
     status_obj = StatusCheck(**status_dict)
-    _ = await db.status_checks.insert_one(status_obj.dict())
+    # Batched with concurrent check-ins into one insert_many
+    try:
+        await status_writer.write(status_obj.dict())
+    except StatusBufferFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many status checks, try again shortly",
+            headers={"Retry-After": "1"}
+        )
+    except PyMongoError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Could not store the status check"
+        )
     return status_obj
 
 @api_router.get("/status", response_model=List[StatusCheck])
-async def get_status_checks():
-    status_checks = await db.status_checks.find().to_list(1000)
+async def get_status_checks(
+    request: Request,
+    response: Response,
+    client_name: Optional[str] = None,
+    page: PageParams = Depends(),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    query = {"client_name": client_name} if client_name else {}
+    projection = page.projection(StatusCheck.model_fields, always=["id", "timestamp"])
+    status_checks, next_cursor = await fetch_page(
+        db.status_checks, query, page, projection, sort_field="timestamp"
+    )
+    if page.fields:
+        return projected_response(status_checks, request, next_cursor)
+    
+    set_next_cursor(response, request, next_cursor)
     return [StatusCheck(**status_check) for status_check in status_checks]
 
+# Check-ins per client per minute or hour
+@api_router.get("/status/rollup")
+async def get_status_rollup(
+    granularity: Literal["minute", "hour"] = "minute",
+    client_name: Optional[str] = None,
+    since: Optional[datetime] = Query(None, description="Defaults to 60 buckets before until"),
+    until: Optional[datetime] = Query(None, description="Defaults to now"),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    unit = ROLLUP_UNITS[granularity]
+    until = _naive_utc(until) if until else datetime.utcnow()
+    since = _naive_utc(since) if since else until - 60 * unit
+    if since >= until:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="since must be before until"
+        )
+    if (until - since) / unit > MAX_ROLLUP_BUCKETS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Range too long for {granularity} buckets, use hour or a shorter range"
+        )
+    clients = await rollup(db.status_checks, granularity, since, until, client_name)
+    return {"granularity": granularity, "since": since, "until": until, "clients": clients}
+
+def _naive_utc(value: datetime) -> datetime:
+    # Stored timestamps are naive UTC
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
 # Import models for courses
-from models import Course, TeamProfile
+from models import Course, TeamMaterial, MaterialType
+from enrichment import enrich_courses, enrich_materials
+from cache import course_cache, public_material_cache
+from http_cache import RenderedJSON, conditional_response, etag_matches, latest_update
+from images import (
+    FALLBACK_CACHE_CONTROL, FORMATS, MEDIA_CACHE_CONTROL, PRIVATE_MEDIA_CACHE_CONTROL, VARIANTS,
+    derivative_blob_id, is_digest, media_pipeline, sniff_safe_image_type
+)
+from storage import BlobNotFound, BlobStore, create_blob_store
+from bundles import BUNDLE_MAX_BYTES, BUNDLE_MAX_FILES, stream_bundle
+from payload_codecs import read_payload
+from blob_refs import blob_refs
+from jobs import job_queue
+from notifications import notifier
+from events import event_broker
+from ratelimit import (
+    AdmissionControlMiddleware, MongoRateLimitBackend, admission_controller,
+    get_rate_limit_backend, rate_limit_stats
+)
 
 # Get all courses with team information
 @api_router.get("/courses")
-async def get_all_courses():
-    courses = await db.courses.find().to_list(1000)
+async def get_all_courses(
+    request: Request,
+    category: Optional[str] = None,
+    level: Optional[str] = None,
+    instructor_team_id: Optional[str] = None,
+    page: PageParams = Depends(),
+    catalog_db: AsyncIOMotorDatabase = Depends(get_catalog_db)
+):
+    query = {}
+    if category:
+        query["category"] = category
+    if level:
+        query["level"] = level
+    if instructor_team_id:
+        query["instructor_team_id"] = instructor_team_id
     
-    # Enrich courses with team information
-    enriched_courses = []
-    for course in courses:
-        course_obj = Course(**course)
-        
-        # Get instructor team info if available
-        instructor_team = None
-        if course_obj.instructor_team_id:
-            team_doc = await db.teams.find_one({"id": course_obj.instructor_team_id})
-            if team_doc:
-                team_doc.pop("password_hash", None)
-                instructor_team = TeamProfile(**team_doc)
+    projection = page.projection(
+        [*Course.model_fields, "instructor_team"],
+        always=["id", "created_at", "instructor_team_id"]
+    )
+    
+    async def load_courses():
+        courses, next_cursor = await fetch_page(catalog_db.courses, query, page, projection)
+        if not page.fields:
+            # Written by this app: fill defaults, skip re-validating
+            courses = trusted_dump_many(Course, courses)
         
-        enriched_courses.append({
-            **course_obj.dict(),
-            "instructor_team": instructor_team.dict() if instructor_team else None
-        })
+        # Enrich courses with team information in one batched lookup
+        if page.wants("instructor_team"):
+            courses = await enrich_courses(catalog_db, courses)
+        return RenderedJSON(courses, latest_update(courses)), next_cursor
     
-    return enriched_courses
+    rendered, next_cursor = await course_cache.get_or_load(
+        ("list", category, level, instructor_team_id, page.cache_key()), load_courses
+    )
+    response = await conditional_response(request, rendered)
+    set_next_cursor(response, request, next_cursor)
+    return response
 
 # Get single course with team information
 @api_router.get("/courses/{course_id}")
-async def get_course(course_id: str):
-    course = await db.courses.find_one({"id": course_id})
-    if not course:
+async def get_course(
+    request: Request,
+    course_id: str,
+    catalog_db: AsyncIOMotorDatabase = Depends(get_catalog_db)
+):
+    async def load_course():
+        course = await catalog_db.courses.find_one({"id": course_id}, {"_id": 0})
+        if not course:
+            return None
+        enriched = await enrich_courses(catalog_db, [trusted_dump(Course, course)])
+        return RenderedJSON(enriched[0], latest_update(enriched))
+    
+    rendered = await course_cache.get_or_load(("detail", course_id), load_course)
+    if not rendered:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Course not found"
         )
     
-    course_obj = Course(**course)
-    
-    # Get instructor team info
-    instructor_team = None
-    if course_obj.instructor_team_id:
-        team_doc = await db.teams.find_one({"id": course_obj.instructor_team_id})
-        if team_doc:
-            team_doc.pop("password_hash", None)
-            instructor_team = TeamProfile(**team_doc)
-    
-    return {
-        **course_obj.dict(),
-        "instructor_team": instructor_team.dict() if instructor_team else None
-    }
+    return await conditional_response(request, rendered)
 
 # Get public materials (materials marked as public)
 @api_router.get("/materials/public")
-async def get_public_materials():
-    materials = await db.team_materials.find({"is_public": True}).to_list(1000)
-    
-    # Enrich with team information
-    enriched_materials = []
-    for material in materials:
-        team_doc = await db.teams.find_one({"id": material["team_id"]})
-        team_info = None
-        if team_doc:
-            team_doc.pop("password_hash", None)
-            team_info = {
-                "team_name": team_doc.get("team_name"),
-                "logo_url": team_doc.get("logo_url"),
-                "social_media": team_doc.get("social_media", {})
-            }
+async def get_public_materials(
+    request: Request,
+    material_type: Optional[MaterialType] = None,
+    tags: Optional[List[str]] = Query(None),
+    team_id: Optional[str] = None,
+    page: PageParams = Depends(),
+    catalog_db: AsyncIOMotorDatabase = Depends(get_catalog_db)
+):
+    query = {"is_public": True}
+    if material_type:
+        query["material_type"] = material_type.value
+    if tags:
+        query["tags"] = {"$all": tags}
+    if team_id:
+        query["team_id"] = team_id
+    
+    projection = page.projection(
+        [*TeamMaterial.model_fields, "team_info"],
+        always=["id", "created_at", "team_id"],
+        exclude=["file_data"]
+    )
+    
+    async def load_materials():
+        materials, next_cursor = await fetch_page(catalog_db.team_materials, query, page, projection)
         
-        enriched_materials.append({
-            **material,
-            "team_info": team_info
-        })
+        # Enrich with team information in one batched lookup
+        if page.wants("team_info"):
+            materials = await enrich_materials(catalog_db, materials)
+        return RenderedJSON(materials, latest_update(materials)), next_cursor
+    
+    rendered, next_cursor = await public_material_cache.get_or_load(
+        (material_type, tuple(tags or ()), team_id, page.cache_key()), load_materials
+    )
+    response = await conditional_response(request, rendered)
+    set_next_cursor(response, request, next_cursor)
+    return response
+
+# Download many materials as one ZIP archive
+@api_router.get("/materials/bundle")
+async def download_material_bundle(
+    ids: Optional[List[str]] = Query(None),
+    team_id: Optional[str] = None,
+    material_type: Optional[List[MaterialType]] = Query(None),
+    tags: Optional[List[str]] = Query(None),
+    current_team: Optional[dict] = Depends(get_optional_team),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    blob_store: BlobStore = Depends(get_blob_store)
+):
+    if not (ids or team_id or material_type or tags):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Choose materials by ids, team_id, material_type or tags"
+        )
+    
+    # Public materials, plus the caller's own private ones
+    visible = [{"is_public": True}]
+    if current_team:
+        visible.append({"team_id": current_team["team_id"]})
+    query = {"$or": visible}
+    if ids:
+        query["id"] = {"$in": ids}
+    if team_id:
+        query["team_id"] = team_id
+    if material_type:
+        query["material_type"] = {"$in": [value.value for value in material_type]}
+    if tags:
+        query["tags"] = {"$all": tags}
+    
+    # Metadata only; the files are read one at a time while streaming
+    projection = {
+        "_id": 0, "id": 1, "blob_id": 1, "file_name": 1, "file_size": 1,
+        "mime_type": 1, "codec": 1, "created_at": 1, "updated_at": 1
+    }
+    materials = await db.team_materials.find(query, projection) \
+        .sort("created_at", 1).to_list(BUNDLE_MAX_FILES + 1)
+    if not materials:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No materials found"
+        )
+    if len(materials) > BUNDLE_MAX_FILES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"More than {BUNDLE_MAX_FILES} materials match, narrow the selection"
+        )
+    if sum(material.get("file_size") or 0 for material in materials) > BUNDLE_MAX_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Bundle would exceed {BUNDLE_MAX_BYTES // (1024 * 1024)}MB, narrow the selection"
+        )
+    if ids:
+        # In the order they were asked for
+        order = {material_id: index for index, material_id in enumerate(ids)}
+        materials.sort(key=lambda material: order[material["id"]])
     
-    return enriched_materials
+    filename = f"materials-{datetime.utcnow():%Y%m%d-%H%M%S}.zip"
+    return StreamingResponse(
+        stream_bundle(materials, db.team_materials, blob_store),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
 
-# Include the router in the main app
-app.include_router(api_router)
+# Ranked search over courses and public materials
+@api_router.get("/search")
+async def search_catalog(
+    request: Request,
+    q: Optional[str] = Query(None, max_length=200),
+    kind: Optional[Literal["course", "material"]] = None,
+    category: Optional[str] = None,
+    level: Optional[str] = None,
+    material_type: Optional[MaterialType] = None,
+    tags: Optional[List[str]] = Query(None),
+    prefix: bool = Query(True, description="Match the last word as a prefix (typeahead)"),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from X-Next-Cursor")
+):
+    filters = {"kind": kind, "category": category, "level": level,
+               "material_type": material_type.value if material_type else None}
+    results, facets, total, next_after = catalog_search.search(
+        q or "",
+        {field: value for field, value in filters.items() if value},
+        tags=tags or (),
+        limit=limit,
+        after=decode_search_cursor(cursor) if cursor else None,
+        prefix=prefix
+    )
+    
+    response = FastJSONResponse({"results": results, "facets": facets, "total": total})
+    set_next_cursor(response, request, encode_search_cursor(*next_after) if next_after else None)
+    return response
 
-# Set up database for team routes
-import team_routes
-team_routes.db_instance = db
+# Resized logos and image thumbnails, addressed by the hash of their source
+@api_router.get("/media/{digest}/{name}")
+async def get_media(
+    request: Request,
+    digest: str,
+    name: str,
+    current_team: Optional[dict] = Depends(get_optional_team)
+):
+    variant, _, fmt = name.partition(".")
+    if not is_digest(digest) or variant not in VARIANTS or fmt not in FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Media not found"
+        )
+    
+    # Logos and public materials only, or the caller's own private ones
+    visibility = await media_pipeline.visibility(digest, current_team["team_id"] if current_team else None)
+    if visibility is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Media not found"
+        )
+    
+    cache_control = MEDIA_CACHE_CONTROL if visibility == "public" else PRIVATE_MEDIA_CACHE_CONTROL
+    etag = f'"{digest[:32]}-{name}"'
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED,
+                        headers={"ETag": etag, "Cache-Control": cache_control})
+    
+    blob_store = media_pipeline.blob_store
+    blob_id = derivative_blob_id(digest, variant, fmt)
+    content_type = FORMATS[fmt][1]
+    try:
+        data = await blob_store.read(blob_id)
+    except BlobNotFound:
+        # Not rendered yet (or Pillow is missing): render now, or fall back
+        # to the original with a short cache lifetime
+        media = await media_pipeline.ensure(digest)
+        if media is None or media["status"] == "failed":
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Media not found"
+            )
+        try:
+            if media["status"] == "ready":
+                data = await blob_store.read(blob_id)
+            else:
+                data = await read_payload(blob_store, media["source_blob_id"], media.get("source_codec"))
+                # Only plain raster images, typed by their bytes; never the
+                # uploaded content type
+                content_type = sniff_safe_image_type(data)
+                if content_type is None:
+                    raise BlobNotFound(media["source_blob_id"])
+                if visibility == "public":
+                    cache_control = FALLBACK_CACHE_CONTROL
+        except BlobNotFound:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Media not found"
+            )
+    
+    return Response(data, media_type=content_type, headers={
+        "ETag": etag,
+        "Cache-Control": cache_control,
+        "X-Content-Type-Options": "nosniff",
+    })
 
-# Include team router
-app.include_router(team_router)
+# Prometheus metrics, including the in-process caches and auth pools
+add_stats_collector("cache", cache_stats, label="cache")
+add_stats_collector("token_cache", token_cache.stats)
+add_stats_collector("password_pool", password_pool.stats)
+add_stats_collector("search_index", catalog_search.stats)
+add_stats_collector("media_pipeline", media_pipeline.stats)
+add_stats_collector("blob_refs", blob_refs.stats)
+add_stats_collector("jobs", job_queue.stats)
+add_stats_collector("notifications", notifier.stats)
+add_stats_collector("events", event_broker.stats)
+add_stats_collector("mongo_pool", pool_listener.stats)
+add_stats_collector("rate_limits", rate_limit_stats)
+add_stats_collector("admission", admission_controller.stats)
+add_stats_collector("status_writer", status_writer.stats)
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+STARTED_AT = time.monotonic()
+
+# Seconds spent in each startup step of the last app started, for /healthz
+# and /metrics
+startup_seconds = {}
+add_stats_collector("startup", lambda: {f"{step}_seconds": value for step, value in startup_seconds.items()})
+
+ops_router = APIRouter(include_in_schema=False)
+
+# Liveness: the process is serving; does not touch Mongo
+@ops_router.get("/healthz")
+async def healthz():
+    return {
+        "status": "ok",
+        "uptime_seconds": round(time.monotonic() - STARTED_AT, 1),
+        "startup_seconds": startup_seconds,
+        "mongo_pool": pool_listener.stats(),
+    }
+
+# Readiness: startup finished, Mongo answers in time and the indexes
+# registration relies on exist
+@ops_router.get("/readyz")
+async def readyz(request: Request):
+    state = request.app.state
+    body = {"status": "ready", "mongo_pool": pool_listener.stats()}
+    if not state.ready:
+        body["status"] = "starting"
+        return JSONResponse(body, status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+    try:
+        body["ping_ms"] = round(await asyncio.wait_for(ping(state.db), MONGO_READY_TIMEOUT_SECONDS), 2)
+        if state.catalog_db is not state.db:
+            body["catalog_ping_ms"] = round(
+                await asyncio.wait_for(ping(state.catalog_db), MONGO_READY_TIMEOUT_SECONDS), 2
+            )
+        if state.missing_indexes != []:
+            # Checked again until `python -m indexes` has built them
+            state.missing_indexes = await asyncio.wait_for(
+                missing_required_indexes(state.db), MONGO_READY_TIMEOUT_SECONDS
+            )
+    except Exception as e:
+        body["status"] = "unavailable"
+        body["error"] = type(e).__name__
+        return JSONResponse(body, status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+    if state.missing_indexes:
+        body["status"] = "missing_indexes"
+        body["missing_indexes"] = state.missing_indexes
+        return JSONResponse(body, status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+    return body
+
+ops_router.add_api_route("/metrics", metrics_endpoint, methods=["GET"])
 
 # Configure logging
 logging.basicConfig(
@@ -158,6 +485,145 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+# The app whose lifespan is running. The components bound below
+# (media_pipeline, job_queue, notifier, ...) are module singletons, so a
+# process serves one app at a time
+_running_app: Optional[FastAPI] = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open this worker's resources, serve, then close them again.
+
+    Everything that connects or starts tasks happens here rather than at
+    import, so a preloading server (gunicorn --preload) can fork workers
+    safely and each worker gets its own Mongo client and pool.
+
+    Only the Mongo client, databases and blob store live on app.state; the
+    background components are process-wide and bound to this app's
+    database, so starting a second app in the same process is refused.
+    """
+    global _running_app
+    if _running_app is not None:
+        raise RuntimeError(
+            "Another app is already running in this process; its components are process-wide"
+        )
+    settings: Settings = app.state.settings
+    started = time.perf_counter()
+    step_started = started
+    
+    def step_done(step: str) -> None:
+        nonlocal step_started
+        now = time.perf_counter()
+        startup_seconds[step] = round(now - step_started, 4)
+        step_started = now
+    
+    client = create_client(settings.mongo_url, event_listeners=[mongo_listener])
+    db = client[settings.db_name]
+    # Courses, public materials and the search index may read from secondaries
+    catalog_db = catalog_database(db)
+    blob_store = create_blob_store(db)
+    app.state.client = client
+    app.state.db = db
+    app.state.catalog_db = catalog_db
+    app.state.blob_store = blob_store
+    
+    media_pipeline.bind(db, blob_store)
+    blob_refs.bind(db, blob_store)
+    token_revocations.bind(db)
+    catalog_search.bind(catalog_db)
+    job_queue.bind(db)
+    notifier.bind(db)
+    event_broker.bind(db)
+    status_writer.bind(db)
+    if isinstance(get_rate_limit_backend(), MongoRateLimitBackend):
+        get_rate_limit_backend().bind(db)
+    step_done("connect")
+    _running_app = app
+    
+    try:
+        if settings.warm_pool:
+            try:
+                await warm_up(db)
+                if catalog_db is not db:
+                    await warm_up(catalog_db)
+            except Exception:
+                # Not fatal: /readyz keeps failing until Mongo answers
+                logger.exception("Could not warm the Mongo connection pool")
+            step_done("warm_pool")
+        
+        if settings.build_indexes:
+            await prepare_database(db)
+            step_done("indexes")
+        try:
+            app.state.missing_indexes = await missing_required_indexes(db)
+        except Exception:
+            logger.exception("Could not check the required indexes")
+        if app.state.missing_indexes:
+            # A unique index that failed to build (existing duplicates) or was
+            # never built (BUILD_INDEXES=false without python -m indexes)
+            logger.error(
+                "Required indexes missing: %s; not ready, and registration checks for duplicates itself",
+                app.state.missing_indexes
+            )
+        
+        # Built in the background; searches find nothing until the first build is done
+        catalog_search.start()
+        await job_queue.start()
+        await media_pipeline.start()
+        event_broker.start()
+        admission_controller.start()
+        status_writer.start()
+        step_done("workers")
+        
+        startup_seconds["total"] = round(time.perf_counter() - started, 4)
+        logger.info("Startup took %.0f ms: %s", startup_seconds["total"] * 1000, startup_seconds)
+        app.state.ready = True
+        yield
+    finally:
+        app.state.ready = False
+        await catalog_search.stop()
+        await job_queue.stop()
+        await event_broker.stop()
+        await admission_controller.stop()
+        # Writes the check-ins still waiting for a batch
+        await status_writer.stop()
+        client.close()
+        password_pool.shutdown()
+        _running_app = None
+
+def create_app(settings: Optional[Settings] = None) -> FastAPI:
+    """Build the app. Nothing connects until its lifespan starts.
+
+    Several apps can be built, but only one can run at a time in a process:
+    see lifespan.
+
+    For a server: `uvicorn server:create_app --factory`, or the module-level
+    `app` below, which is built from the environment.
+    """
+    app = FastAPI(default_response_class=FastJSONResponse, lifespan=lifespan)
+    app.state.settings = settings or Settings.from_env()
+    app.state.ready = False
+    # None until checked; see indexes.REQUIRED_INDEXES
+    app.state.missing_indexes = None
+    
+    app.include_router(api_router)
+    app.include_router(team_router)
+    app.include_router(admin_router)
+    app.include_router(ops_router)
+    
+    app.add_middleware(ConditionalGetMiddleware)
+    app.add_middleware(CompressionMiddleware, minimum_size=1024)
+    # Inside MetricsMiddleware so shed requests show up in the request metrics
+    app.add_middleware(AdmissionControlMiddleware)
+    app.add_middleware(MetricsMiddleware)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=app.state.settings.cors_origins,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["X-Next-Cursor", "Link", "ETag", "Last-Modified"],
+    )
+    return app
+
+app = create_app()
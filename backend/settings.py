@@ -0,0 +1,36 @@
+import os
+from typing import List
+
+from pydantic import BaseModel
+
+def _env_flag(name: str, default: bool) -> bool:
+    return os.environ.get(name, "true" if default else "false").lower() in ("1", "true", "yes")
+
+class Settings(BaseModel):
+    """What create_app needs to build one app instance (one running per
+    process; see server.lifespan).
+
+    Component tuning (pool sizes, job workers, caches, ...) stays in each
+    module's own env settings.
+    """
+
+    mongo_url: str
+    db_name: str
+    cors_origins: List[str] = ["*"]
+    # Open MONGO_MIN_POOL_SIZE connections before serving
+    warm_pool: bool = True
+    # Create the declared indexes at startup. With several workers per
+    # host, run `python -m indexes` once per deploy and turn this off
+    build_indexes: bool = True
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        return cls(
+            mongo_url=os.environ["MONGO_URL"],
+            db_name=os.environ["DB_NAME"],
+            cors_origins=[
+                origin.strip() for origin in os.environ.get("CORS_ORIGINS", "*").split(",") if origin.strip()
+            ],
+            warm_pool=_env_flag("WARM_MONGO_POOL", True),
+            build_indexes=_env_flag("BUILD_INDEXES", True),
+        )
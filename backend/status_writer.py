@@ -0,0 +1,226 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import CollectionInvalid, OperationFailure
+
+from metrics import Histogram, registry
+
+logger = logging.getLogger(__name__)
+
+# A batch is written when it has this many records or its oldest record
+# has waited this long, whichever comes first
+STATUS_FLUSH_SIZE = int(os.environ.get("STATUS_FLUSH_SIZE", "500"))
+STATUS_FLUSH_SECONDS = float(os.environ.get("STATUS_FLUSH_SECONDS", "0.2"))
+# Records waiting for a flush beyond this are rejected with 503
+STATUS_MAX_BUFFER = int(os.environ.get("STATUS_MAX_BUFFER", "10000"))
+STATUS_RETENTION_SECONDS = int(os.environ.get("STATUS_RETENTION_SECONDS", str(30 * 24 * 3600)))
+
+status_batch_size = registry.register(Histogram(
+    "status_flush_records", "Status check records written per insert_many",
+    buckets=(1, 5, 10, 50, 100, 250, 500, 1000)
+))
+
+class StatusBufferFull(Exception):
+    """More records are waiting than STATUS_MAX_BUFFER."""
+
+class StatusWriter:
+    """Group commit for status check-ins.
+
+    Records from concurrent requests are collected and written with one
+    insert_many; every caller waits for the batch holding its record, so a
+    check-in that returned is stored and a failed write is reported to the
+    client. Storage is a time-series collection (timeField timestamp,
+    metaField client_name) that expires records after
+    STATUS_RETENTION_SECONDS.
+    """
+
+    def __init__(self, flush_size: int, flush_seconds: float, max_buffer: int):
+        self.flush_size = flush_size
+        self.flush_seconds = flush_seconds
+        self.max_buffer = max_buffer
+        self.collection = None
+        self.db: Optional[AsyncIOMotorDatabase] = None
+        self.timeseries = False
+        self._buffer: List[Tuple[dict, asyncio.Future]] = []
+        self._oldest = 0.0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flushing: Optional[asyncio.Future] = None
+        self.written = 0
+        self.flushes = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def bind(self, db: AsyncIOMotorDatabase) -> None:
+        self.db = db
+        self.collection = db.status_checks
+
+    async def ensure_collection(self) -> None:
+        """Create status_checks as a time-series collection. Runs before the
+        other indexes are built, which would create a plain collection."""
+        try:
+            await self.db.create_collection(
+                "status_checks",
+                timeseries={"timeField": "timestamp", "metaField": "client_name", "granularity": "seconds"},
+                expireAfterSeconds=STATUS_RETENTION_SECONDS
+            )
+            self.timeseries = True
+            return
+        except CollectionInvalid:
+            info = await self.db.list_collections(filter={"name": "status_checks"}).to_list(1)
+            self.timeseries = bool(info) and info[0].get("type") == "timeseries"
+            if self.timeseries:
+                await self.db.command(
+                    "collMod", "status_checks", expireAfterSeconds=STATUS_RETENTION_SECONDS
+                )
+                return
+            # Existing data stays where it is; to migrate, rename the old
+            # collection, restart, and copy its records over
+            logger.warning("status_checks is a regular collection, not time-series; expiring it with a TTL index")
+        except (OperationFailure, NotImplementedError) as e:
+            # Servers before 5.0 and stand-ins such as mongomock
+            logger.warning("Time-series collections unavailable, using a regular one: %s", e)
+        await self.collection.create_indexes([IndexModel(
+            [("timestamp", ASCENDING)], name="timestamp_ttl", expireAfterSeconds=STATUS_RETENTION_SECONDS
+        )])
+
+    async def write(self, doc: dict) -> None:
+        """Add a record to the next batch and wait until it is stored."""
+        if len(self._buffer) >= self.max_buffer:
+            self.rejected += 1
+            raise StatusBufferFull()
+        if self._task is None:
+            # Not started (or already stopped): write it alone
+            await self.collection.insert_one(doc)
+            self.written += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        if not self._buffer:
+            # Starts the flush timer
+            self._oldest = time.monotonic()
+            self._wakeup.set()
+        self._buffer.append((doc, future))
+        if len(self._buffer) >= self.flush_size:
+            self._wakeup.set()
+        await future
+
+    async def flush(self) -> None:
+        batch, self._buffer = self._buffer, []
+        if not batch:
+            return
+        status_batch_size.observe(len(batch))
+        self.flushes += 1
+        try:
+            await self.collection.insert_many([doc for doc, _ in batch], ordered=False)
+        except Exception as e:
+            self.failed += len(batch)
+            logger.error("Could not write %d status checks: %s", len(batch), e)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.written += len(batch)
+        for _, future in batch:
+            if not future.done():
+                future.set_result(None)
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            timeout = None
+            if self._buffer:
+                timeout = self._oldest + self.flush_seconds - time.monotonic()
+            if timeout is None or timeout > 0:
+                waiter = asyncio.ensure_future(self._wakeup.wait())
+                try:
+                    await asyncio.wait([waiter], timeout=timeout)
+                finally:
+                    waiter.cancel()
+            if not self._buffer or (
+                len(self._buffer) < self.flush_size
+                and time.monotonic() - self._oldest < self.flush_seconds
+            ):
+                continue
+            # Shielded so stop() cannot cut a batch off halfway; stop()
+            # waits for it instead
+            self._flushing = asyncio.ensure_future(self.flush())
+            await asyncio.shield(self._flushing)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the flusher and write whatever is still buffered."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._flushing is not None:
+            await self._flushing
+            self._flushing = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "buffered": len(self._buffer),
+            "written": self.written,
+            "flushes": self.flushes,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "timeseries": int(self.timeseries),
+        }
+
+status_writer = StatusWriter(STATUS_FLUSH_SIZE, STATUS_FLUSH_SECONDS, STATUS_MAX_BUFFER)
+
+ROLLUP_UNITS = {"minute": timedelta(minutes=1), "hour": timedelta(hours=1)}
+# Largest number of buckets per client a rollup request may span
+MAX_ROLLUP_BUCKETS = 10_000
+
+async def rollup(
+    collection,
+    unit: str,
+    since: datetime,
+    until: datetime,
+    client_name: Optional[str] = None
+) -> List[dict]:
+    """Check-ins per client per minute or hour, counted by the server."""
+    match = {"timestamp": {"$gte": since, "$lt": until}}
+    if client_name:
+        match["client_name"] = client_name
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": {
+                "client_name": "$client_name",
+                "start": {"$dateTrunc": {"date": "$timestamp", "unit": unit}},
+            },
+            "count": {"$sum": 1},
+            "first_seen": {"$min": "$timestamp"},
+            "last_seen": {"$max": "$timestamp"},
+        }},
+        {"$sort": {"_id.client_name": 1, "_id.start": 1}},
+    ]
+    clients: List[dict] = []
+    async for row in collection.aggregate(pipeline):
+        name = row["_id"]["client_name"]
+        if not clients or clients[-1]["client_name"] != name:
+            clients.append({"client_name": name, "total": 0, "buckets": []})
+        clients[-1]["total"] += row["count"]
+        clients[-1]["buckets"].append({
+            "start": row["_id"]["start"],
+            "count": row["count"],
+            "first_seen": row["first_seen"],
+            "last_seen": row["last_seen"],
+        })
+    return clients
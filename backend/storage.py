@@ -0,0 +1,230 @@
+import asyncio
+import os
+import uuid
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+from gridfs.errors import NoFile
+from motor.motor_asyncio import AsyncIOMotorDatabase, AsyncIOMotorGridFSBucket
+
+# Size of the pieces blobs are written and streamed in
+CHUNK_SIZE = 255 * 1024
+
+class BlobNotFound(Exception):
+    """Raised when a blob reference does not resolve to stored bytes."""
+
+class BlobWriter(ABC):
+    """Incremental writer returned by BlobStore.open_upload."""
+
+    blob_id: str
+
+    @abstractmethod
+    async def write(self, data: bytes) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def close(self) -> str:
+        """Finish the upload and return the blob id."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def abort(self) -> None:
+        """Discard everything written so far."""
+        raise NotImplementedError
+
+class BlobStore(ABC):
+    """Stores file bytes outside of the documents that reference them."""
+
+    @abstractmethod
+    def open_upload(
+        self,
+        filename: str,
+        content_type: Optional[str] = None,
+        blob_id: Optional[str] = None
+    ) -> BlobWriter:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def size(self, blob_id: str) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def open_download(
+        self,
+        blob_id: str,
+        start: int = 0,
+        end: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        """Yield the bytes in [start, end] (inclusive) in CHUNK_SIZE pieces."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete(self, blob_id: str) -> None:
+        raise NotImplementedError
+
+    async def put(
+        self,
+        data: bytes,
+        filename: str,
+        content_type: Optional[str] = None,
+        blob_id: Optional[str] = None
+    ) -> str:
+        """Store a complete payload in one call."""
+        writer = self.open_upload(filename, content_type, blob_id)
+        try:
+            for offset in range(0, len(data), CHUNK_SIZE):
+                await writer.write(data[offset:offset + CHUNK_SIZE])
+        except BaseException:
+            await writer.abort()
+            raise
+        return await writer.close()
+
+    async def read(self, blob_id: str) -> bytes:
+        """Read a complete payload. Only meant for small blobs."""
+        return b"".join([chunk async for chunk in self.open_download(blob_id)])
+
+def _new_blob_id() -> str:
+    return uuid.uuid4().hex
+
+# GridFS backend
+
+class _GridFSWriter(BlobWriter):
+    def __init__(self, grid_in, blob_id: str):
+        self._grid_in = grid_in
+        self.blob_id = blob_id
+
+    async def write(self, data: bytes) -> None:
+        await self._grid_in.write(data)
+
+    async def close(self) -> str:
+        await self._grid_in.close()
+        return self.blob_id
+
+    async def abort(self) -> None:
+        await self._grid_in.abort()
+
+class GridFSBlobStore(BlobStore):
+    def __init__(self, db: AsyncIOMotorDatabase, bucket_name: str = "material_blobs"):
+        self.bucket = AsyncIOMotorGridFSBucket(
+            db, bucket_name=bucket_name, chunk_size_bytes=CHUNK_SIZE
+        )
+
+    def open_upload(self, filename, content_type=None, blob_id=None):
+        blob_id = blob_id or _new_blob_id()
+        grid_in = self.bucket.open_upload_stream_with_id(
+            blob_id, filename, metadata={"content_type": content_type}
+        )
+        return _GridFSWriter(grid_in, blob_id)
+
+    async def _open(self, blob_id: str):
+        try:
+            return await self.bucket.open_download_stream(blob_id)
+        except NoFile:
+            raise BlobNotFound(blob_id)
+
+    async def size(self, blob_id: str) -> int:
+        grid_out = await self._open(blob_id)
+        return grid_out.length
+
+    async def open_download(self, blob_id, start=0, end=None):
+        grid_out = await self._open(blob_id)
+        if end is None:
+            end = grid_out.length - 1
+        grid_out.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await grid_out.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+    async def delete(self, blob_id: str) -> None:
+        try:
+            await self.bucket.delete(blob_id)
+        except NoFile:
+            raise BlobNotFound(blob_id)
+
+# Local filesystem backend
+
+class _LocalWriter(BlobWriter):
+    def __init__(self, path: Path, blob_id: str):
+        self._path = path
+        self._tmp_path = path.with_name(path.name + ".part")
+        self._file = None
+        self.blob_id = blob_id
+
+    async def write(self, data: bytes) -> None:
+        if self._file is None:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = await asyncio.to_thread(open, self._tmp_path, "wb")
+        await asyncio.to_thread(self._file.write, data)
+
+    async def close(self) -> str:
+        if self._file is None:
+            # Empty payload
+            await self.write(b"")
+        await asyncio.to_thread(self._file.close)
+        await asyncio.to_thread(os.replace, self._tmp_path, self._path)
+        return self.blob_id
+
+    async def abort(self) -> None:
+        if self._file is not None:
+            await asyncio.to_thread(self._file.close)
+            await asyncio.to_thread(self._tmp_path.unlink, True)
+
+class LocalBlobStore(BlobStore):
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def _path(self, blob_id: str) -> Path:
+        # Blob ids come from our own documents, but never let one escape root
+        if not blob_id or "/" in blob_id or "\\" in blob_id or blob_id.startswith("."):
+            raise BlobNotFound(blob_id)
+        return self.root / blob_id[:2] / blob_id
+
+    def open_upload(self, filename, content_type=None, blob_id=None):
+        blob_id = blob_id or _new_blob_id()
+        return _LocalWriter(self._path(blob_id), blob_id)
+
+    async def size(self, blob_id: str) -> int:
+        try:
+            stat = await asyncio.to_thread(self._path(blob_id).stat)
+        except FileNotFoundError:
+            raise BlobNotFound(blob_id)
+        return stat.st_size
+
+    async def open_download(self, blob_id, start=0, end=None):
+        try:
+            handle = await asyncio.to_thread(open, self._path(blob_id), "rb")
+        except FileNotFoundError:
+            raise BlobNotFound(blob_id)
+        try:
+            if end is None:
+                end = os.fstat(handle.fileno()).st_size - 1
+            await asyncio.to_thread(handle.seek, start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = await asyncio.to_thread(handle.read, min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            handle.close()
+
+    async def delete(self, blob_id: str) -> None:
+        try:
+            await asyncio.to_thread(self._path(blob_id).unlink)
+        except FileNotFoundError:
+            raise BlobNotFound(blob_id)
+
+def create_blob_store(db: AsyncIOMotorDatabase) -> BlobStore:
+    """Build the blob store selected by the BLOB_STORE environment variable."""
+    backend = os.environ.get("BLOB_STORE", "gridfs").lower()
+    if backend == "gridfs":
+        return GridFSBlobStore(db)
+    if backend == "local":
+        return LocalBlobStore(os.environ.get("BLOB_STORE_PATH", "blobs"))
+    raise ValueError(f"Unknown BLOB_STORE backend: {backend}")
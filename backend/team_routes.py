@@ -1,48 +1,76 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, status, Depends, Header, Query, Request
+from fastapi.responses import StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from datetime import datetime, timedelta
 import base64
+import binascii
 import os
-from typing import List, Optional
+from typing import List, Optional, Tuple
+from urllib.parse import quote
+from pydantic import ValidationError
+from pymongo import InsertOne
+from pymongo.errors import DuplicateKeyError
 
 from models import (
-    TeamRegistrationRequest, TeamLogin, TeamToken, TeamProfile, 
-    TeamUpdateRequest, MaterialUploadRequest, TeamMaterial,
-    ContactTeamRequest, TeamContactMessage, Course
+    TeamRegistrationRequest, TeamLogin, TeamToken, TeamProfile, PasswordChangeRequest,
+    TeamUpdateRequest, MaterialUploadRequest, MaterialFromHashRequest, TeamMaterial,
+    ContactTeamRequest, MarkMessagesReadRequest, TeamContactMessage, Course, MaterialType
 )
 from auth import (
-    get_password_hash, verify_password, create_access_token, 
-    get_current_team
+    hash_password_async, verify_password_async, create_access_token,
+    get_current_team, get_optional_team, token_revocations
+)
+from storage import BlobNotFound, BlobStore, CHUNK_SIZE
+from payload_codecs import open_payload
+from dependencies import get_blob_store, get_db
+from blob_refs import BlobRefConflict, blob_refs
+from jobs import job_queue
+from events import event_broker, stream_events
+from ndjson import NDJSONImport, export_response
+from ratelimit import (
+    client_ip, contact_ip_limit, contact_team_limit, login_email_limit, login_ip_limit,
+    register_ip_limit
+)
+from uploads import MultipartUpload, UploadError, UploadTooLarge
+from pagination import PageParams, fetch_page, projected_response, trusted_response
+from cache import team_profile_cache, public_material_cache, invalidate_team
+from http_cache import RenderedJSON, conditional_response
+from search import catalog_search
+from images import (
+    InvalidImage, MAX_LOGO_SIZE, LOGO_VARIANT, THUMBNAIL_VARIANT,
+    decode_data_url, media_pipeline, media_url
 )
 
-# This will be injected in server.py
+# Included by server.create_app
 router = APIRouter(prefix="/api/teams", tags=["teams"])
 
-# Database dependency will be set in server.py
-db_instance = None
-
-def get_db():
-    return db_instance
+MAX_MATERIAL_SIZE = 50 * 1024 * 1024  # 50MB limit
 
 # Team Registration
 @router.post("/register", response_model=TeamToken)
-async def register_team(request: TeamRegistrationRequest):
-    db = get_db()
+async def register_team(
+    request: TeamRegistrationRequest,
+    http_request: Request,
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    await register_ip_limit.hit(client_ip(http_request))
     teams_collection = db.teams
     
-    # Check if team already exists
-    existing_team = await teams_collection.find_one({
-        "$or": [
-            {"contact_email": request.contact_email},
-            {"team_name": request.team_name}
-        ]
-    })
-    
-    if existing_team:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Team with this name or email already exists"
-        )
+    # Without the unique indexes (not built, or blocked by duplicates) the
+    # insert below would accept a duplicate; check first instead. Racy, but
+    # only until the indexes exist.
+    if http_request.app.state.missing_indexes != []:
+        existing_team = await teams_collection.find_one({
+            "$or": [
+                {"contact_email": request.contact_email},
+                {"team_name": request.team_name}
+            ]
+        }, {"_id": 1})
+        if existing_team:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Team with this name or email already exists"
+            )
     
     # Create team profile
     team_profile = TeamProfile(
@@ -57,10 +85,17 @@ async def register_team(request: TeamRegistrationRequest):
     
     # Hash password and create team document
     team_doc = team_profile.dict()
-    team_doc["password_hash"] = get_password_hash(request.password)
+    team_doc["password_hash"] = await hash_password_async(request.password)
     
-    # Insert team into database
-    result = await teams_collection.insert_one(team_doc)
+    # Insert team into database. The unique indexes on contact_email and
+    # team_name reject duplicates atomically.
+    try:
+        result = await teams_collection.insert_one(team_doc)
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Team with this name or email already exists"
+        )
     
     if not result.inserted_id:
         raise HTTPException(
@@ -68,6 +103,8 @@ async def register_team(request: TeamRegistrationRequest):
             detail="Failed to create team"
         )
     
+    await team_profile_cache.invalidate(team_profile.id)
+    
     # Create access token
     access_token = create_access_token(
         data={"team_id": team_profile.id, "team_name": team_profile.team_name}
@@ -81,19 +118,39 @@ async def register_team(request: TeamRegistrationRequest):
 
 # Team Login
 @router.post("/login", response_model=TeamToken)
-async def login_team(login_data: TeamLogin):
-    db = get_db()
+async def login_team(
+    login_data: TeamLogin,
+    request: Request,
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    # Both before bcrypt: per IP against scripted clients, per email against
+    # guessing one team's password from many addresses
+    await login_ip_limit.hit(client_ip(request))
+    await login_email_limit.hit(login_data.email.lower())
     teams_collection = db.teams
     
     # Find team by email
     team_doc = await teams_collection.find_one({"contact_email": login_data.email})
     
-    if not team_doc or not verify_password(login_data.password, team_doc["password_hash"]):
+    valid, new_hash = False, None
+    if team_doc:
+        valid, new_hash = await verify_password_async(
+            login_data.password, team_doc["password_hash"]
+        )
+    
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid email or password"
         )
     
+    # Transparently upgrade hashes made with an outdated cost factor
+    if new_hash:
+        await teams_collection.update_one(
+            {"id": team_doc["id"], "password_hash": team_doc["password_hash"]},
+            {"$set": {"password_hash": new_hash}}
+        )
+    
     # Remove password hash from response
     team_doc.pop("password_hash", None)
     team_profile = TeamProfile(**team_doc)
@@ -109,10 +166,63 @@ async def login_team(login_data: TeamLogin):
         team_profile=team_profile
     )
 
+# Team Logout (revokes the token used for this request)
+@router.post("/logout")
+async def logout_team(current_team: dict = Depends(get_current_team)):
+    await token_revocations.revoke_token(current_team)
+    return {"message": "Logged out successfully"}
+
+# Change Password (revokes every token issued before the change)
+@router.put("/password", response_model=TeamToken)
+async def change_password(
+    password_data: PasswordChangeRequest,
+    current_team: dict = Depends(get_current_team),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    teams_collection = db.teams
+    
+    team_doc = await teams_collection.find_one({"id": current_team["team_id"]})
+    if not team_doc:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Team not found"
+        )
+    
+    valid, _ = await verify_password_async(
+        password_data.current_password, team_doc["password_hash"]
+    )
+    if not valid:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid current password"
+        )
+    
+    new_hash = await hash_password_async(password_data.new_password)
+    await teams_collection.update_one(
+        {"id": team_doc["id"]},
+        {"$set": {"password_hash": new_hash, "updated_at": datetime.utcnow()}}
+    )
+    await token_revocations.revoke_team(team_doc["id"])
+    await token_revocations.revoke_token(current_team)
+    
+    team_doc.pop("password_hash", None)
+    team_profile = TeamProfile(**team_doc)
+    access_token = create_access_token(
+        data={"team_id": team_profile.id, "team_name": team_profile.team_name}
+    )
+    
+    return TeamToken(
+        access_token=access_token,
+        token_type="bearer",
+        team_profile=team_profile
+    )
+
 # Get Team Profile
 @router.get("/profile", response_model=TeamProfile)
-async def get_team_profile(current_team: dict = Depends(get_current_team)):
-    db = get_db()
+async def get_team_profile(
+    current_team: dict = Depends(get_current_team),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
     teams_collection = db.teams
     
     team_doc = await teams_collection.find_one({"id": current_team["team_id"]})
@@ -129,9 +239,9 @@ async def get_team_profile(current_team: dict = Depends(get_current_team)):
 @router.put("/profile", response_model=TeamProfile)
 async def update_team_profile(
     update_data: TeamUpdateRequest,
-    current_team: dict = Depends(get_current_team)
+    current_team: dict = Depends(get_current_team),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
-    db = get_db()
     teams_collection = db.teams
     
     # Build update document
@@ -142,8 +252,33 @@ async def update_team_profile(
         update_doc["team_number"] = update_data.team_number
     if update_data.description is not None:
         update_doc["description"] = update_data.description
-    if update_data.logo_data is not None:
-        update_doc["logo_url"] = update_data.logo_data
+    if update_data.logo_data == "":
+        update_doc["logo_url"] = None
+        update_doc["logo_hash"] = None
+    elif update_data.logo_data is not None:
+        # Resized derivatives are rendered in the background; profiles and
+        # catalog payloads only carry their URL
+        try:
+            logo_bytes, content_type = decode_data_url(update_data.logo_data)
+        except InvalidImage as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+        if len(logo_bytes) > MAX_LOGO_SIZE:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail="Logo too large. Maximum 5MB allowed."
+            )
+        try:
+            logo_hash = await media_pipeline.ingest(logo_bytes, content_type, source="logo")
+        except InvalidImage as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+        update_doc["logo_hash"] = logo_hash
+        update_doc["logo_url"] = media_url(logo_hash, LOGO_VARIANT)
     if update_data.social_media is not None:
         update_doc["social_media"] = update_data.social_media.dict()
     if update_data.location is not None:
@@ -167,129 +302,493 @@ async def update_team_profile(
             detail="Team not found"
         )
     
+    await invalidate_team(current_team["team_id"])
+    
     # Return updated profile
     team_doc = await teams_collection.find_one({"id": current_team["team_id"]})
     team_doc.pop("password_hash", None)
     return TeamProfile(**team_doc)
 
+def _busy_content() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="The same file is being uploaded or deleted elsewhere, try again shortly",
+        headers={"Retry-After": "1"}
+    )
+
 # Upload Material
 @router.post("/materials", response_model=TeamMaterial)
 async def upload_material(
     material_data: MaterialUploadRequest,
-    current_team: dict = Depends(get_current_team)
+    current_team: dict = Depends(get_current_team),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
-    db = get_db()
-    materials_collection = db.team_materials
-    
-    # Validate file size (limit to 50MB)
     try:
-        file_size = len(base64.b64decode(material_data.file_data))
-        if file_size > 50 * 1024 * 1024:  # 50MB limit
-            raise HTTPException(
-                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-                detail="File size too large. Maximum 50MB allowed."
-            )
-    except Exception:
+        file_bytes = base64.b64decode(material_data.file_data)
+    except (binascii.Error, ValueError):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid file data"
         )
     
+    # Validate file size (limit to 50MB)
+    if len(file_bytes) > MAX_MATERIAL_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="File size too large. Maximum 50MB allowed."
+        )
+    
+    # Store the bytes once per distinct content, keep only a reference in the document
+    try:
+        ref = await blob_refs.store(file_bytes, material_data.file_name, material_data.mime_type)
+    except BlobRefConflict:
+        raise _busy_content()
+    content_hash = ref["_id"]
+    
     # Create material
     material = TeamMaterial(
         team_id=current_team["team_id"],
         title=material_data.title,
         description=material_data.description,
         material_type=material_data.material_type,
-        file_data=material_data.file_data,
+        blob_id=ref["blob_id"],
         file_name=material_data.file_name,
-        file_size=file_size,
+        file_size=len(file_bytes),
+        content_hash=content_hash,
+        codec=ref.get("codec"),
+        thumbnail_url=_thumbnail_url(material_data.material_type, content_hash),
         mime_type=material_data.mime_type,
         is_public=material_data.is_public,
         tags=material_data.tags
     )
     
-    # Insert into database
-    result = await materials_collection.insert_one(material.dict())
+    return await _save_material(db, material)
+
+def _thumbnail_url(material_type, content_hash: Optional[str]) -> Optional[str]:
+    if material_type in (MaterialType.IMAGE, MaterialType.IMAGE.value) and content_hash:
+        return media_url(content_hash, THUMBNAIL_VARIANT)
+    return None
+
+async def _save_material(db: AsyncIOMotorDatabase, material: TeamMaterial) -> TeamMaterial:
+    """Insert a material whose blob reference is already taken."""
+    result = await db.team_materials.insert_one(material.dict())
     
     if not result.inserted_id:
+        await blob_refs.release(material.content_hash, material.blob_id)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to upload material"
         )
     
+    await _register_material_image(material)
+    
+    if material.is_public:
+        await public_material_cache.clear()
+        catalog_search.material_saved(material.dict())
+    
+    await event_broker.publish(material.team_id, "material.created", {
+        "id": material.id, "title": material.title, "material_type": material.material_type.value,
+        "is_public": material.is_public, "created_at": material.created_at.isoformat()
+    })
+    
     return material
 
+async def _register_material_image(material: TeamMaterial) -> None:
+    """Queue thumbnails for an image material; its blob is the source."""
+    if material.thumbnail_url:
+        await media_pipeline.register(
+            material.content_hash, material.blob_id, material.mime_type, source="material",
+            codec=material.codec
+        )
+
+# Upload Material (multipart, streamed straight to the blob store)
+@router.post("/materials/upload", response_model=TeamMaterial)
+async def upload_material_multipart(
+    request: Request,
+    current_team: dict = Depends(get_current_team),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    blob_store: BlobStore = Depends(get_blob_store)
+):
+    # Reject obviously oversized bodies before reading anything
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() \
+            and int(content_length) > MAX_MATERIAL_SIZE + 1024 * 1024:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="File size too large. Maximum 50MB allowed."
+        )
+    
+    upload = MultipartUpload(request, blob_store, MAX_MATERIAL_SIZE)
+    try:
+        streamed_file = await upload.parse()
+    except UploadTooLarge:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="File size too large. Maximum 50MB allowed."
+        )
+    except UploadError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    # Tags may be sent as repeated fields or as one comma separated field
+    tags = [
+        tag.strip()
+        for value in upload.get_list("tags")
+        for tag in value.split(",")
+        if tag.strip()
+    ]
+    
+    try:
+        material = TeamMaterial(
+            team_id=current_team["team_id"],
+            title=upload.get("title"),
+            description=upload.get("description") or None,
+            material_type=upload.get("material_type"),
+            blob_id=streamed_file.blob_id,
+            file_name=streamed_file.filename,
+            file_size=streamed_file.size,
+            content_hash=streamed_file.content_hash,
+            thumbnail_url=_thumbnail_url(upload.get("material_type"), streamed_file.content_hash),
+            mime_type=upload.get("mime_type") or streamed_file.content_type
+                or "application/octet-stream",
+            is_public=(upload.get("is_public") or "false").lower() in ("true", "1", "on"),
+            tags=tags
+        )
+    except ValidationError as e:
+        await blob_store.delete(streamed_file.blob_id)
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=e.errors(include_url=False, include_context=False)
+        )
+    
+    # The bytes were hashed while streaming; identical content already
+    # stored is referenced instead and this copy dropped
+    try:
+        ref = await blob_refs.acquire(
+            streamed_file.content_hash, streamed_file.blob_id, streamed_file.size,
+            material.mime_type, streamed_file.codec
+        )
+    except BlobRefConflict:
+        # acquire has already deleted this copy
+        raise _busy_content()
+    material.blob_id = ref["blob_id"]
+    material.codec = ref.get("codec")
+    
+    return await _save_material(db, material)
+
+# Create Material from already stored content, without uploading it again
+@router.post("/materials/from-hash", response_model=TeamMaterial)
+async def create_material_from_hash(
+    material_data: MaterialFromHashRequest,
+    current_team: dict = Depends(get_current_team),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    materials_collection = db.team_materials
+    content_hash = material_data.content_hash.lower()
+    
+    # Only content the team can already read: knowing a hash must not give
+    # access to another team's private file
+    visible = await materials_collection.find_one(
+        {"content_hash": content_hash,
+         "$or": [{"is_public": True}, {"team_id": current_team["team_id"]}]},
+        {"_id": 0, "content_hash": 1}
+    )
+    ref = await blob_refs.add_reference(content_hash) if visible else None
+    if ref is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Content not found, upload the file instead"
+        )
+    
+    material = TeamMaterial(
+        team_id=current_team["team_id"],
+        title=material_data.title,
+        description=material_data.description,
+        material_type=material_data.material_type,
+        blob_id=ref["blob_id"],
+        file_name=material_data.file_name,
+        file_size=ref["size"],
+        content_hash=content_hash,
+        codec=ref.get("codec"),
+        thumbnail_url=_thumbnail_url(material_data.material_type, content_hash),
+        mime_type=material_data.mime_type,
+        is_public=material_data.is_public,
+        tags=material_data.tags
+    )
+    
+    return await _save_material(db, material)
+
+# Export Team Materials (NDJSON, metadata only)
+@router.get("/materials/export")
+async def export_team_materials(
+    current_team: dict = Depends(get_current_team),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    return export_response(
+        db.team_materials, {"team_id": current_team["team_id"]},
+        "materials", projection={"file_data": 0}
+    )
+
+# Import Team Materials (NDJSON rows referencing existing content by hash)
+@router.post("/materials/import")
+async def import_team_materials(
+    request: Request,
+    current_team: dict = Depends(get_current_team),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    materials_collection = db.team_materials
+    team_id = current_team["team_id"]
+    bulk = NDJSONImport(TeamMaterial)
+    
+    async def prepare(doc: dict) -> dict:
+        content_hash = (doc.get("content_hash") or "").lower()
+        if not content_hash:
+            raise ValueError("content_hash: required to import a material")
+        # Same rule as from-hash: only content the team can already read
+        visible = await materials_collection.find_one(
+            {"content_hash": content_hash, "$or": [{"is_public": True}, {"team_id": team_id}]},
+            {"_id": 1}
+        )
+        ref = await blob_refs.add_reference(content_hash) if visible else None
+        if ref is None:
+            raise ValueError("content_hash: content not found, upload the file instead")
+        doc.update(
+            content_hash=content_hash, blob_id=ref["blob_id"], file_size=ref["size"], file_data=None,
+            codec=ref.get("codec"),
+            thumbnail_url=_thumbnail_url(doc["material_type"], content_hash),
+            # Picked up by the search index refresh
+            updated_at=datetime.utcnow()
+        )
+        return doc
+    
+    public_written = False
+    async for batch in bulk.batches(request, prepare, overrides={"team_id": team_id}):
+        failed = await bulk.write(materials_collection, [(line, InsertOne(doc)) for line, doc in batch])
+        for line, doc in batch:
+            if line in failed:
+                await blob_refs.release(doc["content_hash"], doc["blob_id"])
+                continue
+            await _register_material_image(TeamMaterial(**doc))
+            if doc["is_public"]:
+                catalog_search.material_saved(doc)
+                public_written = True
+    
+    if public_written:
+        await public_material_cache.clear()
+    if bulk.inserted:
+        await event_broker.publish(team_id, "materials.imported", {"count": bulk.inserted})
+    
+    return bulk.report()
+
 # Get Team Materials
 @router.get("/materials", response_model=List[TeamMaterial])
-async def get_team_materials(current_team: dict = Depends(get_current_team)):
-    db = get_db()
+async def get_team_materials(
+    request: Request,
+    material_type: Optional[MaterialType] = None,
+    tags: Optional[List[str]] = Query(None),
+    is_public: Optional[bool] = None,
+    page: PageParams = Depends(),
+    current_team: dict = Depends(get_current_team),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
     materials_collection = db.team_materials
     
-    # Get materials for current team
-    materials = await materials_collection.find(
-        {"team_id": current_team["team_id"]}
-    ).sort("created_at", -1).to_list(None)
+    query = {"team_id": current_team["team_id"]}
+    if material_type:
+        query["material_type"] = material_type.value
+    if tags:
+        query["tags"] = {"$all": tags}
+    if is_public is not None:
+        query["is_public"] = is_public
+    
+    # Get materials for current team, without file payloads
+    projection = page.projection(
+        TeamMaterial.model_fields, always=["id", "created_at"], exclude=["file_data"]
+    )
+    materials, next_cursor = await fetch_page(materials_collection, query, page, projection)
+    if page.fields:
+        return projected_response(materials, request, next_cursor)
     
-    return [TeamMaterial(**material) for material in materials]
+    return trusted_response(TeamMaterial, materials, request, next_cursor)
+
+def parse_range_header(range_header: str, size: int) -> Tuple[int, int]:
+    """Parse a single "bytes=start-end" range into inclusive offsets."""
+    unsatisfiable = HTTPException(
+        status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+        detail="Requested range not satisfiable",
+        headers={"Content-Range": f"bytes */{size}"}
+    )
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        raise unsatisfiable
+    start_text, _, end_text = spec.strip().partition("-")
+    try:
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+        else:
+            # Suffix range: the last N bytes
+            start = max(size - int(end_text), 0)
+            end = size - 1
+    except ValueError:
+        raise unsatisfiable
+    end = min(end, size - 1)
+    if start < 0 or start > end:
+        raise unsatisfiable
+    return start, end
+
+async def _iter_inline(data: bytes, start: int, end: int):
+    for offset in range(start, end + 1, CHUNK_SIZE):
+        yield data[offset:min(offset + CHUNK_SIZE, end + 1)]
+
+# Download Material
+@router.get("/materials/{material_id}/download")
+async def download_material(
+    material_id: str,
+    range_header: Optional[str] = Header(None, alias="Range"),
+    current_team: Optional[dict] = Depends(get_optional_team),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    blob_store: BlobStore = Depends(get_blob_store)
+):
+    materials_collection = db.team_materials
+    
+    material = await materials_collection.find_one({"id": material_id}, {"_id": 0})
+    is_owner = current_team is not None and material is not None \
+        and material["team_id"] == current_team["team_id"]
+    if not material or not (material.get("is_public") or is_owner):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Material not found"
+        )
+    
+    # Legacy documents still carry the payload inline
+    inline_data = None
+    try:
+        if material.get("blob_id"):
+            size = await blob_store.size(material["blob_id"])
+            if material.get("codec"):
+                # The blob holds the compressed bytes
+                size = material["file_size"]
+        else:
+            inline_data = base64.b64decode(material.get("file_data") or "")
+            size = len(inline_data)
+    except BlobNotFound:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Material file not found"
+        )
+    
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f"attachment; filename*=UTF-8''{quote(material['file_name'])}"
+    }
+    status_code = status.HTTP_200_OK
+    start, end = 0, size - 1
+    if range_header and size > 0:
+        start, end = parse_range_header(range_header, size)
+        status_code = status.HTTP_206_PARTIAL_CONTENT
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    
+    if inline_data is not None:
+        body = _iter_inline(inline_data, start, end)
+    else:
+        body = open_payload(blob_store, material["blob_id"], material.get("codec"), start, end)
+    
+    return StreamingResponse(
+        body,
+        status_code=status_code,
+        media_type=material.get("mime_type") or "application/octet-stream",
+        headers=headers
+    )
 
 # Delete Material
 @router.delete("/materials/{material_id}")
 async def delete_material(
     material_id: str,
-    current_team: dict = Depends(get_current_team)
+    current_team: dict = Depends(get_current_team),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
-    db = get_db()
     materials_collection = db.team_materials
     
     # Delete material (only if it belongs to current team)
-    result = await materials_collection.delete_one({
-        "id": material_id,
-        "team_id": current_team["team_id"]
-    })
+    material = await materials_collection.find_one_and_delete(
+        {"id": material_id, "team_id": current_team["team_id"]},
+        projection={"blob_id": 1, "content_hash": 1, "is_public": 1}
+    )
     
-    if result.deleted_count == 0:
+    if material is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Material not found"
         )
     
+    # Other materials may share the bytes; the blob goes with the last one
+    if material.get("blob_id"):
+        await blob_refs.release(material.get("content_hash"), material["blob_id"])
+    
+    if material.get("is_public"):
+        await public_material_cache.clear()
+        await catalog_search.material_deleted(material_id)
+    
+    await event_broker.publish(current_team["team_id"], "material.deleted", {"id": material_id})
+    
     return {"message": "Material deleted successfully"}
 
 # Get Public Team Profile (for course instructor display)
 @router.get("/{team_id}/public", response_model=TeamProfile)
-async def get_public_team_profile(team_id: str):
-    db = get_db()
+async def get_public_team_profile(
+    request: Request,
+    team_id: str,
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
     teams_collection = db.teams
     
-    team_doc = await teams_collection.find_one({"id": team_id})
-    if not team_doc or not team_doc.get("is_active", True):
+    # Remove sensitive information for public view
+    # Keep contact email visible for instructor contact
+    async def load_team():
+        team_doc = await teams_collection.find_one(
+            {"id": team_id}, {"_id": 0, "password_hash": 0}
+        )
+        if not team_doc or not team_doc.get("is_active", True):
+            return None
+        profile = TeamProfile(**team_doc)
+        return RenderedJSON(profile.dict(), profile.updated_at)
+    
+    rendered = await team_profile_cache.get_or_load(team_id, load_team)
+    if rendered is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Team not found"
         )
     
-    # Remove sensitive information for public view
-    team_doc.pop("password_hash", None)
-    # Keep contact email visible for instructor contact
-    
-    return TeamProfile(**team_doc)
+    return await conditional_response(request, rendered)
 
 # Contact Team
 @router.post("/{team_id}/contact")
-async def contact_team(team_id: str, contact_data: ContactTeamRequest):
-    db = get_db()
+async def contact_team(
+    team_id: str,
+    contact_data: ContactTeamRequest,
+    request: Request,
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    await contact_ip_limit.hit(client_ip(request))
     teams_collection = db.teams
     messages_collection = db.team_messages
     
     # Verify team exists
-    team_doc = await teams_collection.find_one({"id": team_id})
+    team_doc = await teams_collection.find_one({"id": team_id}, {"_id": 1})
     if not team_doc:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Team not found"
         )
     
+    # Only after the lookup, so made-up team ids do not fill the limiter
+    await contact_team_limit.hit(team_id)
+    
     # Create contact message
     message = TeamContactMessage(
         from_name=contact_data.from_name,
@@ -309,30 +808,120 @@ async def contact_team(team_id: str, contact_data: ContactTeamRequest):
             detail="Failed to send message"
         )
     
-    # TODO: Send email notification to team
-    # This would require email service integration
+    await event_broker.publish(team_id, "message.created", {
+        "id": message.id, "from_name": message.from_name, "subject": message.subject,
+        "course_id": message.course_id, "created_at": message.created_at.isoformat()
+    })
+    
+    # Email the team in the background
+    await job_queue.enqueue(
+        "contact_notification", {"message_id": message.id},
+        dedup_key=f"contact_notification:{message.id}"
+    )
     
     return {"message": "Message sent successfully to team"}
 
 # Get Team Messages (for teams to see their messages)
 @router.get("/messages", response_model=List[TeamContactMessage])
-async def get_team_messages(current_team: dict = Depends(get_current_team)):
-    db = get_db()
+async def get_team_messages(
+    request: Request,
+    is_read: Optional[bool] = None,
+    course_id: Optional[str] = None,
+    page: PageParams = Depends(),
+    current_team: dict = Depends(get_current_team),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    messages_collection = db.team_messages
+    
+    query = {"to_team_id": current_team["team_id"]}
+    if is_read is not None:
+        query["is_read"] = is_read
+    if course_id:
+        query["course_id"] = course_id
+    
+    projection = page.projection(TeamContactMessage.model_fields, always=["id", "created_at"])
+    messages, next_cursor = await fetch_page(messages_collection, query, page, projection)
+    if page.fields:
+        return projected_response(messages, request, next_cursor)
+    
+    return trusted_response(TeamContactMessage, messages, request, next_cursor)
+
+# Live Events (server-sent events replacing dashboard polling)
+@router.get("/events")
+async def stream_team_events(
+    last_event_id: Optional[str] = Header(None),
+    after: Optional[str] = Query(None, description="Last event id seen, for the first connection"),
+    current_team: dict = Depends(get_current_team)
+):
+    return StreamingResponse(
+        stream_events(current_team["team_id"], last_event_id or after),
+        media_type="text/event-stream",
+        # Proxies must pass events through as they come
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Export Team Messages (NDJSON)
+@router.get("/messages/export")
+async def export_team_messages(
+    current_team: dict = Depends(get_current_team),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    return export_response(db.team_messages, {"to_team_id": current_team["team_id"]}, "messages")
+
+# Unread Message Counts (for the inbox badge)
+@router.get("/messages/counts")
+async def get_message_counts(
+    current_team: dict = Depends(get_current_team),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    messages_collection = db.team_messages
+    
+    # Served by the to_team_id/is_read index; one small document per course
+    pipeline = [
+        {"$match": {"to_team_id": current_team["team_id"], "is_read": False}},
+        {"$group": {"_id": "$course_id", "unread": {"$sum": 1}}},
+    ]
+    by_course = [
+        {"course_id": group["_id"], "unread": group["unread"]}
+        async for group in messages_collection.aggregate(pipeline)
+    ]
+    by_course.sort(key=lambda group: -group["unread"])
+    
+    return {"unread": sum(group["unread"] for group in by_course), "by_course": by_course}
+
+# Mark Messages as Read in bulk
+@router.put("/messages/read")
+async def mark_messages_read(
+    read_request: MarkMessagesReadRequest,
+    current_team: dict = Depends(get_current_team),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
     messages_collection = db.team_messages
     
-    messages = await messages_collection.find(
-        {"to_team_id": current_team["team_id"]}
-    ).sort("created_at", -1).to_list(None)
+    query = {"to_team_id": current_team["team_id"], "is_read": False}
+    if read_request.ids is not None:
+        query["id"] = {"$in": read_request.ids}
+    elif read_request.up_to is not None:
+        query["created_at"] = {"$lte": read_request.up_to}
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Give either ids or up_to"
+        )
+    if read_request.course_id:
+        query["course_id"] = read_request.course_id
+    
+    result = await messages_collection.update_many(query, {"$set": {"is_read": True}})
     
-    return [TeamContactMessage(**message) for message in messages]
+    return {"message": "Messages marked as read", "updated": result.modified_count}
 
 # Mark Message as Read
 @router.put("/messages/{message_id}/read")
 async def mark_message_read(
     message_id: str,
-    current_team: dict = Depends(get_current_team)
+    current_team: dict = Depends(get_current_team),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
-    db = get_db()
     messages_collection = db.team_messages
     
     result = await messages_collection.update_one(
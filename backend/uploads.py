@@ -0,0 +1,200 @@
+import hashlib
+from typing import Dict, List, Optional
+
+from starlette.requests import Request
+
+try:
+    from python_multipart.exceptions import MultipartParseError
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.exceptions import MultipartParseError
+    from multipart.multipart import MultipartParser, parse_options_header
+
+from payload_codecs import PayloadWriter
+from storage import BlobStore, CHUNK_SIZE
+
+# Form fields are metadata only, keep them small
+MAX_FIELD_SIZE = 64 * 1024
+
+class UploadError(Exception):
+    """Raised for malformed multipart bodies."""
+
+class UploadTooLarge(Exception):
+    """Raised as soon as the streamed file exceeds the size limit."""
+
+class StreamedFile:
+    """Result of streaming a file part into the blob store."""
+
+    def __init__(self, field_name: str, filename: str, content_type: Optional[str]):
+        self.field_name = field_name
+        self.filename = filename
+        self.content_type = content_type
+        self.size = 0
+        self.blob_id: Optional[str] = None
+        # Set once stored: how the blob is compressed and its stored size
+        self.codec: Optional[str] = None
+        self.stored_size = 0
+        self._sha256 = hashlib.sha256()
+
+    @property
+    def content_hash(self) -> str:
+        return self._sha256.hexdigest()
+
+class _Part:
+    def __init__(self):
+        self.headers: Dict[bytes, bytes] = {}
+        self.field_name = ""
+        self.data = bytearray()
+        self.file: Optional[StreamedFile] = None
+
+class MultipartUpload:
+    """Streams a multipart/form-data request, writing its single file part to
+    a blob store in CHUNK_SIZE pieces while the body is still arriving,
+    compressed when payload_codecs picks a codec for it.
+
+    Only the current chunk and the small form fields are held in memory. The
+    size limit is enforced as bytes arrive and the SHA-256 of the file is
+    computed on the fly.
+    """
+
+    def __init__(self, request: Request, blob_store: BlobStore, max_file_size: int):
+        self.request = request
+        self.blob_store = blob_store
+        self.max_file_size = max_file_size
+        self.fields: Dict[str, List[str]] = {}
+        self.file: Optional[StreamedFile] = None
+        self._writer: Optional[PayloadWriter] = None
+        self._part = _Part()
+        self._header_name = b""
+        self._header_value = b""
+        self._pending = bytearray()
+        self._charset = "utf-8"
+
+    # Parser callbacks, these run synchronously inside parser.write()
+
+    def _on_part_begin(self) -> None:
+        self._part = _Part()
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._part.file is not None:
+            chunk = data[start:end]
+            self._part.file.size += len(chunk)
+            if self._part.file.size > self.max_file_size:
+                raise UploadTooLarge()
+            self._part.file._sha256.update(chunk)
+            self._pending += chunk
+            return
+        self._part.data += data[start:end]
+        if len(self._part.data) > MAX_FIELD_SIZE:
+            raise UploadError(f'Form field "{self._part.field_name}" is too large')
+
+    def _on_part_end(self) -> None:
+        if self._part.file is not None:
+            return
+        value = self._part.data.decode(self._charset, errors="replace")
+        self.fields.setdefault(self._part.field_name, []).append(value)
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_name += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        self._part.headers[self._header_name.lower()] = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self) -> None:
+        _, options = parse_options_header(
+            self._part.headers.get(b"content-disposition", b"")
+        )
+        if b"name" not in options:
+            raise UploadError('The Content-Disposition header field "name" must be provided')
+        self._part.field_name = options[b"name"].decode(self._charset, errors="replace")
+        if b"filename" not in options:
+            return
+        if self.file is not None:
+            raise UploadError("Only one file may be uploaded per request")
+        content_type = self._part.headers.get(b"content-type")
+        self.file = StreamedFile(
+            self._part.field_name,
+            options[b"filename"].decode(self._charset, errors="replace"),
+            content_type.decode("latin-1") if content_type else None
+        )
+        self._part.file = self.file
+
+    # Async side, drains what the callbacks buffered
+
+    async def _flush(self, final: bool = False) -> None:
+        if self.file is None:
+            return
+        if self._writer is None:
+            self._writer = PayloadWriter(
+                self.blob_store.open_upload(self.file.filename, self.file.content_type),
+                self.file.content_type
+            )
+        while len(self._pending) >= CHUNK_SIZE or (final and self._pending):
+            chunk = bytes(self._pending[:CHUNK_SIZE])
+            del self._pending[:CHUNK_SIZE]
+            await self._writer.write(chunk)
+
+    async def parse(self) -> StreamedFile:
+        """Consume the request body. Returns the stored file; form fields are
+        available on self.fields afterwards."""
+        _, params = parse_options_header(self.request.headers.get("content-type", ""))
+        charset = params.get(b"charset")
+        if charset:
+            self._charset = charset.decode("latin-1")
+        boundary = params.get(b"boundary")
+        if not boundary:
+            raise UploadError("Missing boundary in multipart body")
+
+        parser = MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+        })
+
+        try:
+            async for body_chunk in self.request.stream():
+                self._feed(parser.write, body_chunk)
+                # Write whole chunks through to the blob store as they fill up
+                await self._flush()
+            self._feed(parser.finalize)
+            if self.file is None:
+                raise UploadError("No file part in multipart body")
+            await self._flush(final=True)
+            self.file.blob_id = await self._writer.close()
+            self.file.codec = self._writer.codec
+            self.file.stored_size = self._writer.stored_size
+            self._writer = None
+        except BaseException:
+            await self.abort()
+            raise
+        return self.file
+
+    @staticmethod
+    def _feed(step, *args) -> None:
+        # A malformed body is the client's fault, not a server error
+        try:
+            step(*args)
+        except MultipartParseError as e:
+            raise UploadError(f"Malformed multipart body: {e}")
+
+    async def abort(self) -> None:
+        """Discard a partially written blob."""
+        if self._writer is not None:
+            await self._writer.abort()
+            self._writer = None
+
+    def get(self, name: str) -> Optional[str]:
+        values = self.fields.get(name)
+        return values[-1] if values else None
+
+    def get_list(self, name: str) -> List[str]:
+        return self.fields.get(name, [])
@@ -0,0 +1,74 @@
+"""Runs the backend in-process against mongomock-motor, the same way
+`python -m benchmarks.run --mongo mock` does.
+
+    python -m pytest -q tests
+"""
+import asyncio
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import httpx
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+# Before any backend module is imported: settings are read at import time
+BLOB_DIR = tempfile.mkdtemp(prefix="frc-test-blobs-")
+os.environ.update({
+    "MONGO_URL": "mongodb://mock",
+    "DB_NAME": "frc_test",
+    "BLOB_STORE": "local",
+    "BLOB_STORE_PATH": BLOB_DIR,
+    "WARM_MONGO_POOL": "false",
+})
+
+from mongomock_motor import AsyncMongoMockClient  # noqa: E402
+import motor.motor_asyncio  # noqa: E402
+
+# Every client gets its own empty in-memory server
+motor.motor_asyncio.AsyncIOMotorClient = lambda *args, **kwargs: AsyncMongoMockClient()
+
+TEAM_PASSWORD = "secret-password"
+
+@pytest.fixture
+def run_app():
+    """Run `test(client, app)` against a freshly started app with an empty
+    database; the app's lifespan runs around it."""
+    def run(test, **settings):
+        import server
+        from cache import course_cache, public_material_cache, team_profile_cache
+        from ratelimit import MemoryRateLimitBackend, set_rate_limit_backend
+        from settings import Settings
+
+        # Buckets are process-wide; every test starts with full ones
+        set_rate_limit_backend(MemoryRateLimitBackend(max_keys=1000))
+
+        async def main():
+            # Process-wide too, and keyed without the database
+            for cache in (course_cache, public_material_cache, team_profile_cache):
+                await cache.clear()
+            app = server.create_app(Settings.from_env().model_copy(update=settings))
+            async with app.router.lifespan_context(app):
+                transport = httpx.ASGITransport(app=app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                    await test(client, app)
+
+        asyncio.run(main())
+    return run
+
+async def register_team(client: httpx.AsyncClient, name: str = "Alpha") -> dict:
+    """Register a team. Returns its id and auth headers."""
+    response = await client.post("/api/teams/register", json={
+        "team_name": name,
+        "contact_email": f"{name.lower()}@example.com",
+        "password": TEAM_PASSWORD,
+    })
+    assert response.status_code == 200, response.text
+    body = response.json()
+    return {
+        "id": body["team_profile"]["id"],
+        "headers": {"Authorization": f"Bearer {body['access_token']}"},
+    }
@@ -0,0 +1,112 @@
+import base64
+
+import pytest
+
+from blob_refs import blob_refs
+from storage import BlobNotFound
+from tests.conftest import register_team
+
+async def _upload(client, headers, data: bytes, mime_type="text/plain", is_public=False, title="Notes"):
+    response = await client.post("/api/teams/materials", headers=headers, json={
+        "title": title,
+        "material_type": "document",
+        "file_data": base64.b64encode(data).decode(),
+        "file_name": "notes.txt",
+        "mime_type": mime_type,
+        "is_public": is_public,
+    })
+    assert response.status_code == 200, response.text
+    return response.json()
+
+async def _from_hash(client, headers, content_hash):
+    return await client.post("/api/teams/materials/from-hash", headers=headers, json={
+        "title": "Shared",
+        "material_type": "document",
+        "content_hash": content_hash,
+        "file_name": "shared.txt",
+        "mime_type": "text/plain",
+    })
+
+def test_blob_refcount_follows_from_hash_and_delete(run_app):
+    async def test(client, app):
+        db, blob_store = app.state.db, app.state.blob_store
+        alpha = await register_team(client, "Alpha")
+        beta = await register_team(client, "Beta")
+        original = await _upload(client, alpha["headers"], b"shared robot code " * 100, is_public=True)
+        content_hash = original["content_hash"]
+
+        copy = await _from_hash(client, beta["headers"], content_hash)
+        assert copy.status_code == 200, copy.text
+        assert copy.json()["blob_id"] == original["blob_id"]
+        ref = await db.blob_refs.find_one({"_id": content_hash})
+        assert ref["refcount"] == 2
+
+        # The same bytes uploaded again take a reference instead of a copy
+        again = await _upload(client, beta["headers"], b"shared robot code " * 100)
+        assert again["blob_id"] == original["blob_id"]
+        assert (await db.blob_refs.find_one({"_id": content_hash}))["refcount"] == 3
+
+        for material, team in ((original, alpha), (copy.json(), beta)):
+            response = await client.delete(f"/api/teams/materials/{material['id']}", headers=team["headers"])
+            assert response.status_code == 200
+        assert (await db.blob_refs.find_one({"_id": content_hash}))["refcount"] == 1
+        assert await blob_store.size(original["blob_id"]) > 0
+
+        # The last reference takes the blob with it
+        response = await client.delete(f"/api/teams/materials/{again['id']}", headers=beta["headers"])
+        assert response.status_code == 200
+        assert await db.blob_refs.find_one({"_id": content_hash}) is None
+        with pytest.raises(BlobNotFound):
+            await blob_store.size(original["blob_id"])
+
+    run_app(test)
+
+def test_from_hash_needs_access_to_the_content(run_app):
+    async def test(client, app):
+        alpha = await register_team(client, "Alpha")
+        beta = await register_team(client, "Beta")
+        private = await _upload(client, alpha["headers"], b"private strategy notes")
+
+        response = await _from_hash(client, beta["headers"], private["content_hash"])
+        assert response.status_code == 404
+        ref = await app.state.db.blob_refs.find_one({"_id": private["content_hash"]})
+        assert ref["refcount"] == 1
+
+        response = await _from_hash(client, beta["headers"], "0" * 64)
+        assert response.status_code == 404
+
+    run_app(test)
+
+def test_upload_that_cannot_take_a_reference_is_refused_and_cleaned_up(run_app, monkeypatch):
+    async def test(client, app):
+        db, blob_store = app.state.db, app.state.blob_store
+        team = await register_team(client)
+        data = b"contested robot code"
+        content_hash = (await _upload(client, team["headers"], data))["content_hash"]
+
+        # Every attempt finds the entry taken but cannot reference it
+        async def never_found(digest):
+            return None
+        monkeypatch.setattr(blob_refs, "add_reference", never_found)
+        written = []
+        put = blob_store.put
+
+        async def recording_put(*args, **kwargs):
+            written.append(await put(*args, **kwargs))
+            return written[-1]
+        monkeypatch.setattr(blob_store, "put", recording_put)
+
+        response = await client.post("/api/teams/materials", headers=team["headers"], json={
+            "title": "Again", "material_type": "document",
+            "file_data": base64.b64encode(data).decode(),
+            "file_name": "notes.txt", "mime_type": "text/plain",
+        })
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+        assert len(written) == 1
+        with pytest.raises(BlobNotFound):
+            await blob_store.size(written[0])
+        assert (await db.blob_refs.find_one({"_id": content_hash}))["refcount"] == 1
+        assert await db.team_materials.count_documents({}) == 1
+
+    run_app(test)
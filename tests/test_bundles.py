@@ -0,0 +1,60 @@
+import base64
+import io
+import os
+import zipfile
+
+from tests.conftest import register_team
+
+async def _upload(client, headers, data: bytes, file_name: str, mime_type="text/plain", is_public=True):
+    response = await client.post("/api/teams/materials", headers=headers, json={
+        "title": file_name,
+        "material_type": "document",
+        "file_data": base64.b64encode(data).decode(),
+        "file_name": file_name,
+        "mime_type": mime_type,
+        "is_public": is_public,
+    })
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def test_bundle_zip_holds_the_visible_files(run_app):
+    async def test(client, app):
+        alpha = await register_team(client, "Alpha")
+        beta = await register_team(client, "Beta")
+        notes = b"drive train notes " * 20000
+        photo = os.urandom(300000)
+        await _upload(client, alpha["headers"], notes, "notes.txt")
+        await _upload(client, alpha["headers"], photo, "robot.png", mime_type="image/png")
+        await _upload(client, alpha["headers"], b"second notes", "../notes.txt")
+        gone = await _upload(client, alpha["headers"], b"deleted meanwhile", "gone.txt")
+        await _upload(client, alpha["headers"], b"alpha only", "private.txt", is_public=False)
+        await app.state.blob_store.delete(gone["blob_id"])
+
+        response = await client.get("/api/materials/bundle", params={"team_id": alpha["id"]})
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/zip"
+        archive = zipfile.ZipFile(io.BytesIO(response.content))
+        assert archive.testzip() is None
+        entries = {info.filename: info for info in archive.infolist()}
+        # Unique names without directories; private files of other teams left out
+        assert list(entries) == ["notes.txt", "robot.png", "notes (2).txt", "MISSING.txt"]
+        assert archive.read("notes.txt") == notes
+        assert archive.read("robot.png") == photo
+        assert archive.read("notes (2).txt") == b"second notes"
+        assert archive.read("MISSING.txt").decode().splitlines()[1:] == ["gone.txt"]
+        # Already compressed formats are stored, text is deflated
+        assert entries["robot.png"].compress_type == zipfile.ZIP_STORED
+        assert entries["notes.txt"].compress_type == zipfile.ZIP_DEFLATED
+        assert entries["notes.txt"].compress_size < len(notes) // 10
+
+        # The owner also gets its private files
+        response = await client.get(
+            "/api/materials/bundle", headers=alpha["headers"], params={"team_id": alpha["id"]}
+        )
+        assert "private.txt" in zipfile.ZipFile(io.BytesIO(response.content)).namelist()
+        response = await client.get(
+            "/api/materials/bundle", headers=beta["headers"], params={"team_id": beta["id"]}
+        )
+        assert response.status_code == 404
+
+    run_app(test)
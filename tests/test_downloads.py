@@ -0,0 +1,99 @@
+import asyncio
+import base64
+import os
+
+import pytest
+
+from cache import InvalidationBus
+from notifications import Transport
+from ratelimit import RateLimitBackend
+from storage import BlobStore, LocalBlobStore
+from tests.conftest import register_team
+
+async def _upload(client, headers, data: bytes, mime_type: str):
+    response = await client.post("/api/teams/materials", headers=headers, json={
+        "title": "Notes",
+        "material_type": "document",
+        "file_data": base64.b64encode(data).decode(),
+        "file_name": "notes.txt",
+        "mime_type": mime_type,
+    })
+    assert response.status_code == 200, response.text
+    return response.json()
+
+# Compressible text is stored as zstd, random bytes raw; ranges must come
+# out the same for both
+PAYLOADS = {
+    "zstd": ("text/plain", b"0123456789abcdef" * 40000),
+    "raw": ("application/octet-stream", os.urandom(640000)),
+}
+
+@pytest.mark.parametrize("kind", PAYLOADS)
+def test_download_ranges(run_app, kind):
+    mime_type, data = PAYLOADS[kind]
+
+    async def test(client, app):
+        team = await register_team(client)
+        material = await _upload(client, team["headers"], data, mime_type)
+        assert material["codec"] == ("zstd" if kind == "zstd" else None)
+        url = f"/api/teams/materials/{material['id']}/download"
+        size = len(data)
+
+        response = await client.get(url, headers=team["headers"])
+        assert response.status_code == 200
+        assert response.content == data
+
+        for header, start, end in (
+            ("bytes=0-99", 0, 99),
+            ("bytes=300000-300009", 300000, 300009),
+            ("bytes=600000-", 600000, size - 1),
+            ("bytes=-10", size - 10, size - 1),
+            (f"bytes=100-{size + 500}", 100, size - 1),
+        ):
+            response = await client.get(url, headers={**team["headers"], "Range": header})
+            assert response.status_code == 206, header
+            assert response.headers["Content-Range"] == f"bytes {start}-{end}/{size}"
+            assert response.headers["Content-Length"] == str(end - start + 1)
+            assert response.content == data[start:end + 1]
+
+        for header in (f"bytes={size}-", "bytes=10-5", "bytes=0-1,5-6", "items=0-1", "bytes=x-y"):
+            response = await client.get(url, headers={**team["headers"], "Range": header})
+            assert response.status_code == 416, header
+            assert response.headers["Content-Range"] == f"bytes */{size}"
+
+    run_app(test)
+
+def test_download_of_a_private_material_needs_its_team(run_app):
+    async def test(client, app):
+        alpha = await register_team(client, "Alpha")
+        beta = await register_team(client, "Beta")
+        material = await _upload(client, alpha["headers"], b"private notes", "text/plain")
+        url = f"/api/teams/materials/{material['id']}/download"
+        assert (await client.get(url)).status_code == 404
+        assert (await client.get(url, headers=beta["headers"])).status_code == 404
+        response = await client.get(url, headers=alpha["headers"])
+        assert response.status_code == 200
+        assert response.content == b"private notes"
+        assert response.headers["Accept-Ranges"] == "bytes"
+
+    run_app(test)
+
+@pytest.mark.parametrize("base", [BlobStore, InvalidationBus, Transport, RateLimitBackend])
+def test_incomplete_implementations_fail_when_created(base):
+    class Incomplete(base):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+def test_local_blob_store_round_trip(tmp_path):
+    async def main():
+        blob_store = LocalBlobStore(str(tmp_path))
+        data = os.urandom(600 * 1024)
+        blob_id = await blob_store.put(data, "file.bin")
+        assert await blob_store.size(blob_id) == len(data)
+        assert await blob_store.read(blob_id) == data
+        assert b"".join([chunk async for chunk in blob_store.open_download(blob_id, 1000, 1999)]) == data[1000:2000]
+        await blob_store.delete(blob_id)
+
+    asyncio.run(main())
@@ -0,0 +1,29 @@
+from enrichment import enrich_materials, fetch_public_teams
+from images import LOGO_VARIANT, media_url
+
+INLINE_LOGO = "data:image/png;base64," + "A" * 4096
+
+def test_inline_logos_never_leave_the_database(run_app):
+    async def test(client, app):
+        db = app.state.db
+        await db.teams.insert_many([
+            {"id": "legacy", "team_name": "Legacy", "contact_email": "legacy@example.com",
+             "logo_url": INLINE_LOGO, "password_hash": "x"},
+            {"id": "migrated", "team_name": "Migrated", "contact_email": "migrated@example.com",
+             "logo_hash": "ab" * 16, "logo_url": media_url("ab" * 16, LOGO_VARIANT)},
+            {"id": "linked", "team_name": "Linked", "contact_email": "linked@example.com",
+             "logo_url": "https://example.com/logo.png"},
+            {"id": "plain", "team_name": "Plain"},
+        ])
+
+        teams = await fetch_public_teams(db, ["legacy", "migrated", "linked", "plain", None])
+        assert teams["legacy"]["logo_url"] is None
+        assert teams["migrated"]["logo_url"] == media_url("ab" * 16, LOGO_VARIANT)
+        assert teams["linked"]["logo_url"] == "https://example.com/logo.png"
+        assert teams["plain"]["logo_url"] is None
+        assert all("password_hash" not in team for team in teams.values())
+
+        [material] = await enrich_materials(db, [{"id": "m", "team_id": "legacy"}])
+        assert material["team_info"] == {"team_name": "Legacy", "logo_url": None, "social_media": {}}
+
+    run_app(test)
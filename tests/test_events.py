@@ -0,0 +1,62 @@
+import asyncio
+import json
+
+from mongomock_motor import AsyncMongoMockClient
+
+import events
+from events import EventBroker, stream_events
+
+def _parse(frame: str) -> dict:
+    fields = dict(line.split(": ", 1) for line in frame.strip().split("\n"))
+    return {**fields, "data": json.loads(fields["data"])}
+
+def test_reconnecting_client_gets_missed_events_once_then_live_ones(monkeypatch):
+    broker = EventBroker(queue_size=8)
+    monkeypatch.setattr(events, "event_broker", broker)
+
+    async def test():
+        broker.bind(AsyncMongoMockClient()["events_test"])
+        for n in range(3):
+            await broker.publish("alpha", "material.created", {"n": n})
+        await broker.publish("beta", "material.created", {"n": 99})
+        first = await broker.collection.find_one({"team_id": "alpha", "data.n": 0})
+
+        stream = stream_events("alpha", str(first["_id"]))
+        assert await anext(stream) == f"retry: {events.EVENTS_RETRY_MS}\n\n"
+        # Published after subscribing but before the replay query: it is in
+        # both the replay and the live queue, and must be sent once
+        await broker.publish("alpha", "material.created", {"n": 3})
+
+        replayed = [_parse(await anext(stream)) for _ in range(3)]
+        assert [event["data"]["n"] for event in replayed] == [1, 2, 3]
+        assert all(event["event"] == "material.created" for event in replayed)
+
+        await broker.publish("alpha", "material.deleted", {"n": 4})
+        live = _parse(await asyncio.wait_for(anext(stream), 1))
+        assert (live["event"], live["data"]) == ("material.deleted", {"n": 4})
+        assert live["id"] > replayed[-1]["id"]
+
+        await stream.aclose()
+        assert broker.stats()["connections"] == 0
+
+    asyncio.run(test())
+
+def test_unrecoverable_resume_points_ask_the_client_to_reload(monkeypatch):
+    broker = EventBroker(queue_size=8)
+    monkeypatch.setattr(events, "event_broker", broker)
+    monkeypatch.setattr(events, "EVENTS_REPLAY_LIMIT", 2)
+
+    async def test():
+        broker.bind(AsyncMongoMockClient()["events_test"])
+        for n in range(4):
+            await broker.publish("alpha", "material.created", {"n": n})
+        first = await broker.collection.find_one({"team_id": "alpha", "data.n": 0})
+
+        # Too far behind for the replay limit, and not an event id at all
+        for last_event_id in (str(first["_id"]), "not-an-id"):
+            stream = stream_events("alpha", last_event_id)
+            await anext(stream)
+            assert await anext(stream) == f"event: {events.RESET_EVENT}\ndata: {{}}\n\n"
+            await stream.aclose()
+
+    asyncio.run(test())
@@ -0,0 +1,126 @@
+import gzip
+from datetime import datetime
+
+import compression
+from tests.conftest import register_team
+
+def _course(i: int) -> dict:
+    return {
+        "id": f"course-{i:03d}",
+        "title": f"Course {i}",
+        "description": "Wiring the robot, step by step. " * 5,
+        "category": "Elektronik",
+        "duration": "2 saat",
+        "level": "Orta",
+        "image_url": "https://example.com/course.png",
+        "is_active": True,
+        "created_at": datetime(2024, 1, 1 + i % 28, 12, i),
+        "updated_at": datetime(2024, 3, 1, 12, 0),
+    }
+
+async def _seed(app, count=20):
+    await app.state.db.courses.insert_many([_course(i) for i in range(count)])
+
+def test_catalog_answers_304_for_a_current_copy(run_app):
+    async def test(client, app):
+        await _seed(app)
+        response = await client.get("/api/courses", headers={"Accept-Encoding": "identity"})
+        assert response.status_code == 200
+        etag = response.headers["ETag"]
+        assert etag.startswith('W/"')
+        assert response.headers["Last-Modified"] == "Fri, 01 Mar 2024 12:00:00 GMT"
+        assert "public" in response.headers["Cache-Control"]
+
+        response = await client.get("/api/courses", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["ETag"] == etag
+
+        # Strong form of the same tag, and one of several
+        response = await client.get("/api/courses", headers={"If-None-Match": f'"x", {etag[2:]}'})
+        assert response.status_code == 304
+
+        response = await client.get(
+            "/api/courses", headers={"If-Modified-Since": "Fri, 01 Mar 2024 12:00:00 GMT"}
+        )
+        assert response.status_code == 304
+        response = await client.get(
+            "/api/courses", headers={"If-Modified-Since": "Thu, 29 Feb 2024 12:00:00 GMT"}
+        )
+        assert response.status_code == 200
+
+        response = await client.get("/api/courses", headers={"If-None-Match": 'W/"stale"'})
+        assert response.status_code == 200
+        assert len(response.json()) == 20
+
+    run_app(test)
+
+def test_cached_payloads_are_compressed_once(run_app, monkeypatch):
+    calls = []
+    original = compression.compress
+
+    def counting_compress(body, encoding):
+        calls.append(encoding)
+        return original(body, encoding)
+
+    monkeypatch.setattr(compression, "compress", counting_compress)
+
+    async def test(client, app):
+        await _seed(app)
+        bodies = []
+        for _ in range(3):
+            response = await client.get("/api/courses", headers={"Accept-Encoding": "gzip"})
+            assert response.status_code == 200
+            assert response.headers["Content-Encoding"] == "gzip"
+            assert "Accept-Encoding" in response.headers["Vary"]
+            bodies.append(response.json())
+        assert bodies[0] == bodies[1] == bodies[2]
+        assert calls == ["gzip"]
+
+        # The identity body is the same document
+        response = await client.get("/api/courses", headers={"Accept-Encoding": "identity"})
+        assert "Content-Encoding" not in response.headers
+        assert response.json() == bodies[0]
+
+    run_app(test)
+
+def test_large_bodies_are_compressed_off_the_loop(run_app, monkeypatch):
+    threaded = []
+    original = compression.asyncio.to_thread
+
+    async def recording_to_thread(func, *args):
+        threaded.append(func.__name__)
+        return await original(func, *args)
+
+    monkeypatch.setattr(compression, "COMPRESS_THREAD_BYTES", 4096)
+    monkeypatch.setattr(compression.asyncio, "to_thread", recording_to_thread)
+
+    async def test(client, app):
+        await _seed(app, 40)
+        response = await client.get("/api/courses", headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert len(response.json()) == 40
+        assert "compress" in threaded
+
+    run_app(test)
+
+def test_uncached_responses_get_an_etag_and_304(run_app):
+    async def test(client, app):
+        team = await register_team(client)
+        response = await client.get("/api/teams/messages", headers=team["headers"])
+        assert response.status_code == 200
+        etag = response.headers["ETag"]
+
+        response = await client.get(
+            "/api/teams/messages", headers={**team["headers"], "If-None-Match": etag}
+        )
+        assert response.status_code == 304
+
+    run_app(test)
+
+def test_encoding_negotiation_and_gzip_round_trip():
+    body = b'{"items": [' + b'"robot",' * 500 + b'"end"]}'
+    assert gzip.decompress(compression.compress(body, "gzip")) == body
+    assert compression.choose_encoding("gzip;q=0, identity") is None
+    assert compression.choose_encoding("deflate, gzip;q=0.5") == "gzip"
+    assert compression.choose_encoding(None) is None
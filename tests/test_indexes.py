@@ -0,0 +1,52 @@
+from indexes import ensure_indexes, missing_required_indexes, report_indexes
+from tests.conftest import TEAM_PASSWORD, register_team
+
+async def _register(client, name, email):
+    return await client.post("/api/teams/register", json={
+        "team_name": name, "contact_email": email, "password": TEAM_PASSWORD,
+    })
+
+def test_startup_builds_every_declared_index(run_app):
+    async def test(client, app):
+        report = await report_indexes(app.state.db)
+        assert all(not entry["missing"] for entry in report.values()), report
+        assert app.state.missing_indexes == []
+
+        response = await client.get("/readyz")
+        assert response.status_code == 200
+        assert response.json()["status"] == "ready"
+
+    run_app(test)
+
+def test_duplicate_teams_are_rejected_by_the_unique_indexes(run_app):
+    async def test(client, app):
+        await register_team(client, "Alpha")
+        for name, email in (("Alpha", "other@example.com"), ("Other", "alpha@example.com")):
+            response = await _register(client, name, email)
+            assert response.status_code == 400
+        assert await app.state.db.teams.count_documents({}) == 1
+
+    run_app(test)
+
+def test_missing_unique_indexes_fail_readiness_and_fall_back_to_a_check(run_app):
+    async def test(client, app):
+        db = app.state.db
+        assert app.state.missing_indexes == ["teams.contact_email_unique", "teams.team_name_unique"]
+        response = await client.get("/readyz")
+        assert response.status_code == 503
+        assert response.json()["status"] == "missing_indexes"
+
+        # Registration still refuses duplicates without the indexes
+        await register_team(client, "Alpha")
+        response = await _register(client, "Alpha", "other@example.com")
+        assert response.status_code == 400
+        assert await db.teams.count_documents({}) == 1
+
+        # Ready once `python -m indexes` has run
+        await ensure_indexes(db)
+        assert await missing_required_indexes(db) == []
+        response = await client.get("/readyz")
+        assert response.status_code == 200
+        assert app.state.missing_indexes == []
+
+    run_app(test, build_indexes=False)
@@ -0,0 +1,110 @@
+import asyncio
+
+from mongomock_motor import AsyncMongoMockClient
+from pymongo.errors import AutoReconnect
+
+import jobs
+from jobs import JobQueue, PermanentJobError
+
+def _queue(handler, max_attempts=3) -> JobQueue:
+    queue = JobQueue(workers=1)
+    queue.bind(AsyncMongoMockClient()["jobs_test"])
+    queue.register("sync", handler, max_attempts=max_attempts)
+    return queue
+
+async def _work_once(queue: JobQueue) -> None:
+    job = await queue._claim()
+    assert job is not None
+    await queue._run(job)
+
+def test_failed_jobs_are_retried_until_they_succeed(monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_BACKOFF_SECONDS", 0)
+    calls = []
+
+    async def handler(payload):
+        calls.append(payload)
+        if len(calls) == 1:
+            raise ValueError("flaky")
+
+    async def test():
+        queue = _queue(handler)
+        job_id = await queue.enqueue("sync", {"team": "a"})
+
+        await _work_once(queue)
+        job = await queue.collection.find_one({"_id": job_id})
+        assert (job["status"], job["attempts"]) == ("queued", 1)
+        assert "ValueError: flaky" in job["last_error"]
+
+        await _work_once(queue)
+        job = await queue.collection.find_one({"_id": job_id})
+        assert job["status"] == "done"
+        assert calls == [{"team": "a"}, {"team": "a"}]
+        assert await queue._claim() is None
+
+    asyncio.run(test())
+
+def test_jobs_that_keep_failing_are_dead_lettered(monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_BACKOFF_SECONDS", 0)
+
+    async def handler(payload):
+        if payload.get("permanent"):
+            raise PermanentJobError("bad payload")
+        raise ValueError("down")
+
+    async def test():
+        queue = _queue(handler, max_attempts=2)
+        retried = await queue.enqueue("sync")
+        permanent = await queue.enqueue("sync", {"permanent": True})
+        for _ in range(3):
+            await _work_once(queue)
+
+        assert await queue.collection.count_documents({}) == 0
+        dead = {doc["_id"]: doc async for doc in queue.dead_letters.find()}
+        assert dead[retried]["attempts"] == 2
+        assert "ValueError: down" in dead[retried]["last_error"]
+        assert dead[permanent]["attempts"] == 1
+
+        # Dead-lettering the same job again, as a retry after a partial
+        # failure does, keeps a single copy
+        await queue._failed(dead[permanent], PermanentJobError("bad payload"))
+        assert await queue.dead_letters.count_documents({}) == 2
+
+    asyncio.run(test())
+
+def test_workers_survive_database_errors_while_finishing_a_job(monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_POLL_SECONDS", 0.01)
+    handled = []
+
+    async def handler(payload):
+        handled.append(payload["n"])
+
+    async def test():
+        queue = _queue(handler)
+        update_one = queue.collection.update_one
+        failures = []
+
+        async def flaky_update_one(*args, **kwargs):
+            if not failures:
+                failures.append(args)
+                raise AutoReconnect("primary stepped down")
+            return await update_one(*args, **kwargs)
+        queue.collection.update_one = flaky_update_one
+
+        first = await queue.enqueue("sync", {"n": 1})
+        second = await queue.enqueue("sync", {"n": 2})
+        await queue.start()
+        try:
+            for _ in range(200):
+                if (await queue.collection.find_one({"_id": second}))["status"] == "done":
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            await queue.stop()
+
+        assert handled == [1, 2]
+        assert len(failures) == 1
+        # Still leased, so it is retried once the lease runs out
+        job = await queue.collection.find_one({"_id": first})
+        assert job["status"] == "running" and job["lease_until"]
+
+    asyncio.run(test())
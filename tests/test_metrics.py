@@ -0,0 +1,127 @@
+from types import SimpleNamespace
+
+import pytest
+
+import metrics
+from metrics import (
+    Counter, Gauge, Histogram, MongoCommandListener, Registry, RequestStats, add_stats_collector,
+    current_request, http_requests, mongo_bytes, mongo_commands
+)
+
+def test_counter_counts_per_label_values():
+    counter = Counter("widgets_total", "Widgets made", ["color"])
+    counter.inc("red")
+    counter.inc("red", amount=2)
+    counter.inc("blue")
+    assert counter.value("red") == 3
+    assert counter.value("blue") == 1
+    assert counter.value("green") == 0
+
+    lines = counter.render()
+    assert lines[:2] == ["# HELP widgets_total Widgets made", "# TYPE widgets_total counter"]
+    assert 'widgets_total{color="red"} 3.0' in lines
+    assert 'widgets_total{color="blue"} 1.0' in lines
+
+def test_label_values_are_escaped():
+    counter = Counter("quoted_total", "Quoted labels", ["path"])
+    counter.inc('a"b\\c\nd')
+    assert 'quoted_total{path="a\\"b\\\\c\\nd"} 1.0' in counter.render()
+
+def test_gauge_goes_both_ways():
+    gauge = Gauge("queue_depth", "Items waiting")
+    gauge.inc(amount=5)
+    gauge.dec(amount=2)
+    assert gauge.value() == 3
+    assert "# TYPE queue_depth gauge" in gauge.render()
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("latency_seconds", "Latency", ["route"], buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value, "/a")
+    assert histogram.count("/a") == 4
+    lines = histogram.render()
+    assert 'latency_seconds_bucket{route="/a",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{route="/a",le="1.0"} 3' in lines
+    assert 'latency_seconds_bucket{route="/a",le="+Inf"} 4' in lines
+    assert 'latency_seconds_count{route="/a"} 4' in lines
+    assert any(line.startswith('latency_seconds_sum{route="/a"} 6.05') for line in lines)
+
+def test_registry_renders_metrics_and_collected_stats():
+    local = Registry()
+    local.register(Counter("jobs_total", "Jobs run")).inc(amount=4)
+    local.add_collector(lambda: [("queue_size", "gauge", {"queue": "mail"}, 2)])
+    text = local.render()
+    assert "jobs_total 4.0" in text
+    assert 'queue_size{queue="mail"} 2' in text
+
+def test_stats_collector_exports_component_stats(monkeypatch):
+    local = Registry()
+    monkeypatch.setattr(metrics, "registry", local)
+    add_stats_collector("cache", lambda: {"hits": 7, "misses": 2})
+    add_stats_collector("pool", lambda: {"a": {"size": 1}, "b": {"size": 3}}, label="pool")
+    text = local.render()
+    assert "cache_hits 7" in text
+    assert "cache_misses 2" in text
+    # One TYPE line per family, labelled samples together under it
+    assert text.count("# TYPE pool_size gauge") == 1
+    assert 'pool_size{pool="a"} 1\npool_size{pool="b"} 3' in text
+
+def _command_events(request_id: int):
+    started = SimpleNamespace(request_id=request_id, command={"find": "teams", "filter": {}})
+    succeeded = SimpleNamespace(
+        request_id=request_id, command_name="find", duration_micros=2500,
+        reply={"cursor": {"firstBatch": [{"x": "y" * 100}]}}
+    )
+    return started, succeeded
+
+def test_mongo_commands_are_timed_without_sizing_by_default():
+    listener = MongoCommandListener()
+    stats = RequestStats()
+    token = current_request.set(stats)
+    try:
+        before = (mongo_commands.value("find", "success"), mongo_bytes.value("received"))
+        started, succeeded = _command_events(1)
+        listener.started(started)
+        listener.succeeded(succeeded)
+    finally:
+        current_request.reset(token)
+    assert mongo_commands.value("find", "success") == before[0] + 1
+    assert mongo_bytes.value("received") == before[1]
+    assert (stats.db_commands, stats.db_bytes) == (1, 0)
+    assert stats.db_seconds == pytest.approx(0.0025)
+
+def test_mongo_command_sizes_when_enabled(monkeypatch):
+    monkeypatch.setattr(metrics, "MONGO_METRICS_BYTES", True)
+    listener = MongoCommandListener()
+    stats = RequestStats()
+    token = current_request.set(stats)
+    try:
+        started, succeeded = _command_events(2)
+        listener.started(started)
+        listener.succeeded(succeeded)
+    finally:
+        current_request.reset(token)
+    assert stats.db_bytes > 100
+
+def test_requests_are_counted_per_route_template(run_app):
+    async def test(client, app):
+        route = "/api/teams/materials/{material_id}/download"
+        before = http_requests.value("GET", route, "404")
+        for material_id in ("one", "two"):
+            response = await client.get(f"/api/teams/materials/{material_id}/download")
+            assert response.status_code == 404
+            assert "Server-Timing" in response.headers
+        assert http_requests.value("GET", route, "404") == before + 2
+
+        response = await client.get("/metrics")
+        assert response.status_code == 200
+        assert f'http_requests_total{{method="GET",route="{route}",status="404"}}' in response.text
+
+    run_app(test)
+
+@pytest.mark.parametrize("path", ["/healthz", "/metrics"])
+def test_probe_routes_answer(run_app, path):
+    async def test(client, app):
+        assert (await client.get(path)).status_code == 200
+
+    run_app(test)
@@ -0,0 +1,74 @@
+import json
+from datetime import datetime
+
+import auth
+import ndjson
+
+ADMIN_KEY = "test-admin-key"
+
+def _course(id, title="Swerve basics", **fields):
+    return {
+        "id": id, "title": title, "description": "An introduction for new team members.",
+        "category": "Kodlama", "duration": "2 saat", "level": "Başlangıç",
+        "image_url": "https://example.com/c.png", **fields,
+    }
+
+def _ndjson(*rows) -> bytes:
+    return b"".join(
+        (row if isinstance(row, bytes) else json.dumps(row).encode()) + b"\n" for row in rows
+    )
+
+async def _import(client, body: bytes):
+    response = await client.post(
+        "/api/admin/courses/import", content=body,
+        headers={"X-Admin-Key": ADMIN_KEY, "Content-Type": ndjson.NDJSON_MEDIA_TYPE}
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def test_import_reports_bad_rows_by_line(run_app, monkeypatch):
+    monkeypatch.setattr(auth, "ADMIN_API_KEY", ADMIN_KEY)
+    monkeypatch.setattr(ndjson, "MAX_LINE_BYTES", 1024)
+
+    async def test(client, app):
+        report = await _import(client, _ndjson(
+            _course("one"),
+            b"{not json",
+            _course("two", title=""),
+            [1, 2],
+            b"",
+            # Long line in the middle of a chunk, not at its end
+            _course("long", content="x" * 2000),
+            _course("three"),
+        ))
+        assert (report["received"], report["inserted"], report["failed"]) == (6, 2, 4)
+        errors = {error["line"]: error["error"] for error in report["errors"]}
+        assert sorted(errors) == [2, 3, 4, 6]
+        assert errors[3].startswith("title:")
+        assert errors[4] == "Expected a JSON object"
+        assert errors[6] == "Line longer than 1024 bytes"
+        ids = await app.state.db.courses.distinct("id")
+        assert sorted(ids) == ["one", "three"]
+
+    run_app(test)
+
+def test_reimport_updates_courses_but_keeps_created_at(run_app, monkeypatch):
+    monkeypatch.setattr(auth, "ADMIN_API_KEY", ADMIN_KEY)
+
+    async def test(client, app):
+        db = app.state.db
+        await _import(client, _ndjson(_course("one", created_at="2024-01-01T00:00:00")))
+        created_at = (await db.courses.find_one({"id": "one"}))["created_at"]
+        assert created_at == datetime(2024, 1, 1)
+
+        report = await _import(client, _ndjson(
+            _course("one", title="Swerve, revised", created_at="2025-06-01T00:00:00")
+        ))
+        assert (report["inserted"], report["updated"]) == (0, 1)
+        course = await db.courses.find_one({"id": "one"})
+        assert course["title"] == "Swerve, revised"
+        assert course["created_at"] == created_at
+        assert course["updated_at"] > created_at
+        assert await db.courses.count_documents({}) == 1
+
+    run_app(test)
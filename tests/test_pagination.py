@@ -0,0 +1,102 @@
+import base64
+from datetime import datetime
+
+from indexes import backfill_sort_keys
+from tests.conftest import register_team
+
+async def _upload(client, headers, data: bytes, title: str):
+    response = await client.post("/api/teams/materials", headers=headers, json={
+        "title": title,
+        "material_type": "document",
+        "file_data": base64.b64encode(data).decode(),
+        "file_name": "notes.txt",
+        "mime_type": "text/plain",
+    })
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def test_cursor_pagination_visits_every_material_once(run_app):
+    async def test(client, app):
+        team = await register_team(client)
+        created = [
+            (await _upload(client, team["headers"], f"file {i}".encode(), f"Notes {i}"))["id"]
+            for i in range(7)
+        ]
+
+        seen, pages, cursor = [], 0, None
+        while True:
+            params = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+            response = await client.get("/api/teams/materials", headers=team["headers"], params=params)
+            assert response.status_code == 200
+            pages += 1
+            seen += [material["id"] for material in response.json()]
+            cursor = response.headers.get("X-Next-Cursor")
+            if cursor is None:
+                break
+            assert 'rel="next"' in response.headers["Link"]
+
+        assert pages == 3
+        # Newest first, no duplicates or gaps across pages
+        assert seen == list(reversed(created))
+
+        # A material added meanwhile does not shift later pages
+        first = await client.get("/api/teams/materials", headers=team["headers"], params={"limit": 3})
+        await _upload(client, team["headers"], b"late", "Late")
+        second = await client.get(
+            "/api/teams/materials", headers=team["headers"],
+            params={"limit": 3, "cursor": first.headers["X-Next-Cursor"]}
+        )
+        assert [material["id"] for material in second.json()] == seen[3:6]
+
+        response = await client.get(
+            "/api/teams/materials", headers=team["headers"], params={"cursor": "not-a-cursor"}
+        )
+        assert response.status_code == 400
+
+    run_app(test)
+
+def test_fields_limit_the_returned_keys(run_app):
+    async def test(client, app):
+        team = await register_team(client)
+        await _upload(client, team["headers"], b"notes", "Notes")
+        response = await client.get(
+            "/api/teams/materials", headers=team["headers"], params={"fields": "title,file_size"}
+        )
+        assert response.status_code == 200
+        [material] = response.json()
+        # Plus the keys the cursor is built from
+        assert set(material) == {"title", "file_size", "id", "created_at"}
+        assert (material["title"], material["file_size"]) == ("Notes", 5)
+
+        response = await client.get(
+            "/api/teams/materials", headers=team["headers"], params={"fields": "title,file_data"}
+        )
+        assert response.status_code == 400
+
+    run_app(test)
+
+def test_documents_without_sort_keys_are_skipped_until_backfilled(run_app):
+    async def test(client, app):
+        db = app.state.db
+        await db.courses.insert_many([
+            {"id": "new", "title": "New", "created_at": datetime(2024, 2, 1)},
+            {"id": "old", "title": "Old", "created_at": datetime(2024, 1, 1)},
+            # Written before the app stored created_at
+            {"id": "legacy", "title": "Legacy"},
+        ])
+        response = await client.get("/api/courses", params={"limit": 1})
+        assert response.status_code == 200
+        cursor = response.headers["X-Next-Cursor"]
+        response = await client.get("/api/courses", params={"limit": 1, "cursor": cursor})
+        assert [course["id"] for course in response.json()] == ["old"]
+        assert "X-Next-Cursor" not in response.headers
+
+        assert (await backfill_sort_keys(db))["courses"] == 1
+        legacy = await db.courses.find_one({"id": "legacy"})
+        assert isinstance(legacy["created_at"], datetime)
+        # Stored once; a second run changes nothing
+        assert (await backfill_sort_keys(db))["courses"] == 0
+        response = await client.get("/api/courses", params={"limit": 10})
+        assert {course["id"] for course in response.json()} == {"new", "old", "legacy"}
+
+    run_app(test)
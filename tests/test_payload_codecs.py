@@ -0,0 +1,81 @@
+import asyncio
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import payload_codecs
+from payload_codecs import ZSTD, encode, open_payload, read_payload
+from storage import CHUNK_SIZE, LocalBlobStore
+
+zstandard = pytest.importorskip("zstandard")
+
+TEXT = b"".join(b"line %d of the robot log\n" % i for i in range(200000))
+
+async def _store(blob_store: LocalBlobStore, data: bytes) -> str:
+    return await blob_store.put(await encode(data, ZSTD), "log.txt", "text/plain")
+
+def test_concurrent_downloads_do_not_exhaust_a_small_executor():
+    async def main():
+        # Fewer threads than downloads; chunk reads and decoding share them
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=2))
+        blob_store = LocalBlobStore(tempfile.mkdtemp(prefix="frc-test-codecs-"))
+        blob_id = await _store(blob_store, TEXT)
+        results = await asyncio.wait_for(
+            asyncio.gather(*(read_payload(blob_store, blob_id, ZSTD) for _ in range(6))), 30
+        )
+        assert all(result == TEXT for result in results)
+
+        start, end = 1000000, 1000099
+        ranged = b"".join([chunk async for chunk in open_payload(blob_store, blob_id, ZSTD, start, end)])
+        assert ranged == TEXT[start:end + 1]
+
+    asyncio.run(main())
+
+def test_cancelling_a_download_midway_closes_it_cleanly():
+    async def main():
+        blob_store = LocalBlobStore(tempfile.mkdtemp(prefix="frc-test-codecs-"))
+        blob_id = await _store(blob_store, TEXT)
+        first = asyncio.Event()
+
+        async def consume():
+            async for _ in open_payload(blob_store, blob_id, ZSTD):
+                first.set()
+                await asyncio.sleep(0)
+
+        task = asyncio.ensure_future(consume())
+        await asyncio.wait_for(first.wait(), 10)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        # Closing a partly read stream from outside works too
+        stream = open_payload(blob_store, blob_id, ZSTD)
+        assert len(await stream.__anext__()) <= CHUNK_SIZE
+        await stream.aclose()
+
+    asyncio.run(main())
+
+def test_very_compressible_payloads_decode_in_bounded_steps(monkeypatch):
+    decoded_sizes = []
+    to_thread = asyncio.to_thread
+
+    async def recording_to_thread(fn, *args):
+        result = await to_thread(fn, *args)
+        if getattr(fn, "__name__", None) == "decompress":
+            decoded_sizes.append(len(result))
+        return result
+    monkeypatch.setattr(payload_codecs.asyncio, "to_thread", recording_to_thread)
+
+    async def main():
+        blob_store = LocalBlobStore(tempfile.mkdtemp(prefix="frc-test-codecs-"))
+        zeros = bytes(64 * 1024 * 1024)
+        blob_id = await blob_store.put(zstandard.ZstdCompressor().compress(zeros), "zeros", None)
+        size = 0
+        async for chunk in open_payload(blob_store, blob_id, ZSTD):
+            assert len(chunk) <= CHUNK_SIZE
+            size += len(chunk)
+        assert size == len(zeros)
+
+    asyncio.run(main())
+    assert max(decoded_sizes) <= 8 * 1024 * 1024
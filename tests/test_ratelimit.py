@@ -0,0 +1,193 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import HTTPException
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+import ratelimit
+from ratelimit import (
+    AdmissionControlMiddleware, AdmissionController, MemoryRateLimitBackend, RateLimit,
+    contact_team_limit, parse_rate, rate_limited
+)
+from tests.conftest import register_team
+
+def test_parse_rate():
+    assert parse_rate("10/minute") == (10 / 60, 10)
+    assert parse_rate("5/second") == (5.0, 5)
+    with pytest.raises(ValueError):
+        parse_rate("often")
+
+def test_token_bucket_spends_burst_then_refills(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, "monotonic", lambda: now[0])
+    backend = MemoryRateLimitBackend(max_keys=10)
+
+    async def main():
+        # 3 tokens, one back every 10 seconds
+        waits = [await backend.take("key", 0.1, 3) for _ in range(4)]
+        assert waits[:3] == [0.0, 0.0, 0.0]
+        assert waits[3] == pytest.approx(10.0)
+        # Other keys have their own bucket
+        assert await backend.take("other", 0.1, 3) == 0.0
+
+        now[0] += 10
+        assert await backend.take("key", 0.1, 3) == 0.0
+        assert await backend.take("key", 0.1, 3) > 0
+
+        # Never more than the burst, however long it was idle
+        now[0] += 3600
+        waits = [await backend.take("key", 0.1, 3) for _ in range(4)]
+        assert waits.count(0.0) == 3
+
+    asyncio.run(main())
+
+def test_token_bucket_evicts_least_recently_used_keys():
+    backend = MemoryRateLimitBackend(max_keys=2)
+
+    async def main():
+        for key in ("a", "b", "a", "c"):
+            await backend.take(key, 1.0, 1)
+        assert backend.stats() == {"keys": 2, "evictions": 1}
+        # "b" was dropped and comes back full; "a" is still empty
+        assert await backend.take("b", 1.0, 1) == 0.0
+        assert await backend.take("c", 1.0, 1) > 0
+
+    asyncio.run(main())
+
+def test_rate_limit_raises_429_with_retry_after(monkeypatch):
+    monkeypatch.setattr(ratelimit, "_backend", MemoryRateLimitBackend(max_keys=10))
+    limit = RateLimit("test_limit", "2/minute")
+
+    async def main():
+        await limit.hit("1.2.3.4")
+        await limit.hit("1.2.3.4")
+        with pytest.raises(HTTPException) as error:
+            await limit.hit("1.2.3.4")
+        assert error.value.status_code == 429
+        assert error.value.headers["Retry-After"] == "30"
+        await limit.hit("5.6.7.8")
+
+    before = rate_limited.value("test_limit")
+    asyncio.run(main())
+    assert (limit.allowed, limit.rejected) == (3, 1)
+    assert rate_limited.value("test_limit") == before + 1
+
+def test_rate_limit_allows_requests_when_backend_fails(monkeypatch):
+    class BrokenBackend(MemoryRateLimitBackend):
+        async def take(self, key, rate, burst, cost=1.0):
+            raise ConnectionError("backend down")
+
+    monkeypatch.setattr(ratelimit, "_backend", BrokenBackend(max_keys=10))
+    limit = RateLimit("test_broken", "1/minute")
+
+    async def main():
+        for _ in range(3):
+            await limit.hit("1.2.3.4")
+
+    asyncio.run(main())
+
+def test_login_attempts_are_limited_per_email(run_app):
+    async def test(client, app):
+        await register_team(client)
+        credentials = {"email": "alpha@example.com", "password": "wrong-password"}
+        statuses = [
+            (await client.post("/api/teams/login", json=credentials)).status_code
+            for _ in range(6)
+        ]
+        assert statuses == [401] * 5 + [429]
+        response = await client.post("/api/teams/login", json=credentials)
+        assert int(response.headers["Retry-After"]) >= 1
+
+    run_app(test)
+
+def test_contact_limit_counts_only_existing_teams(run_app):
+    async def test(client, app):
+        team = await register_team(client)
+        message = {
+            "from_name": "Visitor", "from_email": "visitor@example.com",
+            "subject": "Hello", "message": "Could we visit your workshop?",
+        }
+        response = await client.post("/api/teams/unknown/contact", json=message)
+        assert response.status_code == 404
+        assert (contact_team_limit.allowed, contact_team_limit.rejected) == (0, 0)
+
+        response = await client.post(f"/api/teams/{team['id']}/contact", json=message)
+        assert response.status_code == 200
+        assert contact_team_limit.allowed == 1
+
+    contact_team_limit.allowed = contact_team_limit.rejected = 0
+    run_app(test)
+
+def _shedding_client(controller: AdmissionController) -> httpx.AsyncClient:
+    async def ok(request):
+        return PlainTextResponse("ok")
+
+    async def download(request):
+        async def body():
+            assert controller.in_flight == 1
+            yield b"a"
+            # No longer counted once the body is streaming
+            for piece in (b"b", b"c"):
+                assert controller.in_flight == 0
+                yield piece
+        return StreamingResponse(body())
+
+    app = Starlette(routes=[
+        Route("/api/courses", ok, methods=["GET", "POST"]),
+        Route("/api/download", download),
+        Route("/healthz", ok),
+    ])
+    app = AdmissionControlMiddleware(app, controller)
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+def test_admission_control_sheds_writes_before_reads():
+    controller = AdmissionController(max_in_flight=10, max_loop_lag_ms=200, low_priority_share=0.5)
+
+    async def main():
+        async with _shedding_client(controller) as client:
+            assert (await client.post("/api/courses")).status_code == 200
+            assert controller.in_flight == 0
+
+            # Past the low priority share of the limit: writes go first
+            controller.in_flight = 5
+            assert (await client.get("/api/courses")).status_code == 200
+            response = await client.post("/api/courses")
+            assert response.status_code == 503
+            assert response.headers["Retry-After"] == "1"
+
+            # At the limit everything but probes is shed
+            controller.in_flight = 10
+            assert (await client.get("/api/courses")).status_code == 503
+            assert (await client.get("/healthz")).status_code == 200
+            assert controller.shed == {"in_flight": 2, "loop_lag": 0}
+
+    asyncio.run(main())
+
+def test_streaming_responses_leave_the_in_flight_count():
+    controller = AdmissionController(max_in_flight=10, max_loop_lag_ms=200, low_priority_share=0.5)
+
+    async def main():
+        async with _shedding_client(controller) as client:
+            response = await client.get("/api/download")
+            assert response.status_code == 200
+            assert response.content == b"abc"
+            assert controller.in_flight == 0
+
+    asyncio.run(main())
+
+def test_admission_control_sheds_on_loop_lag():
+    controller = AdmissionController(max_in_flight=0, max_loop_lag_ms=100, low_priority_share=0.5)
+    assert controller.reject_reason(low_priority=True) is None
+
+    controller.loop_lag = 0.15
+    assert controller.reject_reason(low_priority=True) == "loop_lag"
+    assert controller.reject_reason(low_priority=False) is None
+    controller.loop_lag = 0.4
+    assert controller.reject_reason(low_priority=False) == "loop_lag"
+    assert controller.retry_after() == 1
+
+    controller.loop_lag = 2.2
+    assert controller.retry_after() == 5
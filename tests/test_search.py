@@ -0,0 +1,104 @@
+from datetime import datetime
+
+from search import SearchIndex, catalog_search, normalize, tokenize
+
+def _course(id, title, description="An introduction for new team members.", category="Kodlama",
+            level="Başlangıç", day=1):
+    return {
+        "id": id, "title": title, "description": description, "category": category,
+        "level": level, "duration": "2 saat", "image_url": "https://example.com/c.png",
+        "created_at": datetime(2024, 1, day), "updated_at": datetime(2024, 1, day),
+    }
+
+def _material(id, title, tags=(), day=1):
+    return {
+        "id": id, "title": title, "description": "Shared by a team", "material_type": "code",
+        "tags": list(tags), "team_id": "team-1", "file_name": "f.py", "file_size": 10,
+        "mime_type": "text/x-python", "is_public": True,
+        "created_at": datetime(2024, 1, day), "updated_at": datetime(2024, 1, day),
+    }
+
+def _index() -> SearchIndex:
+    index = SearchIndex()
+    index.add("course", _course("swerve", "Swerve drive programming", day=1))
+    index.add("course", _course("pid", "PID tuning", "Tuning a swerve module with PID loops.", day=2))
+    index.add("course", _course("motors", "Motor wiring", category="Elektronik", level="Orta", day=3))
+    index.add("course", _course("muzik", "Müzik ve robotlar", day=4))
+    index.add("material", _material("auto", "Autonomous routines", tags=["Java", "Vision"], day=5))
+    return index
+
+def test_turkish_text_is_folded():
+    assert normalize("MÜZİK") == normalize("müzik") == "muzik"
+    assert normalize("IŞIK") == "isik"
+    # Stop words are dropped
+    assert tokenize("Robotlar ve Müzik") == ["robotlar", "muzik"]
+
+def test_title_matches_rank_above_description_matches():
+    results, facets, total, _ = _index().search("swerve", {})
+    assert [result["id"] for result in results] == ["swerve", "pid"]
+    assert results[0]["score"] > results[1]["score"]
+    assert total == 2
+    assert facets["kind"] == {"course": 2}
+
+def test_every_word_must_match_and_the_last_may_be_a_prefix():
+    index = _index()
+    assert [r["id"] for r in index.search("swerve prog", {})[0]] == ["swerve"]
+    assert index.search("swerve prog", {}, prefix=False)[0] == []
+    assert [r["id"] for r in index.search("MUZ", {})[0]] == ["muzik"]
+    assert index.search("swerve elephant", {})[0] == []
+
+def test_filters_tags_and_facets():
+    index = _index()
+    results, facets, total, _ = index.search("", {"category": "Elektronik"})
+    assert [r["id"] for r in results] == ["motors"]
+    results, _, _, _ = index.search("", {"kind": "material"}, tags=["JAVA"])
+    assert [r["id"] for r in results] == ["auto"]
+    _, facets, total, _ = index.search("", {})
+    assert total == 5
+    assert facets["kind"] == {"course": 4, "material": 1}
+    assert facets["level"] == {"Başlangıç": 3, "Orta": 1}
+
+def test_browsing_pages_newest_first_without_repeats():
+    index = _index()
+    seen, after = [], None
+    while True:
+        results, _, _, after = index.search("", {}, limit=2, after=after)
+        seen += [r["id"] for r in results]
+        if after is None:
+            break
+    assert seen == ["auto", "muzik", "motors", "pid", "swerve"]
+
+def test_removed_documents_stop_matching():
+    index = _index()
+    assert index.remove("course:swerve")
+    assert [r["id"] for r in index.search("swerve", {})[0]] == ["pid"]
+    assert not index.remove("course:swerve")
+    assert len(index) == 4
+
+def test_search_endpoint_pages_ranked_results(run_app):
+    async def test(client, app):
+        await app.state.db.courses.insert_many([
+            _course(f"robot-{i}", f"Robot {'robot ' * (i % 3)}basics {i}", day=1 + i) for i in range(7)
+        ])
+        await catalog_search.rebuild()
+
+        seen, scores, cursor = [], [], None
+        while True:
+            params = {"q": "robot", "limit": 3, **({"cursor": cursor} if cursor else {})}
+            response = await client.get("/api/search", params=params)
+            assert response.status_code == 200
+            body = response.json()
+            assert body["total"] == 7
+            seen += [result["id"] for result in body["results"]]
+            scores += [result["score"] for result in body["results"]]
+            cursor = response.headers.get("X-Next-Cursor")
+            if cursor is None:
+                break
+
+        assert sorted(seen) == sorted(f"robot-{i}" for i in range(7))
+        assert scores == sorted(scores, reverse=True)
+
+        response = await client.get("/api/search", params={"q": "robot", "cursor": "%%%"})
+        assert response.status_code == 400
+
+    run_app(test)
@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+from pymongo.errors import AutoReconnect
+
+from status_writer import StatusBufferFull, StatusWriter
+
+def _writer(flush_size=3, flush_seconds=60.0, max_buffer=100) -> StatusWriter:
+    writer = StatusWriter(flush_size, flush_seconds, max_buffer)
+    writer.bind(AsyncMongoMockClient()["status_test"])
+    return writer
+
+def test_concurrent_check_ins_are_written_together():
+    async def main():
+        writer = _writer(flush_size=3)
+        writer.start()
+        try:
+            # A full batch is written at once, well before the 60s timer
+            await asyncio.wait_for(
+                asyncio.gather(*(writer.write({"client_name": f"c{i}"}) for i in range(6))), 5
+            )
+        finally:
+            await writer.stop()
+        assert (writer.written, writer.flushes) == (6, 1)
+        assert await writer.collection.count_documents({}) == 6
+
+    asyncio.run(main())
+
+def test_a_partial_batch_is_flushed_after_the_timeout():
+    async def main():
+        writer = _writer(flush_size=100, flush_seconds=0.05)
+        writer.start()
+        try:
+            await asyncio.wait_for(writer.write({"client_name": "lonely"}), 5)
+            assert (writer.written, writer.flushes) == (1, 1)
+        finally:
+            await writer.stop()
+
+    asyncio.run(main())
+
+def test_stop_writes_what_is_still_buffered():
+    async def main():
+        writer = _writer(flush_size=100)
+        writer.start()
+        pending = asyncio.ensure_future(writer.write({"client_name": "late"}))
+        await asyncio.sleep(0)
+        assert writer.stats()["buffered"] == 1
+        await writer.stop()
+        await pending
+        assert await writer.collection.count_documents({}) == 1
+
+    asyncio.run(main())
+
+def test_a_failed_batch_fails_every_caller_in_it():
+    async def main():
+        writer = _writer(flush_size=2)
+
+        async def insert_many(docs, ordered=True):
+            raise AutoReconnect("primary stepped down")
+        writer.collection.insert_many = insert_many
+        writer.start()
+        try:
+            results = await asyncio.gather(
+                writer.write({"client_name": "a"}), writer.write({"client_name": "b"}),
+                return_exceptions=True
+            )
+        finally:
+            await writer.stop()
+        assert all(isinstance(result, AutoReconnect) for result in results)
+        assert (writer.failed, writer.written) == (2, 0)
+
+    asyncio.run(main())
+
+def test_check_ins_beyond_the_buffer_are_rejected():
+    async def main():
+        writer = _writer(flush_size=100, max_buffer=2)
+        writer.start()
+        pending = [asyncio.ensure_future(writer.write({"client_name": "a"})) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(StatusBufferFull):
+            await writer.write({"client_name": "b"})
+        await writer.stop()
+        await asyncio.gather(*pending)
+        assert (writer.rejected, writer.written) == (1, 2)
+
+    asyncio.run(main())
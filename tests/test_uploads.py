@@ -0,0 +1,76 @@
+import os
+
+from tests.conftest import BLOB_DIR, register_team
+
+BOUNDARY = "testboundary"
+
+def _stored_files() -> set:
+    return {path for _, _, files in os.walk(BLOB_DIR) for path in files}
+
+FILE_PART = (
+    f"--{BOUNDARY}\r\n"
+    'Content-Disposition: form-data; name="file"; filename="robot.txt"\r\n'
+    "Content-Type: text/plain\r\n\r\n"
+).encode() + b"x" * 4096
+
+def _upload(client, headers, body):
+    async def chunks():
+        # Separate chunks, so the file part is being written when the
+        # broken part arrives
+        for part in body:
+            yield part
+    return client.post(
+        "/api/teams/materials/upload",
+        headers={**headers, "Content-Type": f"multipart/form-data; boundary={BOUNDARY}"},
+        content=chunks()
+    )
+
+def test_multipart_upload_stores_file(run_app):
+    async def test(client, app):
+        team = await register_team(client)
+        fields = "".join(
+            f'\r\n--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}'
+            for name, value in (("title", "Robot"), ("material_type", "code"), ("mime_type", "text/plain"))
+        ).encode()
+        closing = f"\r\n--{BOUNDARY}--\r\n".encode()
+        response = await _upload(client, team["headers"], [FILE_PART, fields, closing])
+        assert response.status_code == 200, response.text
+        assert response.json()["file_size"] == 4096
+
+    run_app(test)
+
+def test_malformed_part_header_is_rejected_and_blob_discarded(run_app):
+    async def test(client, app):
+        team = await register_team(client)
+        before = _stored_files()
+        broken = (
+            f"\r\n--{BOUNDARY}\r\n"
+            'Content-Disposition: form-data; name="title"\r\nBad\rHeader: x\r\n\r\nRobot'
+        ).encode()
+        response = await _upload(client, team["headers"], [FILE_PART, broken])
+        assert response.status_code == 400
+        assert "Malformed multipart body" in response.json()["detail"]
+        assert _stored_files() == before
+
+    run_app(test)
+
+def test_body_without_boundary_is_rejected(run_app):
+    async def test(client, app):
+        team = await register_team(client)
+        response = await _upload(client, team["headers"], [b"this is not multipart at all"])
+        assert response.status_code == 400
+        assert "Malformed multipart body" in response.json()["detail"]
+
+    run_app(test)
+
+def test_missing_boundary_parameter_is_rejected(run_app):
+    async def test(client, app):
+        team = await register_team(client)
+        response = await client.post(
+            "/api/teams/materials/upload",
+            headers={**team["headers"], "Content-Type": "multipart/form-data"},
+            content=b"--x--"
+        )
+        assert response.status_code == 400
+
+    run_app(test)